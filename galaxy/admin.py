@@ -10,9 +10,15 @@ from .models import (
     Market,
     TradeGood,
     MarketTradeGood,
+    MarketTradeGoodHistory,
     Shipyard,
+    ShipSpec,
     ShipyardShip,
     Transaction,
+    CrawlJob,
+    Epoch,
+    Survey,
+    Extraction,
 )
 
 
@@ -59,8 +65,7 @@ class WaypointAdmin(ReadOnlyModelAdmin):
 
         def queryset(self, request, queryset):
             if self.value():
-                trait = WaypointTrait.objects.get(symbol=self.value())
-                return queryset.filter(traits__in=[trait])
+                return queryset.with_trait(self.value())
 
     list_display = ("symbol", "type", "system", "coords", "orbits", "faction", "modified")
     list_filter = ("type", "system", "faction", WaypointTraitFilter)
@@ -133,6 +138,15 @@ class MarketTradeGoodAdmin(ReadOnlyModelAdmin):
     search_fields = ("market__waypoint__symbol", "trade_good__name")
 
 
+@register(MarketTradeGoodHistory)
+class MarketTradeGoodHistoryAdmin(ReadOnlyModelAdmin):
+    date_hierarchy = "observed"
+    list_display = ("observed", "market", "trade_good", "type", "supply", "activity", "purchase_price", "sell_price", "trade_volume")
+    list_filter = ("type", "supply", "activity")
+    fields = [field.name for field in MarketTradeGoodHistory._meta.concrete_fields]
+    search_fields = ("market__waypoint__symbol", "trade_good__name")
+
+
 @register(Shipyard)
 class ShipyardAdmin(ReadOnlyModelAdmin):
     list_display = ("waypoint", "ships_display", "modifications_fee")
@@ -141,10 +155,18 @@ class ShipyardAdmin(ReadOnlyModelAdmin):
 
 @register(ShipyardShip)
 class ShipyardShipAdmin(ReadOnlyModelAdmin):
-    list_display = ("shipyard", "type", "name", "purchase_price")
+    list_display = ("shipyard", "type", "spec", "supply", "purchase_price")
+    list_select_related = ("shipyard__waypoint", "spec")
     fields = [field.name for field in ShipyardShip._meta.concrete_fields]
 
 
+@register(ShipSpec)
+class ShipSpecAdmin(ReadOnlyModelAdmin):
+    list_display = ("name", "type", "hash")
+    list_filter = ("type",)
+    fields = [field.name for field in ShipSpec._meta.concrete_fields] + ["mounts_display", "modules_display"]
+
+
 @register(Transaction)
 class TransactionAdmin(ReadOnlyModelAdmin):
 
@@ -167,3 +189,33 @@ class TransactionAdmin(ReadOnlyModelAdmin):
     list_display = ("market", "ship_symbol", "trade_good", "type", "units", "total_price", "timestamp")
     list_filter = (FuelFilter, "type", "ship_symbol")
     fields = [field.name for field in Transaction._meta.concrete_fields]
+
+
+@register(Survey)
+class SurveyAdmin(ReadOnlyModelAdmin):
+    list_display = ("signature", "waypoint", "size", "expiration")
+    list_filter = ("size",)
+    fields = [field.name for field in Survey._meta.concrete_fields]
+    search_fields = ("waypoint__symbol", "deposits")
+
+
+@register(Extraction)
+class ExtractionAdmin(ReadOnlyModelAdmin):
+    date_hierarchy = "timestamp"
+    list_display = ("timestamp", "ship_symbol", "waypoint", "trade_symbol", "units", "survey_signature")
+    list_filter = ("trade_symbol",)
+    fields = [field.name for field in Extraction._meta.concrete_fields]
+    search_fields = ("ship_symbol", "waypoint__symbol")
+
+
+@register(CrawlJob)
+class CrawlJobAdmin(ReadOnlyModelAdmin):
+    list_display = ("kind", "scope", "created", "completed", "failed", "finished")
+    list_filter = ("kind",)
+    fields = [field.name for field in CrawlJob._meta.concrete_fields]
+
+
+@register(Epoch)
+class EpochAdmin(ReadOnlyModelAdmin):
+    list_display = ("reset_date", "next_reset", "bootstrapped", "archive_schema")
+    fields = [field.name for field in Epoch._meta.concrete_fields]
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class GalaxyConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "galaxy"
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,231 @@
+"""Planning and execution of contracts.
+
+`plan_contract` plans how a ship would fulfil a contract: for each good to deliver, the cheapest
+source in the destination's system (a market selling the good, or a deposit yielding it if the ship
+can mine), and the haul legs between source and destination. The plan estimates the cost (at the
+predicted, impact-adjusted market prices) and duration, and so whether the contract is profitable
+and can be delivered before its deadline.
+
+`contract_step` is run by the CONTRACT ship behaviour (`Ship.behaviour_contract`): each call carries
+out the next step of the agent's active contract (negotiating and accepting a new contract when
+there is none), and returns the time at which the following step should run.
+"""
+from datetime import datetime, timedelta, timezone
+import logging
+from math import ceil, dist
+
+from django.conf import settings
+from django.db.models import Q
+
+from .extraction import EXTRACT_COOLDOWN, EXTRACT_UNITS, EXTRACTION_YIELDS
+from .models import Contract, MarketTradeGood, Waypoint, navigate_time
+from .pricing import get_price_impact_model, predict_price
+
+LOGGER = logging.getLogger("spacetraders")
+# Seconds spent docking, trading and delivering at each stop.
+STOP_OVERHEAD = 30
+
+
+def can_mine(ship):
+    return ship.mounts.filter(symbol__startswith="MOUNT_MINING_LASER").exists()
+
+
+def get_sources(trade_symbol: str, system_id: int, units: int, mining: bool = False):
+    """Returns a list of sources of the trade good in the nominated system, as dicts of the source
+    kind (MARKET or DEPOSIT), waypoint symbol and coordinates, and predicted mean unit price for
+    the nominated number of units. Deposits are included if `mining` is True.
+    """
+    sources = []
+    model = get_price_impact_model()
+    for mtg in MarketTradeGood.objects.filter(
+        market__waypoint__system_id=system_id, trade_good__symbol=trade_symbol, type__in=["EXPORT", "EXCHANGE"]
+    ).select_related("market__waypoint"):
+        price = predict_price(mtg.purchase_price, units / 2, mtg.trade_volume, model.estimate_for(mtg, purchase=True), purchase=True)
+        waypoint = mtg.market.waypoint
+        sources.append({"kind": "MARKET", "waypoint": waypoint.symbol, "coords": waypoint.coords, "price": price})
+
+    if mining:
+        deposits = [trait for trait, resources in EXTRACTION_YIELDS.items() if trade_symbol in resources]
+        for waypoint in Waypoint.objects.filter(system_id=system_id, trait_symbols__overlap=deposits):
+            sources.append({"kind": "DEPOSIT", "waypoint": waypoint.symbol, "coords": waypoint.coords, "price": 0})
+    return sources
+
+
+def extraction_time(trade_symbol: str, units: int):
+    """Returns the expected time (seconds) to extract the nominated units of a resource, given the
+    approximate deposit yields (see `galaxy.extraction`).
+    """
+    resources = min((len(r) for r in EXTRACTION_YIELDS.values() if trade_symbol in r), default=1)
+    per_extraction = sum(EXTRACT_UNITS) / 2 / resources
+    return ceil(units / per_extraction) * EXTRACT_COOLDOWN
+
+
+def plan_contract(contract, ship):
+    """Plan the fulfilment of a contract by the ship. Returns the plan as a dict of the source of
+    each good, the haul legs, and the estimated cost, payment, profit and duration, and whether it
+    is feasible before the contract's deadlines. Returns None if a good has no known source, or
+    the ship has no cargo capacity.
+    """
+    if not ship.cargo_capacity:
+        return None
+    now = datetime.now(timezone.utc)
+    speed = ship.engine["speed"]
+    capacity = ship.cargo_capacity
+    mining = can_mine(ship)
+    position = ship.nav.waypoint.coords
+
+    def travel(a, b):
+        return (navigate_time(dist(a, b), "CRUISE", speed) or 0) + STOP_OVERHEAD
+
+    sources, legs, cost, duration = {}, [], 0, 0
+    for good in contract.get_remaining_goods():
+        remaining = good.units_required - good.units_fulfilled
+        destination = good.destination.coords
+        trips = ceil(remaining / capacity)
+        options = []
+        for source in get_sources(good.symbol, good.destination.system_id, remaining, mining):
+            # The first trip starts from the ship's position, and the rest from the destination.
+            time = travel(position, source["coords"]) + travel(source["coords"], destination)
+            time += (trips - 1) * (travel(destination, source["coords"]) + travel(source["coords"], destination))
+            if source["kind"] == "DEPOSIT":
+                time += extraction_time(good.symbol, remaining)
+            options.append((source["price"] * remaining, time, source))
+        if not options:
+            LOGGER.warning(f"No known source of {good.symbol} for contract {contract}")
+            return None
+
+        source_cost, time, source = min(options, key=lambda option: (option[0], option[1]))
+        sources[good.symbol] = {"kind": source["kind"], "waypoint": source["waypoint"]}
+        cost += source_cost
+        duration += time
+        for trip in range(trips):
+            units = min(capacity, remaining - trip * capacity)
+            action = "PURCHASE" if source["kind"] == "MARKET" else "EXTRACT"
+            legs.append({"action": action, "waypoint": source["waypoint"], "trade_good": good.symbol, "units": units})
+            legs.append({"action": "DELIVER", "waypoint": good.destination.symbol, "trade_good": good.symbol, "units": units})
+        position = destination
+
+    payment = contract.terms_payment.get("onFulfilled", 0)
+    if not contract.accepted:
+        payment += contract.terms_payment.get("onAccepted", 0)
+    feasible = now + timedelta(seconds=duration) <= contract.terms_deadline and (contract.accepted or now <= contract.deadline_to_accept)
+    return {
+        "ship": ship.symbol,
+        "sources": sources,
+        "legs": legs,
+        "cost": round(cost),
+        "payment": payment,
+        "profit": round(payment - cost),
+        "duration": round(duration),
+        "feasible": feasible,
+        "planned": now.isoformat(),
+    }
+
+
+def get_active_contract(agent):
+    """Returns the agent's accepted and unfulfilled contract, or else an open contract offer which
+    hasn't been declined, or None.
+    """
+    now = datetime.now(timezone.utc)
+    contracts = Contract.objects.filter(agent=agent, fulfilled=False).exclude(plan__declined=True)
+    contracts = contracts.filter(Q(accepted=True, terms_deadline__gt=now) | Q(accepted=False, deadline_to_accept__gt=now))
+    return contracts.order_by("-accepted", "deadline_to_accept").first()
+
+
+def negotiate_contract(ship, client):
+    """Negotiate a new contract, using the ship. Returns the new Contract, or None."""
+    if not ship.is_docked:
+        ship.dock(client)
+    data = client.negotiate_contract(ship.symbol)
+    if "error" in data:
+        LOGGER.error(data["error"]["message"])
+        return None
+    contract, created = Contract.from_data(ship.agent, data["contract"])
+    if not contract:
+        return None
+    LOGGER.info(f"{ship} negotiated contract {contract}")
+    return contract
+
+
+def ship_navigate(ship, client, waypoint_symbol: str, retry: datetime):
+    """Navigate the ship (refuelling first, at a market), and return its arrival time, or `retry`
+    if navigation fails.
+    """
+    if ship.nav.waypoint.is_market:
+        ship.refuel(client)
+    if not ship.navigate(client, waypoint_symbol):
+        return retry
+    return ship.nav.get_arrival()
+
+
+def contract_step(ship, client):
+    """Carry out the next step of the agent's active contract with the ship. Returns the datetime
+    at which to run the following step.
+    """
+    now = datetime.now(timezone.utc)
+    retry = now + timedelta(seconds=settings.CONTRACT_RETRY_INTERVAL)
+
+    contract = get_active_contract(ship.agent) or negotiate_contract(ship, client)
+    if not contract:
+        return retry
+
+    if not contract.accepted:
+        plan = plan_contract(contract, ship)
+        if not plan or not plan["feasible"] or plan["profit"] < settings.CONTRACT_MIN_PROFIT:
+            reason = f"expected profit {plan['profit']}, feasible {plan['feasible']}" if plan else "no plan"
+            LOGGER.warning(f"Declining contract {contract} ({reason})")
+            contract.plan = dict(plan or {}, declined=True)
+            contract.save()
+            # Back off before negotiating another contract.
+            return retry
+        contract.plan = plan
+        contract.save()
+        if not contract.accept(client):
+            return retry
+        LOGGER.info(f"Accepted contract {contract}: expected profit {plan['profit']} in {plan['duration']} seconds")
+        return now
+
+    remaining = contract.get_remaining_goods()
+    if not remaining:
+        contract.fulfill(client)
+        return now
+
+    if not contract.plan or not contract.plan.get("sources"):
+        contract.plan = plan_contract(contract, ship)
+        contract.save()
+        if not contract.plan:
+            return retry
+
+    good = remaining[0]
+    units = good.units_required - good.units_fulfilled
+    source = contract.plan["sources"].get(good.symbol)
+    held = ship.cargo.filter(type__symbol=good.symbol).first()
+    held_units = held.units if held else 0
+    keep = [g.symbol for g in remaining]
+    waypoint = ship.nav.waypoint.symbol
+
+    # Deliver the cargo once the ship holds enough, its hold is full, or (from a market) after purchasing.
+    if held_units and (held_units >= units or not ship.get_available_capacity() or not source or source["kind"] == "MARKET"):
+        if waypoint != good.destination.symbol:
+            return ship_navigate(ship, client, good.destination.symbol, retry)
+        result = contract.deliver(client, ship, good.symbol, min(held_units, units))
+        return now if result else retry
+
+    if not source:
+        return retry
+    if waypoint != source["waypoint"]:
+        return ship_navigate(ship, client, source["waypoint"], retry)
+
+    if source["kind"] == "MARKET":
+        # Make room by selling any cargo which isn't needed for the contract.
+        for item in ship.cargo.exclude(type__symbol__in=keep):
+            item.sell(client)
+        ship.refresh_from_db(fields=["cargo_units"])
+        result = ship.purchase_cargo(client, good.symbol, min(units - held_units, ship.get_available_capacity()))
+        return now if result else retry
+
+    # Extract at the deposit, discarding any other resources.
+    ship.extract(client)
+    for item in ship.cargo.exclude(type__symbol__in=keep):
+        item.jettison(client)
+    return ship.get_cooldown() or now
@@ -0,0 +1,206 @@
+"""Concurrent, resumable crawls of API resources.
+
+API requests are made from a pool of worker threads, all paced by the client's shared rate limiter,
+while the calling thread writes each response to the database as it arrives. Progress is
+checkpointed in a `CrawlJob`, so that an interrupted crawl resumes without refetching completed work.
+
+- `crawl` updates the markets or shipyards of a system (or the whole galaxy).
+- `crawl_systems` records every system in the galaxy from the paginated system list, then populates
+  the waypoints of each system.
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from humanize import naturaldelta
+import logging
+from math import ceil
+import time
+
+from django.conf import settings
+from requests.exceptions import RequestException
+
+from .models import CrawlJob, Market, Shipyard, System, Waypoint
+from .spatial import invalidate_index
+from .tiles import clear_tiles
+
+LOGGER = logging.getLogger("spacetraders")
+# Number of items written between each checkpoint.
+CHECKPOINT_INTERVAL = 10
+# Number of systems per page of the system list (the API maximum).
+PAGE_LIMIT = 20
+
+CRAWLS = {
+    # kind: (waypoint trait, client method name, model)
+    "MARKET": ("MARKETPLACE", "get_market", Market),
+    "SHIPYARD": ("SHIPYARD", "get_shipyard", Shipyard),
+}
+
+
+class Progress:
+    """Reports the progress, rate and estimated time remaining of a crawl."""
+
+    def __init__(self, description: str, total: int, done: int = 0):
+        self.description = description
+        self.total = total
+        self.initial = done
+        self.start = time.monotonic()
+
+    def report(self, done: int):
+        elapsed = time.monotonic() - self.start
+        rate = (done - self.initial) / elapsed if elapsed else 0
+        percent = done / self.total if self.total else 1
+        msg = f"{self.description}: {done}/{self.total} ({percent:.0%})"
+        if rate:
+            msg += f", {rate:.1f}/s, ETA {naturaldelta((self.total - done) / rate)}"
+        LOGGER.info(msg)
+        return msg
+
+
+def get_crawl_job(kind: str, system_symbol: str = None):
+    """Returns the unfinished crawl job of the nominated kind and scope, or a new one."""
+    scope = system_symbol or ""
+    job = CrawlJob.objects.filter(kind=kind, scope=scope, finished__isnull=True).first()
+    if job:
+        LOGGER.info(f"Resuming {job}")
+        job.failed = 0
+        return job
+
+    if kind == "SYSTEM":  # Pending systems are added as the system list is crawled.
+        return CrawlJob.objects.create(kind=kind, scope=scope)
+
+    trait = CRAWLS[kind][0]
+    waypoints = Waypoint.objects.with_trait(trait)
+    if system_symbol:
+        waypoints = waypoints.filter(system__symbol=system_symbol)
+    return CrawlJob.objects.create(kind=kind, scope=scope, pending=list(waypoints.values_list("symbol", flat=True)))
+
+
+def checkpoint(job, pending: set):
+    job.pending = sorted(pending)
+    job.save()
+
+
+def crawl_pending(job, executor, fetch, save, description: str):
+    """Fetch each of the job's pending symbols concurrently, and save each response as it arrives.
+    Symbols which fail to fetch remain pending.
+    """
+    pending = set(job.pending)
+    progress = Progress(description, job.completed + len(pending), job.completed)
+    futures = {executor.submit(fetch, symbol): symbol for symbol in job.pending}
+    try:
+        for count, future in enumerate(as_completed(futures), start=1):
+            symbol = futures[future]
+            try:
+                data = future.result()
+            except RequestException as e:
+                LOGGER.warning(f"Unable to fetch {symbol}: {e}")
+                job.failed += 1
+            else:
+                save(symbol, data)
+                pending.discard(symbol)
+                job.completed += 1
+
+            if count % CHECKPOINT_INTERVAL == 0:
+                checkpoint(job, pending)
+                progress.report(job.completed)
+    finally:
+        # If interrupted, abandon any queued requests and record progress so far.
+        for future in futures:
+            future.cancel()
+        checkpoint(job, pending)
+
+
+def finish(job):
+    if job.failed:
+        # Leave the job unfinished, to retry the failed items on resumption.
+        LOGGER.warning(f"{job}: {job.failed} failed")
+    else:
+        job.finished = datetime.now(timezone.utc)
+        job.save()
+        LOGGER.info(f"Finished {job}")
+    return job
+
+
+def crawl(client, kind: str, system_symbol: str = None, workers: int = None):
+    """Fetch and update every market or shipyard (`kind` is MARKET or SHIPYARD) in the nominated
+    system, or in the galaxy. Returns the CrawlJob.
+    """
+    trait, method, model = CRAWLS[kind]
+    job = get_crawl_job(kind, system_symbol)
+    waypoints = Waypoint.objects.in_bulk(job.pending, field_name="symbol")
+
+    def save(symbol, data):
+        obj, created = model.objects.get_or_create(waypoint=waypoints[symbol])
+        obj.update(data)
+
+    with ThreadPoolExecutor(max_workers=workers or settings.CRAWL_WORKERS) as executor:
+        crawl_pending(job, executor, getattr(client, method), save, job.get_kind_display())
+    return finish(job)
+
+
+def save_systems(systems_data: list):
+    """Record the passed-in list of system data (from the system list), and return the symbols of
+    those systems having waypoints which are not yet populated.
+    """
+    System.objects.bulk_create(
+        [System(symbol=data["symbol"], sector=data["sectorSymbol"], type=data["type"], x=data["x"], y=data["y"]) for data in systems_data],
+        ignore_conflicts=True,
+    )
+    symbols = [data["symbol"] for data in systems_data if data["waypoints"]]
+    populated = set(Waypoint.objects.filter(system__symbol__in=symbols).values_list("system__symbol", flat=True).distinct())
+    return [symbol for symbol in symbols if symbol not in populated]
+
+
+def crawl_systems(client, workers: int = None, waypoints: bool = True):
+    """Record every system in the galaxy, then (if `waypoints` is True) populate the waypoints of
+    each system. Pages of the system list are fetched in parallel batches; the job records the
+    number of pages completed and the systems remaining to be populated. Returns the CrawlJob.
+    """
+    from .utils import save_waypoints
+
+    job = get_crawl_job("SYSTEM")
+    workers = workers or settings.CRAWL_WORKERS
+    pending = set(job.pending)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Stage 1: the system list.
+        listed = job.page < ceil(job.total / PAGE_LIMIT) or not job.total
+        if not job.total:
+            response = client.list_systems_page(1, PAGE_LIMIT)
+            pending.update(save_systems(response["data"]))
+            job.page, job.total = 1, response["meta"]["total"]
+            checkpoint(job, pending)
+
+        pages = ceil(job.total / PAGE_LIMIT)
+        if job.page < pages:
+            progress = Progress("System list pages", pages, job.page)
+            while job.page < pages:
+                batch = range(job.page + 1, min(pages, job.page + workers) + 1)
+                try:
+                    # Results are yielded in page order as they arrive, so writes overlap the remaining requests.
+                    for response in executor.map(lambda page: client.list_systems_page(page, PAGE_LIMIT), batch):
+                        pending.update(save_systems(response["data"]))
+                        job.page += 1
+                finally:
+                    checkpoint(job, pending)
+                progress.report(job.page)
+
+        if listed:
+            # Systems were bulk-created without signals: refresh the galaxy map tiles and spatial index.
+            clear_tiles()
+            invalidate_index()
+
+        # Stage 2: the waypoints of each system.
+        if waypoints:
+            systems = {}
+
+            def save(symbol, data):
+                if symbol not in systems:
+                    systems[symbol] = System.objects.get(symbol=symbol)
+                save_waypoints(systems[symbol], data)
+
+            crawl_pending(job, executor, client.list_waypoints, save, "System waypoints")
+        elif job.pending:
+            # Leave the job unfinished, so that a later crawl resumes with the waypoints.
+            return job
+
+    return finish(job)
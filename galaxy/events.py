@@ -0,0 +1,86 @@
+"""Live fleet updates, published over Redis pub/sub and streamed to browsers as Server-Sent Events.
+
+Model writes publish a small event (see `galaxy.signals`). Each ASGI worker process holds a single
+Redis subscription, which fans out each event to every open event stream in that process.
+"""
+import asyncio
+import json
+import logging
+
+from django.conf import settings
+import redis
+import redis.asyncio
+
+LOGGER = logging.getLogger("spacetraders")
+CHANNEL = "spacetraders:fleet"
+# Maximum number of unsent events buffered per open stream; further events are dropped for slow clients.
+STREAM_BUFFER = 256
+
+_connection = None
+
+
+def publish_event(agent_id: int, ship: str = None, **fields):
+    """Publish a change to the displayed fields of an agent, or one of its ships.
+    Events are best-effort: a Redis failure is logged and never interrupts the database write.
+    """
+    global _connection
+    if _connection is None:
+        _connection = redis.Redis.from_url(settings.EVENTS_URL)
+
+    event = json.dumps({"agent": agent_id, "ship": ship, "fields": fields})
+    try:
+        _connection.publish(CHANNEL, event)
+    except redis.RedisError as e:
+        LOGGER.warning(f"Unable to publish fleet event: {e}")
+
+
+class Broadcaster:
+    """Fan out events from one Redis subscription to any number of subscriber queues."""
+
+    def __init__(self):
+        self.queues = set()
+        self.task = None
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=STREAM_BUFFER)
+        self.queues.add(queue)
+        if not self.task or self.task.done():
+            self.task = asyncio.create_task(self.listen())
+        return queue
+
+    def unsubscribe(self, queue):
+        self.queues.discard(queue)
+
+    async def listen(self):
+        connection = redis.asyncio.Redis.from_url(settings.EVENTS_URL)
+        async with connection.pubsub() as pubsub:
+            await pubsub.subscribe(CHANNEL)
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                event = json.loads(message["data"])
+                for queue in list(self.queues):
+                    try:
+                        queue.put_nowait(event)
+                    except asyncio.QueueFull:
+                        pass
+
+
+BROADCASTER = Broadcaster()
+
+
+async def event_stream(agent_id: int, keepalive: int = 15):
+    """Async generator of Server-Sent Event messages for the nominated agent."""
+    queue = BROADCASTER.subscribe()
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if event["agent"] == agent_id:
+                yield f"data: {json.dumps(event)}\n\n"
+    finally:
+        BROADCASTER.unsubscribe(queue)
@@ -0,0 +1,12 @@
+"""Approximate model of resource extraction, used both to plan contracts and to simulate mining."""
+
+# Seconds of cooldown after each extraction, and the range of units yielded by an extraction.
+EXTRACT_COOLDOWN = 70
+EXTRACT_UNITS = (2, 10)
+# Resources extracted from each type of deposit (approximate).
+EXTRACTION_YIELDS = {
+    "COMMON_METAL_DEPOSITS": ["IRON_ORE", "COPPER_ORE", "ALUMINUM_ORE", "ICE_WATER", "SILICON_CRYSTALS", "QUARTZ_SAND"],
+    "PRECIOUS_METAL_DEPOSITS": ["SILVER_ORE", "GOLD_ORE", "PLATINUM_ORE", "ICE_WATER", "QUARTZ_SAND"],
+    "RARE_METAL_DEPOSITS": ["URANITE_ORE", "MERITIUM_ORE", "ICE_WATER"],
+    "MINERAL_DEPOSITS": ["SILICON_CRYSTALS", "QUARTZ_SAND", "AMMONIA_ICE", "ICE_WATER", "DIAMONDS"],
+}
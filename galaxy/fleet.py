@@ -0,0 +1,204 @@
+"""Fleet synchronisation.
+
+`sync_fleet` refreshes every ship of an agent from a single paginated `list_ships` call (one API
+request per 20 ships), writing ships, navs, modules, mounts and cargo in set-based batches. Ship
+behaviours then read the local snapshot (see `Ship.refresh`) instead of each calling `get_ship`.
+"""
+from datetime import datetime, timedelta, timezone
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django_rq.queues import get_queue
+
+from .events import publish_event
+from .models import Agent, CargoType, Ship, ShipCargoItem, ShipModule, ShipMount, ShipNav, System, Waypoint, save_changed
+from .signals import ship_event_fields
+
+LOGGER = logging.getLogger("spacetraders")
+
+SHIP_FIELDS = ["crew", "frame", "reactor", "engine", "cooldown", "fuel"]
+NAV_FIELDS = ["system_id", "waypoint_id", "route", "status", "flight_mode"]
+
+
+def sync_navs(ships_data: list):
+    """Bulk update the navs of the passed-in list of (ship, ship data). Returns the set of ship pks with changed navs."""
+    system_symbols = {data["nav"]["systemSymbol"] for ship, data in ships_data}
+    waypoint_symbols = {data["nav"]["waypointSymbol"] for ship, data in ships_data}
+    systems = dict(System.objects.filter(symbol__in=system_symbols).values_list("symbol", "pk"))
+    waypoints = dict(Waypoint.objects.filter(symbol__in=waypoint_symbols).values_list("symbol", "pk"))
+
+    now = datetime.now(timezone.utc)
+    changed = {}
+    for ship, data in ships_data:
+        nav = ship.nav
+        values = {
+            "system_id": systems[data["nav"]["systemSymbol"]],
+            "waypoint_id": waypoints[data["nav"]["waypointSymbol"]],
+            "route": data["nav"]["route"],
+            "status": data["nav"]["status"],
+            "flight_mode": data["nav"]["flightMode"],
+        }
+        if any(getattr(nav, name) != value for name, value in values.items()):
+            for name, value in values.items():
+                setattr(nav, name, value)
+            nav.modified = now
+            changed[ship.pk] = nav
+
+    if changed:
+        ShipNav.objects.bulk_update(changed.values(), NAV_FIELDS + ["modified"])
+    return set(changed)
+
+
+def sync_ships(ships_data: list):
+    """Bulk update the passed-in list of (ship, ship data), marking every ship as synced.
+    Returns the set of ship pks with changed fields.
+    """
+    now = datetime.now(timezone.utc)
+    changed = set()
+    for ship, data in ships_data:
+        values = {name: data[name] for name in SHIP_FIELDS}
+        values["cargo_capacity"] = data["cargo"]["capacity"]
+        values["cargo_units"] = data["cargo"]["units"]
+        if any(getattr(ship, name) != value for name, value in values.items()):
+            for name, value in values.items():
+                setattr(ship, name, value)
+            changed.add(ship.pk)
+        ship.modified = now
+        ship.synced = now
+
+    Ship.objects.bulk_update([ship for ship, data in ships_data], SHIP_FIELDS + ["cargo_capacity", "cargo_units", "modified", "synced"])
+    return changed
+
+
+def sync_equipment(ships_data: list, relation: str, model):
+    """Synchronise the modules or mounts (`relation`) of the passed-in list of (ship, ship data),
+    creating any unknown equipment and adding/removing only the differences.
+    """
+    items = {item["symbol"]: item for ship, data in ships_data for item in data[relation]}
+    if items:
+        model.objects.bulk_create([model.from_data(item) for item in items.values()], ignore_conflicts=True)
+    pks = dict(model.objects.filter(symbol__in=items).values_list("symbol", "pk"))
+
+    through = getattr(Ship, relation).through
+    column = f"{model._meta.model_name}_id"
+    current = {
+        (ship_id, item_id): pk
+        for pk, ship_id, item_id in through.objects.filter(ship__in=[ship for ship, data in ships_data]).values_list("pk", "ship_id", column)
+    }
+    desired = {(ship.pk, pks[item["symbol"]]) for ship, data in ships_data for item in data[relation]}
+
+    removed = [pk for key, pk in current.items() if key not in desired]
+    if removed:
+        through.objects.filter(pk__in=removed).delete()
+    added = desired - set(current)
+    if added:
+        through.objects.bulk_create([through(ship_id=ship_id, **{column: item_id}) for ship_id, item_id in added])
+
+
+def sync_cargo(ships_cargo: list):
+    """Synchronise the cargo of the passed-in list of (ship, cargo data): create any unknown cargo
+    types, upsert changed cargo items and delete any no longer held, in a fixed number of queries
+    (no more than six, however many ships and items).
+    Returns the set of ship pks with changed cargo.
+    """
+    goods = {good["symbol"]: good for ship, cargo in ships_cargo for good in cargo["inventory"]}
+    types = dict(CargoType.objects.filter(symbol__in=goods).values_list("symbol", "pk")) if goods else {}
+    unknown = [good for symbol, good in goods.items() if symbol not in types]
+    if unknown:
+        CargoType.objects.bulk_create(
+            [CargoType(symbol=good["symbol"], name=good["name"], description=good["description"]) for good in unknown],
+            ignore_conflicts=True,
+        )
+        types = dict(CargoType.objects.filter(symbol__in=goods).values_list("symbol", "pk"))
+
+    current = {
+        (ship_id, type_id): (pk, units)
+        for pk, ship_id, type_id, units in ShipCargoItem.objects.filter(ship__in=[ship for ship, cargo in ships_cargo]).values_list(
+            "pk", "ship_id", "type_id", "units"
+        )
+    }
+    desired = {(ship.pk, types[good["symbol"]]): good["units"] for ship, cargo in ships_cargo for good in cargo["inventory"]}
+
+    upserts = [(key, units) for key, units in desired.items() if key not in current or current[key][1] != units]
+    if upserts:
+        ShipCargoItem.objects.bulk_create(
+            [ShipCargoItem(ship_id=ship_id, type_id=type_id, units=units) for (ship_id, type_id), units in upserts],
+            update_conflicts=True,
+            unique_fields=["type", "ship"],
+            update_fields=["units"],
+        )
+    removed = {key: pk for key, (pk, units) in current.items() if key not in desired}
+    if removed:
+        ShipCargoItem.objects.filter(pk__in=removed.values()).delete()
+
+    return {ship_id for (ship_id, type_id), units in upserts} | {ship_id for ship_id, type_id in removed}
+
+
+def sync_fleet(agent, client=None):
+    """Refresh all of an agent's ships from the API, creating any new ones."""
+    from .utils import populate_ship, populate_system
+
+    client = client or agent.get_client()
+    fleet = client.list_ships()
+    ships = Ship.objects.filter(agent=agent).select_related("nav").in_bulk([data["symbol"] for data in fleet], field_name="symbol")
+
+    # Populate any systems in which our ships are located but which we haven't yet recorded.
+    system_symbols = {data["nav"]["systemSymbol"] for data in fleet}
+    for symbol in system_symbols - set(System.objects.filter(symbol__in=system_symbols).values_list("symbol", flat=True)):
+        LOGGER.info(f"Populating System {symbol}")
+        populate_system(client, symbol)
+
+    for data in fleet:
+        if data["symbol"] not in ships:
+            ship = populate_ship(client, agent, data)
+            LOGGER.info(f"Created {ship}")
+
+    ships_data = [(ships[data["symbol"]], data) for data in fleet if data["symbol"] in ships]
+    if ships_data:
+        with transaction.atomic():
+            changed = sync_navs(ships_data)
+            changed |= sync_ships(ships_data)
+            sync_equipment(ships_data, "modules", ShipModule)
+            sync_equipment(ships_data, "mounts", ShipMount)
+            changed |= sync_cargo([(ship, data["cargo"]) for ship, data in ships_data])
+
+        # Bulk writes don't send post_save signals; publish events for the changed ships.
+        for ship, data in ships_data:
+            if ship.pk in changed:
+                publish_event(agent.pk, ship.symbol, nav=str(ship.nav), **ship_event_fields(ship))
+
+    save_changed(agent, {"ship_count": len(fleet)})
+    msg = f"Synced {len(fleet)} ships for {agent.symbol}"
+    LOGGER.info(msg)
+    return msg
+
+
+def fleet_sync_lock_key(agent_id: int):
+    return f"fleet_sync:{agent_id}"
+
+
+def schedule_fleet_sync(agent_id: int, interval: int = None, chain: str = None):
+    """Sync an agent's fleet, then queue the next sync after `interval` seconds (default `settings.FLEET_SYNC_INTERVAL`).
+    Each agent has a single recurring chain of sync jobs, identified by `chain` and held by a lock in
+    the cache: starting a chain (with no `chain`) while another is running does nothing.
+    """
+    interval = interval or settings.FLEET_SYNC_INTERVAL
+    key, timeout = fleet_sync_lock_key(agent_id), interval * 3 + 60
+    if not chain:
+        chain = uuid.uuid4().hex
+        if not cache.add(key, chain, timeout):
+            LOGGER.info(f"Fleet sync is already scheduled for agent {agent_id}")
+            return
+    elif cache.get(key) not in (None, chain):
+        return  # Superseded by another chain.
+    cache.set(key, chain, timeout)
+
+    agent = Agent.objects.get(pk=agent_id)
+    try:
+        sync_fleet(agent)
+    finally:
+        queue = get_queue("default")
+        queue.enqueue_in(timedelta(seconds=interval), schedule_fleet_sync, agent_id, interval, chain)
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from galaxy.crawler import crawl, crawl_systems
+from spacetraders import get_client
+
+
+class Command(BaseCommand):
+    help = "Crawl and update systems, markets or shipyards from the API, resuming any interrupted crawl."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=["systems", "markets", "shipyards"])
+        parser.add_argument("-s", "--system", action="store", help="system symbol, for markets or shipyards (default: the whole galaxy)")
+        parser.add_argument("-w", "--workers", type=int, help="number of concurrent requests")
+        parser.add_argument("--no-waypoints", action="store_true", help="record systems only, without populating their waypoints")
+
+    def handle(self, *args, **options):
+        client = get_client()
+        if options["kind"] == "systems":
+            if options["system"]:
+                raise CommandError("--system applies to markets and shipyards only")
+            job = crawl_systems(client, options["workers"], waypoints=not options["no_waypoints"])
+        else:
+            kind = {"markets": "MARKET", "shipyards": "SHIPYARD"}[options["kind"]]
+            job = crawl(client, kind, options["system"], options["workers"])
+        print(job)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from galaxy.snapshot import dump_galaxy
+
+
+class Command(BaseCommand):
+    help = "Write a compressed, columnar snapshot of the galaxy (systems, waypoints, markets and shipyards) to a file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="snapshot file path")
+
+    def handle(self, *args, **options):
+        counts = dump_galaxy(options["path"])
+        print(f"Dumped {sum(counts.values())} rows from {len(counts)} tables to {options['path']}")
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from galaxy.snapshot import load_galaxy
+
+
+class Command(BaseCommand):
+    help = "Load a galaxy snapshot file (written by dump_galaxy) into an empty database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="snapshot file path")
+
+    def handle(self, *args, **options):
+        try:
+            counts = load_galaxy(options["path"])
+        except ValueError as e:
+            raise CommandError(e)
+        print(f"Loaded {sum(counts.values())} rows into {len(counts)} tables from {options['path']}")
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from galaxy.tiles import get_tile
+
+
+class Command(BaseCommand):
+    help = "Pre-render any galaxy map tiles which are not already cached on disk."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-z", "--max-zoom", type=int, default=4, help=f"maximum zoom level to render (default 4, limit {settings.GALAXY_MAP_MAX_ZOOM})"
+        )
+
+    def handle(self, *args, **options):
+        max_zoom = min(options["max_zoom"], settings.GALAXY_MAP_MAX_ZOOM)
+        for z in range(max_zoom + 1):
+            for x in range(2**z):
+                for y in range(2**z):
+                    get_tile(z, x, y)
+            print(f"Rendered zoom level {z} ({4**z} tiles)")
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from galaxy.models import Agent, System
+from galaxy.simulator import STRATEGIES, Simulation
+
+
+class Command(BaseCommand):
+    help = "Simulate ship strategies offline in a system, and report the credits earned per hour by each ship."
+
+    def add_arguments(self, parser):
+        parser.add_argument("system", help="system symbol")
+        parser.add_argument("-a", "--agent", action="store", help="agent symbol (default: ships of all agents in the system)")
+        parser.add_argument("--strategy", choices=STRATEGIES.keys(), help="strategy for every ship (default: by ship behaviour)")
+        parser.add_argument("--hours", type=float, default=24, help="hours of game time to simulate (default: 24)")
+        parser.add_argument("--seed", type=int, default=0, help="random seed (default: 0)")
+        parser.add_argument("--runs", type=int, default=1, help="number of runs to average, with successive seeds (default: 1)")
+
+    def handle(self, *args, **options):
+        if not System.objects.filter(symbol=options["system"]).exists():
+            raise CommandError(f"Unknown system {options['system']}")
+        agent = None
+        if options["agent"]:
+            agent = Agent.objects.filter(symbol=options["agent"]).first()
+            if not agent:
+                raise CommandError(f"Unknown agent {options['agent']}")
+
+        totals = {}
+        for run in range(options["runs"]):
+            sim = Simulation.from_database(options["system"], agent, options["strategy"], options["seed"] + run)
+            if not sim.ships:
+                raise CommandError(f"No ships in {options['system']}")
+            for result in sim.run(options["hours"]):
+                totals.setdefault((result["ship"], result["strategy"]), []).append(result["credits_per_hour"])
+
+        for (ship, strategy), values in totals.items():
+            print(f"{ship} ({strategy}): {round(sum(values) / len(values))} credits/hour")
+        fleet = sum(sum(values) / len(values) for values in totals.values())
+        print(f"Fleet: {round(fleet)} credits/hour over {options['hours']} hours, {options['runs']} run(s)")
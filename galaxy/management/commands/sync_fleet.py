@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from galaxy.fleet import schedule_fleet_sync, sync_fleet
+from galaxy.models import Agent
+
+
+class Command(BaseCommand):
+    help = "Sync the fleets of agents from the API (all agents having a bearer token, by default)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("-a", "--agent", action="store", help="agent symbol")
+        parser.add_argument(
+            "-s", "--schedule", action="store_true", help="queue a recurring sync job for each agent, instead of syncing once"
+        )
+
+    def handle(self, *args, **options):
+        agents = Agent.objects.filter(bearer_token__isnull=False)
+        if options["agent"]:
+            agents = agents.filter(symbol=options["agent"])
+            if not agents.exists():
+                raise CommandError(f"No agent {options['agent']} with a bearer token")
+
+        for agent in agents:
+            if options["schedule"]:
+                schedule_fleet_sync(agent.pk)
+                print(f"Scheduled fleet sync for {agent.symbol}")
+            else:
+                print(sync_fleet(agent))
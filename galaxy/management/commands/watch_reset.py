@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from galaxy.models import Epoch
+from galaxy.reset import check_for_reset
+
+
+class Command(BaseCommand):
+    help = "Check for a server reset now, and queue recurring checks (recovering automatically from any reset)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("-i", "--interval", type=int, help="seconds between checks (default: settings.RESET_CHECK_INTERVAL)")
+
+    def handle(self, *args, **options):
+        check_for_reset(interval=options["interval"])
+        print(f"Current epoch: {Epoch.objects.first()}")
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-19 00:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galaxy', '0004_agent_bearer_token_agent_user'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='system',
+            index=models.Index(fields=['x', 'y'], name='galaxy_syst_x_5c6f44_idx'),
+        ),
+    ]
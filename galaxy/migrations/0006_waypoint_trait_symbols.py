@@ -0,0 +1,36 @@
+# Generated by Django 5.2.3 on 2026-10-19 00:45
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+POPULATE_TRAIT_SYMBOLS = """
+UPDATE galaxy_waypoint SET trait_symbols = t.symbols
+FROM (
+    SELECT wt.waypoint_id, array_agg(trait.symbol ORDER BY trait.symbol) AS symbols
+    FROM galaxy_waypoint_traits wt JOIN galaxy_waypointtrait trait ON trait.id = wt.waypointtrait_id
+    GROUP BY wt.waypoint_id
+) t
+WHERE galaxy_waypoint.id = t.waypoint_id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galaxy', '0005_system_coords_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='waypoint',
+            name='trait_symbols',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=32), blank=True, default=list, editable=False, size=None),
+        ),
+        migrations.RunSQL(POPULATE_TRAIT_SYMBOLS, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='waypoint',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['trait_symbols'], name='galaxy_wayp_trait_s_0ef394_gin'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.3 on 2026-10-19 00:50
+
+from django.db import migrations, models
+
+
+# Remove duplicate transactions (keeping the earliest recorded) before adding the unique constraint.
+DEDUPLICATE_TRANSACTIONS = """
+DELETE FROM galaxy_transaction t USING galaxy_transaction d
+WHERE t.market_id = d.market_id AND t.ship_symbol = d.ship_symbol AND t.trade_good_id = d.trade_good_id
+AND t.type = d.type AND t.timestamp = d.timestamp AND t.id > d.id
+"""
+
+# Market.update no longer re-saves every export to pick up new imports; match all existing pairs once.
+MATCH_TRADE_GOODS = """
+INSERT INTO galaxy_markettradegood_trade_matches (from_markettradegood_id, to_markettradegood_id)
+SELECT a.id, b.id FROM galaxy_markettradegood a JOIN galaxy_markettradegood b ON a.trade_good_id = b.trade_good_id
+WHERE (a.type = 'EXPORT' AND b.type = 'IMPORT') OR (a.type = 'IMPORT' AND b.type = 'EXPORT')
+ON CONFLICT DO NOTHING
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galaxy', '0006_waypoint_trait_symbols'),
+    ]
+
+    operations = [
+        migrations.RunSQL(DEDUPLICATE_TRANSACTIONS, migrations.RunSQL.noop),
+        migrations.RunSQL(MATCH_TRADE_GOODS, migrations.RunSQL.noop),
+        migrations.AddConstraint(
+            model_name='transaction',
+            constraint=models.UniqueConstraint(fields=('market', 'ship_symbol', 'trade_good', 'type', 'timestamp'), name='unique_transaction'),
+        ),
+    ]
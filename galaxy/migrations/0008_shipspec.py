@@ -0,0 +1,43 @@
+# Generated by Django 5.2.3 on 2026-10-19 00:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galaxy', '0007_transaction_natural_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShipSpec',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.CharField(help_text='Hash of the specification content', max_length=64, unique=True)),
+                ('type', models.CharField(db_index=True, max_length=64)),
+                ('name', models.CharField(max_length=128)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('frame', models.JSONField(default=dict)),
+                ('reactor', models.JSONField(default=dict)),
+                ('engine', models.JSONField(default=dict)),
+                ('crew', models.JSONField(default=dict)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='shipspec',
+            name='modules',
+            field=models.ManyToManyField(blank=True, to='galaxy.shipmodule'),
+        ),
+        migrations.AddField(
+            model_name='shipspec',
+            name='mounts',
+            field=models.ManyToManyField(blank=True, to='galaxy.shipmount'),
+        ),
+        migrations.AddField(
+            model_name='shipyardship',
+            name='spec',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='listings', to='galaxy.shipspec'),
+        ),
+    ]
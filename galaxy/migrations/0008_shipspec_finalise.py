@@ -0,0 +1,59 @@
+# Generated by Django 5.2.3 on 2026-10-19 00:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galaxy', '0008_shipspec_intern'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='shipyardship',
+            unique_together={('shipyard', 'type')},
+        ),
+        migrations.AddConstraint(
+            model_name='shipyardtransaction',
+            constraint=models.UniqueConstraint(fields=('shipyard', 'ship_type', 'agent_symbol', 'timestamp'), name='unique_shipyard_transaction'),
+        ),
+        migrations.RemoveField(
+            model_name='shipyardship',
+            name='crew',
+        ),
+        migrations.RemoveField(
+            model_name='shipyardship',
+            name='description',
+        ),
+        migrations.RemoveField(
+            model_name='shipyardship',
+            name='engine',
+        ),
+        migrations.RemoveField(
+            model_name='shipyardship',
+            name='frame',
+        ),
+        migrations.RemoveField(
+            model_name='shipyardship',
+            name='modules',
+        ),
+        migrations.RemoveField(
+            model_name='shipyardship',
+            name='mounts',
+        ),
+        migrations.RemoveField(
+            model_name='shipyardship',
+            name='name',
+        ),
+        migrations.RemoveField(
+            model_name='shipyardship',
+            name='reactor',
+        ),
+        migrations.AlterField(
+            model_name='shipyardship',
+            name='spec',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='listings', to='galaxy.shipspec'),
+        ),
+    ]
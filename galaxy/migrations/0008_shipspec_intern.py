@@ -0,0 +1,72 @@
+# Generated by Django 5.2.3 on 2026-10-19 00:51
+
+from django.db import migrations
+import hashlib
+import json
+
+
+def intern_ship_specs(apps, schema_editor):
+    """Move the specification of each existing shipyard ship into the shared ShipSpec catalogue,
+    keeping only the latest listing of each ship type per shipyard.
+    """
+    ShipyardShip = apps.get_model("galaxy", "ShipyardShip")
+    ShipSpec = apps.get_model("galaxy", "ShipSpec")
+
+    seen = set()
+    for ship in ShipyardShip.objects.order_by("-pk").prefetch_related("modules", "mounts"):
+        if (ship.shipyard_id, ship.type) in seen:
+            ship.delete()
+            continue
+        seen.add((ship.shipyard_id, ship.type))
+
+        # Must match ShipSpec.get_hash
+        content = {
+            "type": ship.type,
+            "name": ship.name,
+            "description": ship.description,
+            "frame": ship.frame,
+            "reactor": ship.reactor,
+            "engine": ship.engine,
+            "crew": ship.crew,
+            "modules": sorted(module.symbol for module in ship.modules.all()),
+            "mounts": sorted(mount.symbol for mount in ship.mounts.all()),
+        }
+        spec, created = ShipSpec.objects.get_or_create(
+            hash=hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest(),
+            defaults={
+                "type": ship.type,
+                "name": ship.name,
+                "description": ship.description,
+                "frame": ship.frame,
+                "reactor": ship.reactor,
+                "engine": ship.engine,
+                "crew": ship.crew,
+            },
+        )
+        if created:
+            spec.modules.set(ship.modules.all())
+            spec.mounts.set(ship.mounts.all())
+        ship.spec = spec
+        ship.save()
+
+
+# Remove duplicate shipyard transactions (keeping the earliest recorded) before adding the unique constraint.
+DEDUPLICATE_TRANSACTIONS = """
+DELETE FROM galaxy_shipyardtransaction t USING galaxy_shipyardtransaction d
+WHERE t.shipyard_id = d.shipyard_id AND t.ship_type = d.ship_type AND t.agent_symbol = d.agent_symbol
+AND t.timestamp = d.timestamp AND t.id > d.id
+"""
+
+
+class Migration(migrations.Migration):
+    # Kept apart from the schema changes to ShipyardShip, which Postgres refuses within the same
+    # transaction as these row updates (pending trigger events).
+
+    dependencies = [
+        ('galaxy', '0008_shipspec'),
+    ]
+
+    operations = [
+        migrations.RunPython(intern_ship_specs, migrations.RunPython.noop),
+        migrations.RunSQL(DEDUPLICATE_TRANSACTIONS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-19 00:52
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galaxy', '0008_shipspec_finalise'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CrawlJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('modified', models.DateTimeField(auto_now=True)),
+                ('kind', models.CharField(choices=[('MARKET', 'markets'), ('SHIPYARD', 'shipyards')], max_length=32)),
+                ('scope', models.CharField(blank=True, default='', help_text='System symbol, or blank for the whole galaxy', max_length=32)),
+                ('pending', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=64), blank=True, default=list, size=None)),
+                ('completed', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ('-created',),
+            },
+        ),
+    ]
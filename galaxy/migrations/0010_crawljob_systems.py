@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-19 00:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galaxy', '0009_crawljob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crawljob',
+            name='page',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='crawljob',
+            name='total',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='crawljob',
+            name='kind',
+            field=models.CharField(choices=[('MARKET', 'markets'), ('SHIPYARD', 'shipyards'), ('SYSTEM', 'systems')], max_length=32),
+        ),
+    ]
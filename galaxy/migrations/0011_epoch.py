@@ -0,0 +1,27 @@
+# Generated by Django 5.2.3 on 2026-10-19 00:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galaxy', '0010_crawljob_systems'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Epoch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('reset_date', models.DateField(unique=True)),
+                ('next_reset', models.DateTimeField(blank=True, null=True)),
+                ('bootstrapped', models.DateTimeField(blank=True, null=True)),
+                ('archive_schema', models.CharField(blank=True, help_text="Schema containing this epoch's archived data", max_length=32, null=True)),
+            ],
+            options={
+                'ordering': ('-reset_date',),
+            },
+        ),
+    ]
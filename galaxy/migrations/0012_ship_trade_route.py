@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-19 01:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galaxy', '0011_epoch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ship',
+            name='trade_route',
+            field=models.JSONField(blank=True, help_text='Trade route assigned by the fleet trade optimiser', null=True),
+        ),
+    ]
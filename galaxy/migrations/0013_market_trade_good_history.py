@@ -0,0 +1,34 @@
+# Generated by Django 5.2.3 on 2026-10-19 01:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galaxy', '0012_ship_trade_route'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarketTradeGoodHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('observed', models.DateTimeField()),
+                ('type', models.CharField(choices=[('EXPORT', 'export'), ('IMPORT', 'import'), ('EXCHANGE', 'exchange')], max_length=32)),
+                ('trade_volume', models.PositiveIntegerField(default=0)),
+                ('supply', models.CharField(choices=[('SCARCE', 'scarce'), ('LIMITED', 'limited'), ('MODERATE', 'moderate'), ('HIGH', 'high'), ('ABUNDANT', 'abundant')], max_length=32)),
+                ('activity', models.CharField(blank=True, choices=[('WEAK', 'weak'), ('GROWING', 'growing'), ('STRONG', 'strong'), ('RESTRICTED', 'restricted')], max_length=32, null=True)),
+                ('purchase_price', models.PositiveIntegerField(default=0)),
+                ('sell_price', models.PositiveIntegerField(default=0)),
+                ('market', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='galaxy.market')),
+                ('trade_good', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='galaxy.tradegood')),
+            ],
+            options={
+                'verbose_name_plural': 'market trade good history',
+                'ordering': ('-observed',),
+                'indexes': [models.Index(fields=['market', 'trade_good', 'observed'], name='galaxy_mark_market__d0cbcb_idx')],
+            },
+        ),
+    ]
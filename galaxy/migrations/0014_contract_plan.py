@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-19 01:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galaxy', '0013_market_trade_good_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contract',
+            name='plan',
+            field=models.JSONField(blank=True, help_text='Fulfilment plan made by the contract planner', null=True),
+        ),
+        migrations.AlterField(
+            model_name='ship',
+            name='behaviour',
+            field=models.CharField(blank=True, choices=[(None, 'None'), ('TRADE', 'Trading'), ('MINE', 'Mining'), ('HAUL', 'Hauling'), ('CONTRACT', 'Contracts')], help_text='Desired autonomous behaviour', max_length=32, null=True),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.3 on 2026-10-19 01:07
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galaxy', '0014_contract_plan'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Extraction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('ship_symbol', models.CharField(max_length=32)),
+                ('survey_signature', models.CharField(blank=True, max_length=64, null=True)),
+                ('trade_symbol', models.CharField(max_length=64)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('waypoint', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='galaxy.waypoint')),
+            ],
+            options={
+                'ordering': ('-timestamp',),
+            },
+        ),
+        migrations.CreateModel(
+            name='Survey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('signature', models.CharField(max_length=64, unique=True)),
+                ('deposits', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=32), size=None)),
+                ('size', models.CharField(choices=[('SMALL', 'small'), ('MODERATE', 'moderate'), ('LARGE', 'large')], max_length=32)),
+                ('expiration', models.DateTimeField()),
+                ('waypoint', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='surveys', to='galaxy.waypoint')),
+            ],
+            options={
+                'ordering': ('-expiration',),
+                'indexes': [models.Index(fields=['waypoint', 'expiration'], name='galaxy_surv_waypoin_52c56e_idx'), django.contrib.postgres.indexes.GinIndex(fields=['deposits'], name='galaxy_surv_deposit_c600de_gin')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-19 01:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galaxy', '0015_survey_extraction'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ship',
+            name='probe_route',
+            field=models.JSONField(blank=True, help_text='Market waypoint symbols observed by a probe', null=True),
+        ),
+        migrations.AlterField(
+            model_name='ship',
+            name='behaviour',
+            field=models.CharField(blank=True, choices=[(None, 'None'), ('TRADE', 'Trading'), ('MINE', 'Mining'), ('HAUL', 'Hauling'), ('CONTRACT', 'Contracts'), ('PROBE', 'Market observation')], help_text='Desired autonomous behaviour', max_length=32, null=True),
+        ),
+    ]
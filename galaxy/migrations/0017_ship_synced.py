@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-19 01:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galaxy', '0016_ship_probe_route'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ship',
+            name='synced',
+            field=models.DateTimeField(blank=True, editable=False, help_text='When the ship was last synced from the API', null=True),
+        ),
+    ]
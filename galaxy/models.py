@@ -2,20 +2,107 @@ from datetime import datetime, timezone, timedelta
 from django.conf import settings
 from django.contrib.admin import display
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
+from django.db.transaction import atomic
 from django.urls import reverse
+from django.utils.dateparse import parse_datetime
 from django_rq.queues import get_queue
+import hashlib
 from humanize import naturaldelta
+import json
 import logging
 from math import dist
 import random
 from time import sleep
 from zoneinfo import ZoneInfo
 
+from spacetraders import get_client
+
 TZ = ZoneInfo(settings.TIME_ZONE)
 LOGGER = logging.getLogger("spacetraders")
 
 
+def save_changed(instance, values: dict, always: bool = False):
+    """Set the passed-in field values on a model instance, and save only those fields which
+    have changed (plus any `auto_now` fields). If nothing has changed, nothing is saved unless
+    `always` is True, in which case only the `auto_now` fields are saved.
+    Returns the list of changed field names.
+    """
+    changed = [name for name, value in values.items() if getattr(instance, name) != value]
+    for name in changed:
+        setattr(instance, name, values[name])
+    if changed or always:
+        auto_now = [f.name for f in instance._meta.concrete_fields if getattr(f, "auto_now", False)]
+        instance.save(update_fields=changed + auto_now)
+    return changed
+
+
+class LocatedModel(models.Model):
+    """Abstract model having a type and coordinates. Records the location of each instance loaded
+    from the database, so that signal handlers can tell whether it has changed on save.
+    """
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_location = tuple(instance.__dict__.get(name) for name in ("type", "x", "y"))
+        return instance
+
+    def get_loaded_location(self):
+        """Returns the (type, x, y) of this instance when loaded or last saved, or None."""
+        return getattr(self, "_loaded_location", None)
+
+    def location_changed(self):
+        """Returns True if this instance's location differs from that loaded (or last saved), and
+        records the current location as saved.
+        """
+        location = (self.type, self.x, self.y)
+        changed = self.get_loaded_location() != location
+        self._loaded_location = location
+        return changed
+
+
+def fuel_cost(distance: float, flight_mode: str):
+    """Returns the fuel cost of travelling the passed-in distance in the nominated flight mode.
+    Reference: https://github.com/SpaceTradersAPI/api-docs/wiki/Travel-Fuel-and-Time
+    """
+    if flight_mode in ["CRUISE", "STEALTH"]:
+        return int(distance)
+    elif flight_mode == "BURN":
+        return int(distance) * 2
+    elif flight_mode == "DRIFT":
+        return 1
+
+    return False
+
+
+def navigate_time(distance: float, flight_mode: str, speed: int):
+    """Returns the travel time in seconds of the passed-in distance, in the nominated flight mode
+    for a ship having the nominated engine speed.
+    Reference: https://github.com/SpaceTradersAPI/api-docs/wiki/Travel-Fuel-and-Time
+    """
+    distance = int(distance)
+    if distance <= 0:
+        return
+
+    if flight_mode == "CRUISE":
+        nav_multiplier = 25.0
+    elif flight_mode == "DRIFT":
+        nav_multiplier = 250.0
+    elif flight_mode == "BURN":
+        nav_multiplier = 12.5
+    elif flight_mode == "STEALTH":
+        nav_multiplier = 30.0
+    else:
+        return False
+
+    return round(max(1, distance) * (nav_multiplier / speed) + 15)
+
+
 class FactionTrait(models.Model):
     symbol = models.CharField(max_length=32, unique=True)
     name = models.CharField(max_length=128)
@@ -74,8 +161,12 @@ class Agent(models.Model):
         self.update(data)
         LOGGER.info(f"Refreshed data for {self}")
 
+    def get_client(self):
+        """Return the pooled API client authenticated as this agent."""
+        return get_client(self.bearer_token)
+
 
-class System(models.Model):
+class System(LocatedModel):
     TYPE_CHOICES = (
         ("NEUTRON_STAR", "neutron star"),
         ("RED_STAR", "red star"),
@@ -98,6 +189,7 @@ class System(models.Model):
     class Meta:
         ordering = ("sector", "symbol")
         unique_together = ("symbol", "sector")
+        indexes = [models.Index(fields=["x", "y"])]
 
     def __str__(self):
         return f"{self.symbol} ({self.get_type_display()})"
@@ -138,7 +230,14 @@ class WaypointModifier(models.Model):
         return self.name
 
 
-class Waypoint(models.Model):
+class WaypointQuerySet(models.QuerySet):
+
+    def with_trait(self, symbol: str):
+        """Filter waypoints having the nominated trait symbol (uses the GIN index on trait_symbols)."""
+        return self.filter(trait_symbols__contains=[symbol])
+
+
+class Waypoint(LocatedModel):
     TYPE_CHOICES = (
         ("PLANET", "planet"),
         ("GAS_GIANT", "gas giant"),
@@ -169,9 +268,16 @@ class Waypoint(models.Model):
     modifiers = models.ManyToManyField(WaypointModifier, blank=True)
     is_under_construction = models.BooleanField(default=False)
 
+    # Non-API (local) fields.
+    # Denormalised copy of the symbols of `traits`, maintained by the m2m_changed signal.
+    trait_symbols = ArrayField(base_field=models.CharField(max_length=32), default=list, blank=True, editable=False)
+
+    objects = WaypointQuerySet.as_manager()
+
     class Meta:
         ordering = ("symbol",)
         unique_together = ("symbol", "system")
+        indexes = [GinIndex(fields=["trait_symbols"])]
 
     def __str__(self):
         return f"{self.symbol} ({self.get_type_display()})"
@@ -189,8 +295,7 @@ class Waypoint(models.Model):
                 waypoint.orbits = self
                 waypoint.save()
         if data["traits"]:
-            for trait in data["traits"]:
-                self.traits.add(WaypointTrait.objects.get(symbol=trait["symbol"]))
+            self.traits.add(*WaypointTrait.objects.filter(symbol__in=[trait["symbol"] for trait in data["traits"]]))
         if data["modifiers"]:
             for mod in data["modifers"]:
                 self.modifiers.add(WaypointModifier.objects.get(symbol=mod["symbol"]))
@@ -247,10 +352,12 @@ class Waypoint(models.Model):
         return self.has_trait("SHIPYARD")
 
     def has_trait(self, trait):
-        if WaypointTrait.objects.filter(symbol=trait).exists() and WaypointTrait.objects.get(symbol=trait) in self.traits.all():
-            return True
-        else:
-            return False
+        return trait in self.trait_symbols
+
+    def update_trait_symbols(self):
+        """Synchronise the denormalised trait_symbols field with this waypoint's traits."""
+        self.trait_symbols = sorted(self.traits.values_list("symbol", flat=True))
+        Waypoint.objects.filter(pk=self.pk).update(trait_symbols=self.trait_symbols)
 
     def distance(self, coords):
         """Returns the distance of this waypoint from the passed-in coordinates."""
@@ -274,10 +381,13 @@ class Waypoint(models.Model):
         """For a given market waypoint, return a list of other exporter waypoints in the same system sorted by distance.
         Returns [(<Waypoint>, <distance>), ...]
         """
+        from .spatial import nearest_waypoints
+
         export_markets = Market.objects.filter(exports__isnull=False, waypoint__system=self.system).distinct()
-        export_waypoints = [(e.waypoint, e.waypoint.distance(self.coords), e.exports_display) for e in export_markets]
-        export_waypoints = sorted(export_waypoints, key=lambda x: x[1])
-        return export_waypoints
+        export_markets = export_markets.select_related("waypoint").prefetch_related("exports")
+        export_markets = {market.waypoint_id: market for market in export_markets}
+        nearest = nearest_waypoints(self.system_id, self.coords, pks=export_markets.keys())
+        return [(export_markets[p.pk].waypoint, distance, export_markets[p.pk].exports_display) for distance, p in nearest]
 
 
 class Chart(models.Model):
@@ -316,13 +426,18 @@ class ShipNav(models.Model):
         return self.status == "IN_TRANSIT"
 
     def update(self, data):
-        """Update from passed-in nav data."""
-        self.system = System.objects.get(symbol=data["systemSymbol"])
-        self.waypoint = Waypoint.objects.get(symbol=data["waypointSymbol"])
-        self.route = data["route"]
-        self.status = data["status"]
-        self.flight_mode = data["flightMode"]
-        self.save()
+        """Update from passed-in nav data, saving only changed fields."""
+        values = {
+            "route": data["route"],
+            "status": data["status"],
+            "flight_mode": data["flightMode"],
+        }
+        # Only look up the system and waypoint if they have changed.
+        if not self.system_id or self.system.symbol != data["systemSymbol"]:
+            values["system"] = System.objects.get(symbol=data["systemSymbol"])
+        if not self.waypoint_id or self.waypoint.symbol != data["waypointSymbol"]:
+            values["waypoint"] = Waypoint.objects.get(symbol=data["waypointSymbol"])
+        save_changed(self, values)
 
     def get_arrival(self):
         """Returns route.arrival as a datetime."""
@@ -347,42 +462,13 @@ class ShipNav(models.Model):
         currently set flight mode.
         Reference: https://github.com/SpaceTradersAPI/api-docs/wiki/Travel-Fuel-and-Time
         """
-        distance = self.waypoint.distance(coords)
-        if not flight_mode:
-            flight_mode = self.flight_mode
-
-        if flight_mode in ["CRUISE", "STEALTH"]:
-            return int(distance)
-        elif flight_mode == "BURN":
-            return int(distance) * 2
-        elif flight_mode == "DRIFT":
-            return 1
-
-        return False
+        return fuel_cost(self.waypoint.distance(coords), flight_mode or self.flight_mode)
 
     def get_navigate_time(self, distance: int, flight_mode: str = None):
         """For the passed-in distance, calculate the navigate travel time in seconds.
         Reference: https://github.com/SpaceTradersAPI/api-docs/wiki/Travel-Fuel-and-Time
         """
-        distance = int(distance)
-        if distance <= 0:
-            return
-
-        if not flight_mode:
-            flight_mode = self.flight_mode
-
-        if flight_mode == "CRUISE":
-            nav_multiplier = 25.0
-        elif flight_mode == "DRIFT":
-            nav_multiplier = 250.0
-        elif flight_mode == "BURN":
-            nav_multiplier = 12.5
-        elif flight_mode == "STEALTH":
-            nav_multiplier = 30.0
-        else:
-            return False
-
-        return round(max(1, distance) * (nav_multiplier / self.ship.engine["speed"]) + 15)
+        return navigate_time(distance, flight_mode or self.flight_mode, self.ship.engine["speed"])
 
 
 class ShipModule(models.Model):
@@ -396,6 +482,18 @@ class ShipModule(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_data(cls, data):
+        """Returns an unsaved instance from passed-in module data."""
+        return cls(
+            symbol=data["symbol"],
+            name=data["name"],
+            description=data["description"],
+            capacity=data.get("capacity", 0),
+            range=data.get("range", 0),
+            requirements=data.get("requirements", {}),
+        )
+
 
 class ShipMount(models.Model):
     symbol = models.CharField(max_length=32, unique=True)
@@ -408,6 +506,18 @@ class ShipMount(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_data(cls, data):
+        """Returns an unsaved instance from passed-in mount data."""
+        return cls(
+            symbol=data["symbol"],
+            name=data["name"],
+            description=data["description"],
+            strength=data.get("strength", 0),
+            deposits=data.get("deposits"),
+            requirements=data.get("requirements", {}),
+        )
+
 
 class Ship(models.Model):
     modified = models.DateTimeField(auto_now=True)
@@ -432,6 +542,8 @@ class Ship(models.Model):
         ("TRADE", "Trading"),
         ("MINE", "Mining"),
         ("HAUL", "Hauling"),
+        ("CONTRACT", "Contracts"),
+        ("PROBE", "Market observation"),
     )
     behaviour = models.CharField(
         max_length=32,
@@ -440,6 +552,17 @@ class Ship(models.Model):
         null=True,
         help_text="Desired autonomous behaviour",
     )
+    trade_route = models.JSONField(null=True, blank=True, help_text="Trade route assigned by the fleet trade optimiser")
+    probe_route = models.JSONField(null=True, blank=True, help_text="Market waypoint symbols observed by a probe")
+    synced = models.DateTimeField(null=True, blank=True, editable=False, help_text="When the ship was last synced from the API")
+    # Method implementing each behaviour.
+    BEHAVIOUR_METHODS = {
+        "TRADE": "behaviour_trade",
+        "MINE": "behaviour_mine",
+        "HAUL": "behaviour_haul",
+        "CONTRACT": "behaviour_contract",
+        "PROBE": "behaviour_probe",
+    }
 
     class Meta:
         ordering = ("symbol",)
@@ -532,8 +655,9 @@ class Ship(models.Model):
 
         # Determine if the destination waypoint is in range using the preset flight mode.
         # If not, set it to DRIFT mode.
+        # Ships having no fuel capacity (e.g. probes) consume no fuel.
         destination = Waypoint.objects.get(symbol=waypoint_symbol)
-        if self.nav.get_fuel_cost(destination.coords) >= self.fuel["current"]:
+        if self.fuel.get("capacity") and self.nav.get_fuel_cost(destination.coords) >= self.fuel["current"]:
             self.flight_mode(client, "DRIFT")
 
         data = client.navigate_ship(self.symbol, waypoint_symbol)
@@ -558,7 +682,7 @@ class Ship(models.Model):
     def refuel(self, client, units: int = None, from_cargo: bool = False):
         if not self.is_docked:
             self.dock(client)
-            self.refresh(client)
+            self.refresh(client, max_age=settings.FLEET_SNAPSHOT_MAX_AGE)
 
         data = client.refuel_ship(self.symbol, units, from_cargo)
         if "error" in data:
@@ -572,166 +696,110 @@ class Ship(models.Model):
         # Update agent.
         self.agent.update(data["agent"])
 
-        # Create a transaction for the fuel purchase.
-        market = Market.objects.get(waypoint__symbol=data["transaction"]["waypointSymbol"])
-        Transaction.objects.create(
-            market=market,
-            ship_symbol=data["transaction"]["shipSymbol"],
-            trade_good=TradeGood.objects.get(symbol="FUEL"),
-            type=data["transaction"]["type"],
-            units=data["transaction"]["units"],
-            price_per_unit=data["transaction"]["pricePerUnit"],
-            total_price=data["transaction"]["totalPrice"],
-            timestamp=data["transaction"]["timestamp"],
-        )
+        # Record a transaction for the fuel purchase.
+        Transaction.record(data["transaction"])
 
         msg = f"{self} refueled {data['transaction']['units']} units"
         LOGGER.info(msg)
         return msg
 
     def update(self, data):
-        """Update ship details from passed-in ship data.
+        """Update ship details from passed-in ship data, writing only those rows which have changed.
+        The ship itself is always saved, to record when it was last synced.
         Note that we update cargo in a separate method.
         """
-        self.crew = data["crew"]
-        self.frame = data["frame"]
-        self.reactor = data["reactor"]
-        self.engine = data["engine"]
-        self.cooldown = data["cooldown"]
-        self.fuel = data["fuel"]
-        self.save()
+        with atomic():
+            save_changed(
+                self,
+                {
+                    "crew": data["crew"],
+                    "frame": data["frame"],
+                    "reactor": data["reactor"],
+                    "engine": data["engine"],
+                    "cooldown": data["cooldown"],
+                    "fuel": data["fuel"],
+                    "synced": datetime.now(timezone.utc),
+                },
+                always=True,
+            )
 
-        # Update ship.nav
-        self.nav.update(data["nav"])
+            # Update ship.nav
+            self.nav.update(data["nav"])
 
-        # Update modules
-        self.modules.clear()
-        for module_data in data["modules"]:
-            if not ShipModule.objects.filter(symbol=module_data["symbol"]).exists():
-                module = ShipModule(
-                    symbol=module_data["symbol"],
-                    name=module_data["name"],
-                    description=module_data["description"],
-                )
-                if "capacity" in module_data:
-                    module.capacity = module_data["capacity"]
-                if "range" in module_data:
-                    module.range = module_data["range"]
-                if "requirements" in module_data:
-                    module.requirements = module_data["requirements"]
-                module.save()
-            else:
-                module = ShipModule.objects.get(symbol=module_data["symbol"])
-            self.modules.add(module)
-
-        # Update mounts
-        self.mounts.clear()
-        for mount_data in data["mounts"]:
-            if not ShipMount.objects.filter(symbol=mount_data["symbol"]).exists():
-                mount = ShipMount(
-                    symbol=mount_data["symbol"],
-                    name=mount_data["name"],
-                    description=mount_data["description"],
-                )
-                if "strength" in mount_data:
-                    mount.strength = mount_data["strength"]
-                if "deposits" in mount_data:
-                    mount.deposits = mount_data["deposits"]
-                if "requirements" in mount_data:
-                    mount.requirements = mount_data["requirements"]
-                mount.save()
-            else:
-                mount = ShipMount.objects.get(symbol=mount_data["symbol"])
-            self.mounts.add(mount)
+            # Update modules & mounts
+            self.sync_equipment(self.modules, ShipModule, data["modules"])
+            self.sync_equipment(self.mounts, ShipMount, data["mounts"])
 
         #LOGGER.info(f"{self} updated")
 
+    def sync_equipment(self, manager, model, items: list):
+        """Synchronise a many-to-many relation of this ship (modules or mounts) with the passed-in
+        list of items, creating any unknown equipment and adding/removing only the differences.
+        """
+        symbols = {item["symbol"] for item in items}
+        if symbols == set(manager.values_list("symbol", flat=True)):
+            return
+        model.objects.bulk_create([model.from_data(item) for item in items], ignore_conflicts=True)
+        manager.set(model.objects.filter(symbol__in=symbols))
+
     def update_cargo(self, data):
-        """Update ship cargo from passed-in data.
+        """Update ship cargo from passed-in data, in a constant number of queries.
         """
-        self.cargo_capacity = data["capacity"]
-        self.cargo_units = data["units"]
-        self.save()
+        from .fleet import sync_cargo
 
-        # If the ship's cargo inventory is empty, clear it.
-        if not data["inventory"]:
-            ShipCargoItem.objects.filter(ship=self).delete()
-        else:
-            for good in data["inventory"]:
-                if not CargoType.objects.filter(symbol=good["symbol"]).exists():
-                    cargo_type = CargoType.objects.create(
-                        symbol=good["symbol"],
-                        name=good["name"],
-                        description=good["description"],
-                    )
-                else:
-                    cargo_type = CargoType.objects.get(symbol=good["symbol"])
-
-                # New inventory good.
-                if not ShipCargoItem.objects.filter(type=cargo_type, ship=self).exists():
-                    item = ShipCargoItem.objects.create(
-                        type=cargo_type,
-                        ship=self,
-                        units=good["units"],
-                    )
-                elif ShipCargoItem.objects.filter(type=cargo_type, ship=self).exists():
-                    # Update the number of units if required.
-                    item = ShipCargoItem.objects.get(type=cargo_type, ship=self)
-                    if item.units != good["units"]:
-                        item.units = good["units"]
-                        item.save()
-
-                # Check the set of ship cargo items. If there is anything not currently in inventory,
-                # delete any of those ShipCargoItem objects.
-                current_cargo = CargoType.objects.filter(symbol__in=[good["symbol"] for good in data["inventory"]])
-                ShipCargoItem.objects.filter(ship=self).exclude(type__in=current_cargo).delete()
+        with atomic():
+            save_changed(self, {"cargo_capacity": data["capacity"], "cargo_units": data["units"]})
+            sync_cargo([(self, data)])
 
         #LOGGER.info(f"{self} cargo updated")
 
     def get_available_capacity(self):
         return self.cargo_capacity - self.cargo_units
 
-    def purchase_cargo(self, client, trade_good: str, units: int = None):
+    def purchase_cargo(self, client, trade_good: str, units: int = None, max_price: int = None):
+        """Purchase the trade good at the current market, in tranches of at most the market's trade
+        volume. If `units` is not supplied, fill the available cargo capacity. If `max_price` is
+        supplied, stop once the predicted unit price of the next tranche exceeds it.
+        """
+        from .pricing import execute_order
+
         if not self.is_docked:
             self.dock(client)
-            self.refresh(client)
+            self.refresh(client, max_age=settings.FLEET_SNAPSHOT_MAX_AGE)
 
-        # If units is not supplied, purchase the largest amount available.
         if not units:
-            market = self.nav.waypoint.market
-            market_trade_good = MarketTradeGood.objects.get(market=market, trade_good=TradeGood.objects.get(symbol=trade_good))
-            # If the available volume on the market is less than our ship's available capacity, use that.
-            if market_trade_good.trade_volume < self.get_available_capacity():
-                units = market_trade_good.trade_volume
-            else:
-                units = self.get_available_capacity()
-
-        data = client.purchase_cargo(self.symbol, trade_good, units)
-        if "error" in data:
-            LOGGER.error(data["error"]["message"])
-            return False
-
-        # data contains: agent, cargo, transaction
-        self.update_cargo(data["cargo"])
-        # Update agent.
-        self.agent.update(data["agent"])
-        # Create a transaction
-        market = Market.objects.get(waypoint__symbol=data["transaction"]["waypointSymbol"])
-        trade_good = TradeGood.objects.get(symbol=data["transaction"]["tradeSymbol"])
-        transaction = Transaction.objects.create(
-            market=market,
-            ship_symbol=data["transaction"]["shipSymbol"],
-            trade_good=trade_good,
-            type=data["transaction"]["type"],
-            units=data["transaction"]["units"],
-            price_per_unit=data["transaction"]["pricePerUnit"],
-            total_price=data["transaction"]["totalPrice"],
-            timestamp=data["transaction"]["timestamp"],
+            units = self.get_available_capacity()
+        # Ships purchase a market's exports and exchanged goods.
+        market_trade_goods = MarketTradeGood.objects.filter(
+            market__waypoint=self.nav.waypoint, trade_good__symbol=trade_good, type__in=["EXPORT", "EXCHANGE"]
         )
+        if not market_trade_goods.exists():
+            # Unknown market conditions (e.g. a first visit): fetch them, so the order is sliced by the trade volume.
+            client.invalidate("get_market", self.nav.waypoint.symbol)
+            self.nav.waypoint.refresh(client)
+        market_trade_good = market_trade_goods.first()
+
+        def purchase(tranche):
+            data = client.purchase_cargo(self.symbol, trade_good, tranche)
+            if "error" in data:
+                LOGGER.error(data["error"]["message"])
+                return False
+            # data contains: agent, cargo, transaction
+            self.update_cargo(data["cargo"])
+            # Update agent.
+            self.agent.update(data["agent"])
+            # Record a transaction
+            return Transaction.record(data["transaction"])
+
+        transactions = execute_order(purchase, units, market_trade_good, purchase=True, limit=max_price)
+        if not transactions:
+            return False
         # Update the local market conditions.
         self.nav.waypoint.refresh(client)
 
-        msg = f"{self} purchased {transaction.units} units of {trade_good} for {transaction.total_price}"
+        units = sum(transaction.units for transaction in transactions)
+        total_price = sum(transaction.total_price for transaction in transactions)
+        msg = f"{self} purchased {units} units of {transactions[0].trade_good} for {total_price} ({len(transactions)} tranches)"
         LOGGER.info(msg)
         return msg
 
@@ -740,7 +808,7 @@ class Ship(models.Model):
         """
         if not self.is_docked:
             self.dock(client)
-            self.refresh(client)
+            self.refresh(client, max_age=settings.FLEET_SNAPSHOT_MAX_AGE)
 
         data = client.purchase_ship(self.nav.waypoint.symbol, ship_type)
         if "error" in data:
@@ -756,17 +824,18 @@ class Ship(models.Model):
         LOGGER.info(msg)
         return msg
 
-    def sell_cargo(self, client):
+    def sell_cargo(self, client, min_price: int = None):
         """Convenience function to try selling all the ship's cargo at the current waypoint.
+        If `min_price` is supplied, stop selling each good once its predicted unit price falls below it.
         """
         if not self.is_docked:
             self.dock(client)
-            self.refresh(client)
+            self.refresh(client, max_age=settings.FLEET_SNAPSHOT_MAX_AGE)
 
         transactions = []
         for cargo in self.cargo.all():
             LOGGER.info(f"Selling {cargo}")
-            result = cargo.sell(client)
+            result = cargo.sell(client, min_price=min_price)
             if not result:
                 LOGGER.warning(f"Error during sell for {cargo}")
                 return False
@@ -777,7 +846,34 @@ class Ship(models.Model):
         self.nav.waypoint.refresh(client)
         return transactions
 
-    def refresh(self, client):
+    def transfer_cargo(self, client, ship, trade_symbol: str, units: int):
+        """Transfer units of a trade good in this ship's cargo to another ship at the same waypoint."""
+        data = client.transfer_cargo(self.symbol, trade_symbol, units, ship.symbol)
+        if "error" in data:
+            LOGGER.error(data["error"]["message"])
+            return False
+
+        # data contains: cargo (and targetCargo, the receiving ship's cargo)
+        self.update_cargo(data["cargo"])
+        if "targetCargo" in data:
+            ship.update_cargo(data["targetCargo"])
+        else:
+            ship.refresh(client)
+        msg = f"{self} transferred {units} units of {trade_symbol} to {ship}"
+        LOGGER.info(msg)
+        return msg
+
+    def refresh(self, client, max_age: int = None):
+        """Refresh this ship's data from the API.
+        If `max_age` (seconds) is passed and the ship's local data was synced from the API more
+        recently than that (e.g. by `galaxy.fleet.sync_fleet`), reload it from the database instead.
+        """
+        if max_age:
+            self.refresh_from_db()
+            self.nav.refresh_from_db()
+            if self.synced and self.synced >= datetime.now(timezone.utc) - timedelta(seconds=max_age):
+                return f"{self} data loaded from local snapshot"
+
         data = client.get_ship(self.symbol)
         self.update(data)
         self.update_cargo(data["cargo"])
@@ -787,32 +883,18 @@ class Ship(models.Model):
         return msg
 
     def find_destination(self, trait=None, type=None):
-        """Return a list of waypoints having the nominated trait, ordered by distance from this ship.
+        """Return a list of (distance, waypoint) in this ship's system having the nominated trait
+        and/or type, ordered by distance from this ship.
         """
         if not trait and not type:
             return
 
-        waypoints = Waypoint.objects.all()
-
-        if trait:
-            try:
-                waypoint_trait = WaypointTrait.objects.get(symbol=trait)
-                waypoints = waypoints.filter(traits__in=[waypoint_trait])
-            except:
-                return False
-        if type:
-            try:
-                waypoints = waypoints.filter(type=type)
-            except:
-                return False
-
-        origin = self.nav.waypoint.coords
-        destinations = []
-        for wp in waypoints:
-            destinations.append((wp.distance(origin), wp))
+        from .spatial import nearest_waypoints
 
-        destinations = sorted(destinations, key=lambda x: x[0])
-        return destinations
+        origin = self.nav.waypoint
+        nearest = nearest_waypoints(origin.system_id, origin.coords, trait=trait, type=type)
+        waypoints = Waypoint.objects.in_bulk([p.pk for distance, p in nearest])
+        return [(distance, waypoints[p.pk]) for distance, p in nearest if p.pk in waypoints]
 
     def sleep_until_arrival(self):
         """Sleep (blocking) until the scheduled arrival time for this ship.
@@ -875,9 +957,35 @@ class Ship(models.Model):
         LOGGER.info(msg)
         return msg
 
+    @property
+    def can_survey(self):
+        return self.mounts.filter(symbol__startswith="MOUNT_SURVEYOR").exists()
+
+    def survey(self, client):
+        """Survey the current waypoint for resource deposits, and record the surveys."""
+        if not self.is_in_orbit:
+            self.orbit(client)
+        if self.is_in_cooldown:
+            msg = f"{self} is currently in cooldown for {self.cooldown_display()}"
+            LOGGER.info(msg)
+            return msg
+
+        data = client.create_survey(self.symbol)
+        if "error" in data:
+            LOGGER.error(data["error"]["message"])
+            return False
+
+        self.cooldown = data["cooldown"]
+        self.save()
+        surveys = Survey.record(data["surveys"])
+        msg = f"{self} recorded {len(surveys)} surveys of {self.nav.waypoint.symbol}"
+        LOGGER.info(msg)
+        return msg
+
     def extract(self, client, survey=None):
-        """Extract resources from a waypoint.
-        TODO: make use of an optional survey object.
+        """Extract resources from a waypoint, targeting the passed-in Survey (if any).
+        If the survey can no longer be used (it has expired or is exhausted), it is deleted and
+        the extraction is made without it. Other errors (e.g. the ship is in cooldown) are returned.
         """
         if not self.is_in_orbit:
             self.orbit(client)
@@ -886,7 +994,17 @@ class Ship(models.Model):
             LOGGER.info(msg)
             return msg
 
-        data = client.extract_resources(self.symbol)
+        if survey:
+            data = client.extract_resources_with_survey(self.symbol, survey.as_data())
+            if "error" in data and data["error"].get("code") in Survey.UNUSABLE_ERROR_CODES:
+                LOGGER.warning(f"Unable to extract with survey {survey.signature}: {data['error']['message']}")
+                survey.delete()
+                survey = None
+            elif "error" in data:
+                LOGGER.error(data["error"]["message"])
+                return False
+        if not survey:
+            data = client.extract_resources(self.symbol)
         if "error" in data:
             LOGGER.error(data["error"]["message"])
             return False
@@ -895,21 +1013,33 @@ class Ship(models.Model):
         self.save()
         self.update_cargo(data["cargo"])
         extract_yield = data["extraction"]["yield"]
-        msg = f"{self} extract yielded {extract_yield['units']} {extract_yield['symbol']}"
+        Extraction.objects.create(
+            timestamp=datetime.now(timezone.utc),
+            ship_symbol=self.symbol,
+            waypoint=self.nav.waypoint,
+            survey_signature=survey.signature if survey else None,
+            trade_symbol=extract_yield["symbol"],
+            units=extract_yield["units"],
+        )
+        msg = f"{self} extract yielded {extract_yield['units']} {extract_yield['symbol']}{' (surveyed)' if survey else ''}"
         LOGGER.info(msg)
         return msg
 
     def extract_until_full(self, client, target_resource: str = None):
-        """If the ship's cargo capacity is not full, queue an extract action for after the
-        cooldown or immediately (whichever is soonest).
+        """If the ship's cargo capacity is not full, extract (using the best unexpired survey for
+        the target resource, if any), then queue the next extraction for after the cooldown. A ship
+        able to survey surveys the waypoint first if there is no survey of the target resource.
         """
         if self.cargo_units < self.cargo_capacity:
-            self.extract(client)
+            survey = Survey.objects.best_for(self.nav.waypoint, target_resource)
+            if not survey and target_resource and self.can_survey:
+                self.survey(client)
+            else:
+                self.extract(client, survey)
 
         # Optional step: jettison any cargo that isn't the target_resource
         if target_resource:
-            cargo_type = CargoType.objects.get(symbol=target_resource)
-            for cargo in self.cargo.all().exclude(type=cargo_type):
+            for cargo in self.cargo.all().exclude(type__symbol=target_resource):
                 cargo.jettison(client)
 
         # Queue the next extraction, if required.
@@ -945,19 +1075,22 @@ class Ship(models.Model):
         queue.enqueue_at(arrival + timedelta(seconds=5), self.refuel, client)
 
     def behaviour_trade(self, client):
-        """Carry out 'trade randomly, forever' behaviour.
+        """Carry out 'trade, forever' behaviour.
         Options:
             - Sell cargo at the current location.
-            - Navigate elsewhere to an export market.
-            - Purchase cargo and navigate to the destination import market.
+            - Purchase cargo at the origin of the ship's assigned trade route, and navigate to its destination.
+            - Navigate to the origin of the ship's assigned trade route.
+            - If no route can be assigned, navigate elsewhere to an export market.
         """
+        # Check the current behaviour, in case it has been changed since this job was queued.
+        self.refresh_from_db(fields=["behaviour"])
         if not self.behaviour == "TRADE":
             return  # Abort
         else:
             LOGGER.info(f"{self} behaviour is TRADE")
 
-        # Refresh ship data.
-        self.refresh(client)
+        # Refresh ship data (from the fleet snapshot, if it is recent).
+        self.refresh(client, max_age=settings.FLEET_SNAPSHOT_MAX_AGE)
         # Reset flight mode to CRUISE.
         self.flight_mode(client, "CRUISE")
         # Dock & refuel the ship.
@@ -971,40 +1104,281 @@ class Ship(models.Model):
 
         if self.cargo.exists():
             LOGGER.info(f"{self} selling cargo at the current market")
-            # Sell the cargo
-            result = self.sell_cargo(client)
+            # Sell the cargo, at no less than the route's purchase price (if any).
+            min_price = self.trade_route.get("purchase_price") if self.trade_route else None
+            result = self.sell_cargo(client, min_price=min_price)
+            # The assigned trade route (if any) is complete; if the sale failed, the ship is assigned a new one once its cargo is sold.
+            save_changed(self, {"trade_route": None})
             if not result:
                 LOGGER.warning("Error during sell_cargo, aborting")
                 return
             # Queue up next trade attempt.
             queue.enqueue(self.behaviour_trade, client)
-        elif not self.nav.waypoint.market.get_best_export():
-            # Navigate to a random export market.
+            return
+
+        if not self.trade_route:
+            # Assign routes to every idle trading ship of the fleet at once, so that ships don't pile onto the same route.
+            from .trade import assign_trade_routes
+
+            self.trade_route = assign_trade_routes(self.agent).get(self.pk)
+            if not self.trade_route:
+                # A concurrent job might have assigned this ship a route.
+                self.refresh_from_db(fields=["trade_route"])
+
+        if not self.trade_route:
+            # No profitable route: navigate to a random export market.
             export_market_choices = self.get_export_markets()
             destination = random.choice(export_market_choices[0:10])[0]
             LOGGER.info(f"{self} navigating elsewhere to export market ({destination.symbol})")
             result = self.navigate(client, destination.symbol)
-            if not result:
-                LOGGER.warning("Error during navigate, aborting")
-                return
-            # Steps below are queued for after arrival.
-            arrival = self.nav.get_arrival()
-            queue.enqueue_at(arrival + timedelta(seconds=10), self.behaviour_trade, client)
-        else:
-            # Execute a trade from the current location.
-            trade_good_symbol, waypoint, ratio = self.nav.waypoint.market.get_best_export()
-            LOGGER.info(f"{self} purchasing {trade_good_symbol} to sell at {waypoint}")
-            result = self.purchase_cargo(client, trade_good_symbol)
+        elif self.nav.waypoint.symbol == self.trade_route["origin"]:
+            # Execute the assigned trade from the current location.
+            trade_good_symbol, destination = self.trade_route["trade_good"], self.trade_route["destination"]
+            LOGGER.info(f"{self} purchasing {trade_good_symbol} to sell at {destination}")
+            # Stop buying once the purchase price would leave less than the minimum margin at the destination's sell price.
+            destination_good = MarketTradeGood.objects.filter(
+                market__waypoint__symbol=destination, trade_good__symbol=trade_good_symbol, type__in=["IMPORT", "EXCHANGE"]
+            ).first()
+            max_price = destination_good.sell_price * (1 - settings.TRADE_MIN_MARGIN) if destination_good else None
+            result = self.purchase_cargo(client, trade_good_symbol, max_price=max_price)
             if not result:
                 LOGGER.warning("Error during purchase_cargo, aborting")
+                save_changed(self, {"trade_route": None})
                 return
-            result = self.navigate(client, waypoint.symbol)
-            if not result:
-                LOGGER.warning("Error during navigate, aborting")
-                return
-            # Queue up next trade attempt.
-            arrival = self.nav.get_arrival()
-            queue.enqueue_at(arrival + timedelta(seconds=10), self.behaviour_trade, client)
+            result = self.navigate(client, destination)
+        else:
+            LOGGER.info(f"{self} navigating to {self.trade_route['origin']} to trade {self.trade_route['trade_good']}")
+            result = self.navigate(client, self.trade_route["origin"])
+
+        if not result:
+            LOGGER.warning("Error during navigate, aborting")
+            return
+        # Queue up next trade attempt, after arrival.
+        arrival = self.nav.get_arrival()
+        queue.enqueue_at(arrival + timedelta(seconds=10), self.behaviour_trade, client)
+
+
+    def behaviour_contract(self, client):
+        """Carry out 'fulfil contracts, forever' behaviour: negotiate and accept profitable
+        contracts, then source, haul and deliver their goods (see `galaxy.contracts`).
+        """
+        # Check the current behaviour, in case it has been changed since this job was queued.
+        self.refresh_from_db(fields=["behaviour"])
+        if not self.behaviour == "CONTRACT":
+            return  # Abort
+        else:
+            LOGGER.info(f"{self} behaviour is CONTRACT")
+
+        from .contracts import contract_step
+
+        # Refresh ship data (from the fleet snapshot, if it is recent).
+        self.refresh(client, max_age=settings.FLEET_SNAPSHOT_MAX_AGE)
+        self.flight_mode(client, "CRUISE")
+        next_step = contract_step(self, client)
+        # Queue up the next step.
+        queue = get_queue("default")
+        if next_step > datetime.now(timezone.utc):
+            queue.enqueue_at(next_step + timedelta(seconds=5), self.behaviour_contract, client)
+        else:
+            queue.enqueue(self.behaviour_contract, client)
+
+    def behaviour_mine(self, client):
+        """Carry out 'mine, forever' behaviour: navigate to the nearest asteroid and join its mining
+        site, whose step job then coordinates the extractions of all its miners (see `galaxy.swarm`).
+        """
+        # Check the current behaviour, in case it has been changed since this job was queued.
+        self.refresh_from_db(fields=["behaviour"])
+        if not self.behaviour == "MINE":
+            return  # Abort
+        else:
+            LOGGER.info(f"{self} behaviour is MINE")
+
+        from .swarm import miner_step
+
+        # Refresh ship data (from the fleet snapshot, if it is recent).
+        self.refresh(client, max_age=settings.FLEET_SNAPSHOT_MAX_AGE)
+        self.flight_mode(client, "CRUISE")
+        next_step = miner_step(self, client)
+        if next_step:
+            # Queue up the next step, after arrival.
+            get_queue("default").enqueue_at(next_step + timedelta(seconds=5), self.behaviour_mine, client)
+
+    def behaviour_probe(self, client):
+        """Carry out 'observe markets, forever' behaviour: park at (or circulate between) the markets
+        of the probe's route, observing each market once its prices are stale (see `galaxy.probes`).
+        """
+        # Check the current behaviour, in case it has been changed since this job was queued.
+        self.refresh_from_db(fields=["behaviour", "probe_route"])
+        if not self.behaviour == "PROBE":
+            return  # Abort
+        else:
+            LOGGER.info(f"{self} behaviour is PROBE")
+
+        from .probes import probe_step
+
+        # Refresh ship data (from the fleet snapshot, if it is recent).
+        self.refresh(client, max_age=settings.FLEET_SNAPSHOT_MAX_AGE)
+        self.flight_mode(client, "CRUISE")
+        next_step = probe_step(self, client)
+        # Queue up the next step.
+        queue = get_queue("default")
+        if next_step > datetime.now(timezone.utc):
+            queue.enqueue_at(next_step + timedelta(seconds=5), self.behaviour_probe, client)
+        else:
+            queue.enqueue(self.behaviour_probe, client)
+
+    def behaviour_haul(self, client):
+        """Carry out 'haul, forever' behaviour: wait at a mining site to receive the miners' cargo,
+        then sell it at the best nearby import market (see `galaxy.swarm`).
+        """
+        # Check the current behaviour, in case it has been changed since this job was queued.
+        self.refresh_from_db(fields=["behaviour"])
+        if not self.behaviour == "HAUL":
+            return  # Abort
+        else:
+            LOGGER.info(f"{self} behaviour is HAUL")
+
+        from .swarm import hauler_step
+
+        # Refresh ship data (from the fleet snapshot, if it is recent).
+        self.refresh(client, max_age=settings.FLEET_SNAPSHOT_MAX_AGE)
+        self.flight_mode(client, "CRUISE")
+        next_step = hauler_step(self, client)
+        # Queue up the next step.
+        queue = get_queue("default")
+        if next_step > datetime.now(timezone.utc):
+            queue.enqueue_at(next_step + timedelta(seconds=5), self.behaviour_haul, client)
+        else:
+            queue.enqueue(self.behaviour_haul, client)
+
+
+class SurveyQuerySet(models.QuerySet):
+
+    def unexpired(self):
+        return self.filter(expiration__gt=datetime.now(timezone.utc))
+
+    def evict_expired(self):
+        """Delete expired surveys. Returns the number deleted."""
+        deleted, _ = self.filter(expiration__lte=datetime.now(timezone.utc)).delete()
+        return deleted
+
+    def best_for(self, waypoint, resource: str = None):
+        """Returns the best unexpired survey of the waypoint for extracting the nominated resource
+        (the survey in which the resource makes up the largest share of deposits, then the largest
+        and longest-lived), or None. Expired surveys of the waypoint are evicted first.
+        """
+        self.filter(waypoint=waypoint).evict_expired()
+        surveys = self.filter(waypoint=waypoint).unexpired()
+        if resource:
+            surveys = surveys.filter(deposits__contains=[resource])
+        return max(
+            surveys,
+            key=lambda survey: (survey.get_share(resource) if resource else 0, survey.size_rank, survey.expiration),
+            default=None,
+        )
+
+
+class Survey(models.Model):
+    """A survey of the resource deposits of a waypoint, used to target extraction."""
+    SIZE_CHOICES = (
+        ("SMALL", "small"),
+        ("MODERATE", "moderate"),
+        ("LARGE", "large"),
+    )
+    signature = models.CharField(max_length=64, unique=True)
+    waypoint = models.ForeignKey(Waypoint, related_name="surveys", on_delete=models.CASCADE)
+    # Deposit symbols; a symbol may be repeated, in proportion to its share of the deposits.
+    deposits = ArrayField(base_field=models.CharField(max_length=32))
+    size = models.CharField(max_length=32, choices=SIZE_CHOICES)
+    expiration = models.DateTimeField()
+
+    # API error codes returned when extracting with a survey which can no longer be used: invalid
+    # signature, expired, or exhausted.
+    UNUSABLE_ERROR_CODES = (4220, 4221, 4224)
+
+    objects = SurveyQuerySet.as_manager()
+
+    class Meta:
+        ordering = ("-expiration",)
+        indexes = [
+            models.Index(fields=["waypoint", "expiration"]),
+            GinIndex(fields=["deposits"]),
+        ]
+
+    def __str__(self):
+        return f"{self.waypoint.symbol} {self.get_size_display()} survey ({', '.join(sorted(set(self.deposits)))})"
+
+    @property
+    def size_rank(self):
+        return [choice[0] for choice in self.SIZE_CHOICES].index(self.size)
+
+    def get_share(self, resource: str):
+        """Returns the share of this survey's deposits which are the nominated resource."""
+        return self.deposits.count(resource) / len(self.deposits) if self.deposits else 0
+
+    def as_data(self):
+        """Returns this survey as API survey data, for extraction."""
+        return {
+            "signature": self.signature,
+            "symbol": self.waypoint.symbol,
+            "deposits": [{"symbol": deposit} for deposit in self.deposits],
+            "expiration": self.expiration.isoformat().replace("+00:00", "Z"),
+            "size": self.size,
+        }
+
+    @classmethod
+    def record(cls, surveys_data: list):
+        """Record surveys from passed-in survey data, evicting any expired surveys. Returns the list of surveys."""
+        cls.objects.evict_expired()
+        waypoints = Waypoint.objects.in_bulk({data["symbol"] for data in surveys_data}, field_name="symbol")
+        return cls.objects.bulk_create(
+            [
+                cls(
+                    signature=data["signature"],
+                    waypoint=waypoints[data["symbol"]],
+                    deposits=[deposit["symbol"] for deposit in data["deposits"]],
+                    size=data["size"],
+                    expiration=data["expiration"],
+                )
+                for data in surveys_data
+            ],
+            ignore_conflicts=True,
+        )
+
+
+class Extraction(models.Model):
+    """The yield of a single extraction, for yield statistics."""
+    timestamp = models.DateTimeField()
+    ship_symbol = models.CharField(max_length=32)
+    waypoint = models.ForeignKey(Waypoint, on_delete=models.CASCADE)
+    # Signature of the survey targeted by the extraction (surveys are deleted once expired or exhausted).
+    survey_signature = models.CharField(max_length=64, null=True, blank=True)
+    trade_symbol = models.CharField(max_length=64)
+    units = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ("-timestamp",)
+
+    def __str__(self):
+        return f"{self.ship_symbol} extracted {self.units} {self.trade_symbol} at {self.waypoint.symbol}"
+
+    @classmethod
+    def get_yield_stats(cls, waypoint=None, resource: str = None):
+        """Returns the number of extractions and mean units per extraction (of the nominated
+        resource, if any), for extractions with and without a survey:
+        {"surveyed": {"extractions": <int>, "mean_units": <float>}, "unsurveyed": {...}}
+        """
+        extractions = cls.objects.all()
+        if waypoint:
+            extractions = extractions.filter(waypoint=waypoint)
+        units = models.F("units")
+        if resource:
+            units = models.Case(models.When(trade_symbol=resource, then=models.F("units")), default=0)
+        stats = {}
+        for key, surveyed in [("surveyed", True), ("unsurveyed", False)]:
+            result = extractions.filter(survey_signature__isnull=not surveyed).aggregate(extractions=models.Count("pk"), mean_units=models.Avg(units))
+            stats[key] = {"extractions": result["extractions"], "mean_units": round(result["mean_units"] or 0, 2)}
+        return stats
 
 
 class CargoType(models.Model):
@@ -1030,38 +1404,48 @@ class ShipCargoItem(models.Model):
     def __str__(self):
         return f"{self.units} units of {self.type} ({self.ship.symbol})"
 
-    def sell(self, client, units: int = None):
-        """Sell this cargo at the ship's current location."""
+    def sell(self, client, units: int = None, min_price: int = None):
+        """Sell this cargo at the ship's current location, in tranches of at most the market's trade
+        volume. If `min_price` is supplied, stop once the predicted unit price of the next tranche
+        falls below it.
+        """
+        from .pricing import execute_order
+
         if not units:
             units = self.units
 
         if not self.ship.is_docked:
             self.ship.dock(client)
 
-        data = client.sell_cargo(self.ship.symbol, self.type.symbol, units)
-        if "error" in data:
-            LOGGER.error(data["error"]["message"])
-            return False
-
-        # data contains: agent, cargo, transaction
-        self.ship.update_cargo(data["cargo"])
-        # Update agent.
-        self.ship.agent.update(data["agent"])
-        # Create a transaction for the market
-        market = Market.objects.get(waypoint__symbol=data["transaction"]["waypointSymbol"])
-        trade_good = TradeGood.objects.get(symbol=data["transaction"]["tradeSymbol"])
-        transaction = Transaction.objects.create(
-            market=market,
-            ship_symbol=data["transaction"]["shipSymbol"],
-            trade_good=trade_good,
-            type=data["transaction"]["type"],
-            units=data["transaction"]["units"],
-            price_per_unit=data["transaction"]["pricePerUnit"],
-            total_price=data["transaction"]["totalPrice"],
-            timestamp=data["transaction"]["timestamp"],
+        # Ships sell to a market's imports and exchanged goods.
+        market_trade_goods = MarketTradeGood.objects.filter(
+            market__waypoint=self.ship.nav.waypoint, trade_good__symbol=self.type.symbol, type__in=["IMPORT", "EXCHANGE"]
         )
+        if not market_trade_goods.exists():
+            # Unknown market conditions (e.g. a first visit): fetch them, so the order is sliced by the trade volume.
+            client.invalidate("get_market", self.ship.nav.waypoint.symbol)
+            self.ship.nav.waypoint.refresh(client)
+        market_trade_good = market_trade_goods.first()
+
+        def sell(tranche):
+            data = client.sell_cargo(self.ship.symbol, self.type.symbol, tranche)
+            if "error" in data:
+                LOGGER.error(data["error"]["message"])
+                return False
+            # data contains: agent, cargo, transaction
+            self.ship.update_cargo(data["cargo"])
+            # Update agent.
+            self.ship.agent.update(data["agent"])
+            # Record a transaction for the market
+            return Transaction.record(data["transaction"])
+
+        transactions = execute_order(sell, units, market_trade_good, purchase=False, limit=min_price)
+        if not transactions:
+            return False
 
-        msg = f"Sold {transaction.units} units of {trade_good} for {transaction.total_price}"
+        units = sum(transaction.units for transaction in transactions)
+        total_price = sum(transaction.total_price for transaction in transactions)
+        msg = f"Sold {units} units of {transactions[0].trade_good} for {total_price} ({len(transactions)} tranches)"
         LOGGER.info(msg)
         return msg
 
@@ -1096,6 +1480,9 @@ class Contract(models.Model):
     expiration = models.DateTimeField()
     deadline_to_accept = models.DateTimeField()
 
+    # Non-API (local) fields.
+    plan = models.JSONField(null=True, blank=True, help_text="Fulfilment plan made by the contract planner")
+
     def __str__(self):
         return f"{self.type} ({self.faction})"
 
@@ -1103,17 +1490,110 @@ class Contract(models.Model):
     def required_goods(self):
         return '\n'.join([str(good) for good in self.deliver_goods.all()])
 
+    @classmethod
+    def from_data(cls, agent, data):
+        """Create or update a contract (and its goods to deliver) from passed-in contract data.
+        Returns (contract, created), or (None, False) if a new contract's destination waypoints are
+        not yet known.
+        """
+        symbols = {good["destinationSymbol"] for good in data["terms"]["deliver"]}
+        destinations = Waypoint.objects.in_bulk(symbols, field_name="symbol")
+        missing = symbols - set(destinations)
+        if missing and not cls.objects.filter(contract_id=data["id"]).exists():
+            LOGGER.warning(f"Skipping contract {data['id']}: unknown destination waypoint(s) {', '.join(sorted(missing))}")
+            return None, False
+
+        contract, created = cls.objects.get_or_create(
+            contract_id=data["id"],
+            defaults={
+                "agent": agent,
+                "faction": Faction.objects.get(symbol=data["factionSymbol"]),
+                "type": data["type"],
+                # Parse timestamps, so that the returned instance holds datetimes rather than strings.
+                "terms_deadline": parse_datetime(data["terms"]["deadline"]),
+                "terms_payment": data["terms"]["payment"],
+                "accepted": data["accepted"],
+                "fulfilled": data["fulfilled"],
+                "expiration": parse_datetime(data["expiration"]),
+                "deadline_to_accept": parse_datetime(data["deadlineToAccept"]),
+            },
+        )
+        if created:
+            ContractDeliverGood.objects.bulk_create(
+                [
+                    ContractDeliverGood(
+                        contract=contract,
+                        symbol=good["tradeSymbol"],
+                        destination=destinations[good["destinationSymbol"]],
+                        units_required=good["unitsRequired"],
+                        units_fulfilled=good["unitsFulfilled"],
+                    )
+                    for good in data["terms"]["deliver"]
+                ]
+            )
+        else:
+            contract.update(data)
+        return contract, created
+
     def accept(self, client):
+        """Accept this contract offer."""
         data = client.accept_contract(self.contract_id)
-        LOGGER.info(f"Contract {self} accepted")
+        if "error" in data:
+            LOGGER.error(data["error"]["message"])
+            return False
+
+        # data contains: agent, contract
+        self.agent.update(data["agent"])
         self.update(data["contract"])
+        msg = f"Contract {self} accepted"
+        LOGGER.info(msg)
+        return msg
+
+    def deliver(self, client, ship, trade_symbol: str, units: int):
+        """Deliver units of a trade good in the ship's cargo to this contract."""
+        if not ship.is_docked:
+            ship.dock(client)
+
+        data = client.deliver_cargo_to_contract(self.contract_id, ship.symbol, trade_symbol, units)
+        if "error" in data:
+            LOGGER.error(data["error"]["message"])
+            return False
+
+        # data contains: contract, cargo
+        ship.update_cargo(data["cargo"])
+        self.update(data["contract"])
+        msg = f"{ship} delivered {units} units of {trade_symbol} to contract {self}"
+        LOGGER.info(msg)
+        return msg
+
+    def fulfill(self, client):
+        """Fulfill this contract, once all its goods are delivered."""
+        data = client.fulfill_contract(self.contract_id)
+        if "error" in data:
+            LOGGER.error(data["error"]["message"])
+            return False
+
+        # data contains: agent, contract
+        self.agent.update(data["agent"])
+        self.update(data["contract"])
+        msg = f"Contract {self} fulfilled"
+        LOGGER.info(msg)
+        return msg
 
     def update(self, data):
+        """Update from passed-in contract data, including the units fulfilled of each good."""
+        units_fulfilled = {good["tradeSymbol"]: good["unitsFulfilled"] for good in data["terms"]["deliver"]}
+        for good in self.deliver_goods.all():
+            save_changed(good, {"units_fulfilled": units_fulfilled.get(good.symbol, good.units_fulfilled)})
         self.accepted = data["accepted"]
         self.fulfilled = data["fulfilled"]
         #LOGGER.info(f"{self} updated")
         self.save()
 
+    def get_remaining_goods(self):
+        """Returns the list of this contract's goods not yet fully delivered."""
+        return [good for good in self.deliver_goods.all() if good.units_fulfilled < good.units_required]
+
     @property
     def expiration_display(self):
         """Returns a human-readable string for the expiration timestamp"""
@@ -1158,92 +1638,103 @@ class Market(models.Model):
     @property
     @display(description="exports")
     def exports_display(self):
-        if not self.exports.exists():
-            return None
-        return ", ".join([exp.name for exp in self.exports.all()])
+        # Iterate the related manager only, so that prefetched trade goods are used.
+        names = [exp.name for exp in self.exports.all()]
+        return ", ".join(names) if names else None
 
     @property
     @display(description="imports")
     def imports_display(self):
-        if not self.imports.exists():
-            return None
-        return ", ".join([imp.name for imp in self.imports.all()])
+        names = [imp.name for imp in self.imports.all()]
+        return ", ".join(names) if names else None
 
     @property
     @display(description="exchange")
     def exchange_display(self):
-        if not self.exchange.exists():
-            return None
-        return ", ".join([ex.name for ex in self.exchange.all()])
+        names = [ex.name for ex in self.exchange.all()]
+        return ", ".join(names) if names else None
 
     def get_absolute_url(self):
         return reverse("market_detail", kwargs={"symbol": self.waypoint.symbol})
 
     def update(self, data):
-        """Update from passed-in data."""
-        for imp in data["imports"]:
-            trade_good, created = TradeGood.objects.get_or_create(
-                symbol=imp["symbol"],
-                name=imp["name"],
-                description=imp["description"],
-            )
-            self.imports.add(trade_good)
-
-        for exp in data["exports"]:
-            trade_good, created = TradeGood.objects.get_or_create(
-                symbol=exp["symbol"],
-                name=exp["name"],
-                description=exp["description"],
-            )
-            self.exports.add(trade_good)
-
-        # For any exports, call save() in order to make any new trade matches.
-        for mtg in self.markettradegood_set.filter(type="EXPORT"):
-            mtg.save()
-
-        for ex in data["exchange"]:
-            trade_good, created = TradeGood.objects.get_or_create(
-                symbol=ex["symbol"],
-                name=ex["name"],
-                description=ex["description"],
+        """Update from passed-in data, in a small constant number of queries."""
+        # Upsert every trade good listed by the market.
+        listed = {good["symbol"]: good for key in ["imports", "exports", "exchange"] for good in data[key]}
+        trade_goods = TradeGood.objects.bulk_create(
+            [TradeGood(symbol=good["symbol"], name=good["name"], description=good["description"]) for good in listed.values()],
+            update_conflicts=True,
+            unique_fields=["symbol"],
+            update_fields=["name", "description"],
+        )
+        trade_good_pks = {trade_good.symbol: trade_good.pk for trade_good in trade_goods}
+        # Transactions may reference trade goods which the market doesn't list.
+        other_symbols = {trans["tradeSymbol"] for trans in data.get("transactions", [])} - set(trade_good_pks)
+        if other_symbols:
+            trade_good_pks.update(TradeGood.objects.filter(symbol__in=other_symbols).values_list("symbol", "pk"))
+
+        for key in ["imports", "exports", "exchange"]:
+            through = getattr(Market, key).through
+            through.objects.bulk_create(
+                [through(market=self, tradegood_id=trade_good_pks[good["symbol"]]) for good in data[key]],
+                ignore_conflicts=True,
             )
-            self.exchange.add(trade_good)
 
         if "transactions" in data:
-            for trans in data["transactions"]:
-                # FIXME: assumption here is that the TradeGood already exists.
-                # Possibly adjust model to allow null name & description field.
-                trade_good = TradeGood.objects.get(symbol=trans["tradeSymbol"])
-                transaction, created = Transaction.objects.get_or_create(
-                    market=self,
-                    ship_symbol=trans["shipSymbol"],
-                    trade_good=trade_good,
-                    type=trans["type"],
-                    units=trans["units"],
-                    price_per_unit=trans["pricePerUnit"],
-                    total_price=trans["totalPrice"],
-                    timestamp=trans["timestamp"],
-                )
+            Transaction.objects.bulk_create(
+                [
+                    Transaction(
+                        market=self,
+                        ship_symbol=trans["shipSymbol"],
+                        trade_good_id=trade_good_pks[trans["tradeSymbol"]],
+                        type=trans["type"],
+                        units=trans["units"],
+                        price_per_unit=trans["pricePerUnit"],
+                        total_price=trans["totalPrice"],
+                        timestamp=trans["timestamp"],
+                    )
+                    for trans in data["transactions"]
+                    if trans["tradeSymbol"] in trade_good_pks
+                ],
+                ignore_conflicts=True,
+            )
 
         if "tradeGoods" in data:
-            for good in data["tradeGoods"]:
-                trade_good = TradeGood.objects.get(symbol=good["symbol"])
-                if not MarketTradeGood.objects.filter(market=self, trade_good=trade_good, type=good["type"]).exists():
-                    market_trade_good = MarketTradeGood(
+            observed = ["trade_volume", "supply", "activity", "purchase_price", "sell_price"]
+            existing = {
+                (values[0], values[1]): values[2:] for values in self.markettradegood_set.values_list("trade_good_id", "type", *observed)
+            }
+            market_trade_goods = MarketTradeGood.objects.bulk_create(
+                [
+                    MarketTradeGood(
                         market=self,
-                        trade_good=trade_good,
+                        trade_good_id=trade_good_pks[good["symbol"]],
                         type=good["type"],
+                        trade_volume=good["tradeVolume"],
+                        supply=good["supply"],
+                        activity=good.get("activity"),  # Type EXCHANGE goods have no activity
+                        purchase_price=good["purchasePrice"],
+                        sell_price=good["sellPrice"],
                     )
-                else:
-                    market_trade_good = MarketTradeGood.objects.get(market=self, trade_good=trade_good, type=good["type"])
-
-                market_trade_good.trade_volume = good["tradeVolume"]
-                market_trade_good.supply = good["supply"]
-                market_trade_good.purchase_price = good["purchasePrice"]
-                market_trade_good.sell_price = good["sellPrice"]
-                if "activity" in good:  # Type EXCHANGE goods have no activity
-                    market_trade_good.activity = good["activity"]
-                market_trade_good.save()
+                    for good in data["tradeGoods"]
+                ],
+                update_conflicts=True,
+                unique_fields=["market", "trade_good", "type"],
+                update_fields=["trade_volume", "supply", "activity", "purchase_price", "sell_price", "modified"],
+            )
+            created = [mtg for mtg in market_trade_goods if (mtg.trade_good_id, mtg.type) not in existing]
+            MarketTradeGood.add_trade_matches(created)
+            # Record the history of trade goods whose market conditions have changed.
+            now = datetime.now(timezone.utc)
+            MarketTradeGoodHistory.objects.bulk_create(
+                [
+                    MarketTradeGoodHistory(
+                        observed=now, market=self, trade_good_id=mtg.trade_good_id, type=mtg.type, **{f: getattr(mtg, f) for f in observed}
+                    )
+                    for mtg in market_trade_goods
+                    if existing.get((mtg.trade_good_id, mtg.type)) != tuple(getattr(mtg, f) for f in observed)
+                ]
+            )
 
         LOGGER.info(f"Market {self} updated")
 
@@ -1305,10 +1796,32 @@ class Transaction(models.Model):
 
     class Meta:
         ordering = ("-timestamp",)
+        constraints = [
+            # The natural key of a transaction, so that transactions seen repeatedly are recorded once.
+            models.UniqueConstraint(fields=["market", "ship_symbol", "trade_good", "type", "timestamp"], name="unique_transaction"),
+        ]
 
     def __str__(self):
         return f"{self.ship_symbol} {self.type.lower()} {self.units} {self.trade_good} for {self.total_price}"
 
+    @classmethod
+    def record(cls, data):
+        """Record a transaction from passed-in transaction data, unless it is already recorded.
+        Returns the (possibly unsaved) Transaction instance.
+        """
+        transaction = cls(
+            market=Market.objects.get(waypoint__symbol=data["waypointSymbol"]),
+            ship_symbol=data["shipSymbol"],
+            trade_good=TradeGood.objects.get(symbol=data.get("tradeSymbol", "FUEL")),
+            type=data["type"],
+            units=data["units"],
+            price_per_unit=data["pricePerUnit"],
+            total_price=data["totalPrice"],
+            timestamp=data["timestamp"],
+        )
+        cls.objects.bulk_create([transaction], ignore_conflicts=True)
+        return transaction
+
 
 class MarketTradeGood(models.Model):
     TYPE_CHOICES = (
@@ -1355,6 +1868,30 @@ class MarketTradeGood(models.Model):
             for good in MarketTradeGood.objects.filter(trade_good=self.trade_good, type="IMPORT"):
                 self.trade_matches.add(good)
 
+    @classmethod
+    def add_trade_matches(cls, market_trade_goods):
+        """Match the passed-in (saved) exports with every import of the same trade good, and
+        the passed-in imports with every export of the same trade good, in bulk.
+        """
+        market_trade_goods = [mtg for mtg in market_trade_goods if mtg.type in ["EXPORT", "IMPORT"]]
+        if not market_trade_goods:
+            return
+        counterparts = {}
+        for pk, trade_good_id, type in cls.objects.filter(
+            trade_good_id__in={mtg.trade_good_id for mtg in market_trade_goods}, type__in=["EXPORT", "IMPORT"]
+        ).values_list("pk", "trade_good_id", "type"):
+            counterparts.setdefault((trade_good_id, type), []).append(pk)
+
+        through = cls.trade_matches.through
+        matches = []
+        for mtg in market_trade_goods:
+            other_type = "IMPORT" if mtg.type == "EXPORT" else "EXPORT"
+            for pk in counterparts.get((mtg.trade_good_id, other_type), []):
+                # The relation is symmetrical: record both directions.
+                matches.append(through(from_markettradegood_id=mtg.pk, to_markettradegood_id=pk))
+                matches.append(through(from_markettradegood_id=pk, to_markettradegood_id=mtg.pk))
+        through.objects.bulk_create(matches, ignore_conflicts=True)
+
     @property
     @display(description="waypoint")
     def waypoint_display(self):
@@ -1400,6 +1937,27 @@ class MarketTradeGood(models.Model):
             return None
 
 
+class MarketTradeGoodHistory(models.Model):
+    """An observation of the market conditions of a trade good, recorded whenever they change."""
+    observed = models.DateTimeField()
+    market = models.ForeignKey(Market, on_delete=models.CASCADE)
+    trade_good = models.ForeignKey(TradeGood, on_delete=models.PROTECT)
+    type = models.CharField(max_length=32, choices=MarketTradeGood.TYPE_CHOICES)
+    trade_volume = models.PositiveIntegerField(default=0)
+    supply = models.CharField(max_length=32, choices=MarketTradeGood.SUPPLY_CHOICES)
+    activity = models.CharField(max_length=32, choices=MarketTradeGood.ACTIVITY_CHOICES, null=True, blank=True)
+    purchase_price = models.PositiveIntegerField(default=0)
+    sell_price = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ("-observed",)
+        verbose_name_plural = "market trade good history"
+        indexes = [models.Index(fields=["market", "trade_good", "observed"])]
+
+    def __str__(self):
+        return f"{self.market.waypoint.symbol} - {self.trade_good} ({self.type.lower()}) at {self.observed}"
+
+
 class Shipyard(models.Model):
     waypoint = models.OneToOneField(Waypoint, on_delete=models.PROTECT)
     ship_types = ArrayField(base_field=models.CharField(max_length=32), blank=True, null=True)
@@ -1409,83 +1967,131 @@ class Shipyard(models.Model):
         return self.waypoint.symbol
 
     def update(self, data):
-        """Update from passed-in data."""
-        self.ship_types = [t["type"] for t in data["shipTypes"]]
-        self.modifications_fee = data["modificationsFee"]
-        self.save()
+        """Update from passed-in data, in a small constant number of queries."""
+        save_changed(self, {"ship_types": [t["type"] for t in data["shipTypes"]], "modifications_fee": data["modificationsFee"]})
         if "transactions" in data:
-            for t in data["transactions"]:
-                transaction, created = ShipyardTransaction.objects.get_or_create(
-                    shipyard=self,
-                    ship_symbol=t["shipSymbol"],
-                    ship_type=t["shipType"],
-                    price=t["price"],
-                    agent_symbol=t["agentSymbol"],
-                    timestamp=t["timestamp"],
-                )
+            ShipyardTransaction.objects.bulk_create(
+                [
+                    ShipyardTransaction(
+                        shipyard=self,
+                        ship_symbol=t["shipSymbol"],
+                        ship_type=t["shipType"],
+                        price=t["price"],
+                        agent_symbol=t["agentSymbol"],
+                        timestamp=t["timestamp"],
+                    )
+                    for t in data["transactions"]
+                ],
+                ignore_conflicts=True,
+            )
         if "ships" in data:
-            for s in data["ships"]:
-                ship, created = ShipyardShip.objects.get_or_create(
-                    shipyard=self,
-                    type=s["type"],
-                    name=s["name"],
-                    description=s["description"],
-                )
-                ship.supply = s["supply"]
-                ship.activity = s["activity"] if "activity" in s else None
-                ship.purchase_price = s["purchasePrice"]
-                ship.frame = s["frame"]
-                ship.reactor = s["reactor"]
-                ship.engine = s["engine"]
-                ship.crew = s["crew"]
-                ship.save()
-
-                # Ship modules
-                ship.modules.clear()
-                for module_data in s["modules"]:
-                    if not ShipModule.objects.filter(symbol=module_data["symbol"]).exists():
-                        module = ShipModule(
-                            symbol=module_data["symbol"],
-                            name=module_data["name"],
-                            description=module_data["description"],
-                        )
-                        if "capacity" in module_data:
-                            module.capacity = module_data["capacity"]
-                        if "range" in module_data:
-                            module.range = module_data["range"]
-                        if "requirements" in module_data:
-                            module.requirements = module_data["requirements"]
-                        module.save()
-                    else:
-                        module = ShipModule.objects.get(symbol=module_data["symbol"])
-                    ship.modules.add(module)
-
-                # Update mounts
-                ship.mounts.clear()
-                for mount_data in s["mounts"]:
-                    if not ShipMount.objects.filter(symbol=mount_data["symbol"]).exists():
-                        mount = ShipMount(
-                            symbol=mount_data["symbol"],
-                            name=mount_data["name"],
-                            description=mount_data["description"],
-                        )
-                        if "strength" in mount_data:
-                            mount.strength = mount_data["strength"]
-                        if "deposits" in mount_data:
-                            mount.deposits = mount_data["deposits"]
-                        if "requirements" in mount_data:
-                            mount.requirements = mount_data["requirements"]
-                        mount.save()
-                    else:
-                        mount = ShipMount.objects.get(symbol=mount_data["symbol"])
-                    ship.mounts.add(mount)
+            specs = ShipSpec.intern(data["ships"])
+            ShipyardShip.objects.bulk_create(
+                [
+                    ShipyardShip(
+                        shipyard=self,
+                        type=s["type"],
+                        spec_id=specs[ShipSpec.get_hash(s)],
+                        supply=s["supply"],
+                        activity=s.get("activity"),
+                        purchase_price=s["purchasePrice"],
+                    )
+                    for s in data["ships"]
+                ],
+                update_conflicts=True,
+                unique_fields=["shipyard", "type"],
+                update_fields=["spec", "supply", "activity", "purchase_price"],
+            )
 
         LOGGER.info(f"{self} shipyard updated")
 
     @property
     @display(description="ships available")
     def ships_display(self):
-        return ", ".join(str(ship) for ship in self.ships.all())
+        return ", ".join(str(ship) for ship in self.ships.select_related("spec"))
+
+
+class ShipSpec(models.Model):
+    """A ship specification offered by shipyards, stored once however many shipyards list it."""
+    hash = models.CharField(max_length=64, unique=True, help_text="Hash of the specification content")
+    type = models.CharField(max_length=64, db_index=True)
+    name = models.CharField(max_length=128)
+    description = models.TextField(null=True, blank=True)
+    frame = models.JSONField(default=dict)
+    reactor = models.JSONField(default=dict)
+    engine = models.JSONField(default=dict)
+    modules = models.ManyToManyField(ShipModule, blank=True)
+    mounts = models.ManyToManyField(ShipMount, blank=True)
+    crew = models.JSONField(default=dict)
+
+    def __str__(self):
+        return self.name
+
+    @property
+    @display(description="mounts")
+    def mounts_display(self):
+        return ", ".join([str(mount) for mount in self.mounts.all()])
+
+    @property
+    @display(description="modules")
+    def modules_display(self):
+        return ", ".join([str(module) for module in self.modules.all()])
+
+    @staticmethod
+    def get_hash(data):
+        """Returns the content hash of passed-in shipyard ship data, excluding its market fields."""
+        spec = {key: data.get(key) for key in ["type", "name", "description", "frame", "reactor", "engine", "crew"]}
+        spec["modules"] = sorted(module["symbol"] for module in data["modules"])
+        spec["mounts"] = sorted(mount["symbol"] for mount in data["mounts"])
+        return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+    @classmethod
+    def intern(cls, ships_data: list):
+        """Ensure that a specification exists for each of the passed-in shipyard ship data.
+        Returns a dict of {hash: ShipSpec pk}.
+        """
+        ships_data = {cls.get_hash(data): data for data in ships_data}
+        specs = dict(cls.objects.filter(hash__in=ships_data).values_list("hash", "pk"))
+        new = {spec_hash: data for spec_hash, data in ships_data.items() if spec_hash not in specs}
+        if not new:
+            return specs
+
+        with atomic():
+            cls.objects.bulk_create(
+                [
+                    cls(
+                        hash=spec_hash,
+                        type=data["type"],
+                        name=data["name"],
+                        description=data.get("description"),
+                        frame=data["frame"],
+                        reactor=data["reactor"],
+                        engine=data["engine"],
+                        crew=data["crew"],
+                    )
+                    for spec_hash, data in new.items()
+                ],
+                ignore_conflicts=True,
+            )
+            specs = dict(cls.objects.filter(hash__in=ships_data).values_list("hash", "pk"))
+
+            for relation, model in [("modules", ShipModule), ("mounts", ShipMount)]:
+                items = {item["symbol"]: item for data in new.values() for item in data[relation]}
+                if not items:
+                    continue
+                model.objects.bulk_create([model.from_data(item) for item in items.values()], ignore_conflicts=True)
+                pks = dict(model.objects.filter(symbol__in=items).values_list("symbol", "pk"))
+                through = getattr(cls, relation).through
+                column = f"{model._meta.model_name}_id"
+                through.objects.bulk_create(
+                    [
+                        through(shipspec_id=specs[spec_hash], **{column: pks[item["symbol"]]})
+                        for spec_hash, data in new.items()
+                        for item in {item["symbol"]: item for item in data[relation]}.values()
+                    ],
+                    ignore_conflicts=True,
+                )
+        return specs
 
 
 class ShipyardShip(models.Model):
@@ -1505,20 +2111,16 @@ class ShipyardShip(models.Model):
     )
     shipyard = models.ForeignKey(Shipyard, related_name="ships", on_delete=models.PROTECT)
     type = models.CharField(max_length=64, choices=TYPE_CHOICES, db_index=True)
-    name = models.CharField(max_length=128)
-    description = models.TextField(null=True, blank=True)
+    spec = models.ForeignKey(ShipSpec, related_name="listings", on_delete=models.PROTECT)
     supply = models.CharField(max_length=32, null=True, blank=True)
     activity = models.CharField(max_length=32, null=True, blank=True)
     purchase_price = models.PositiveIntegerField(default=0)
-    frame = models.JSONField(default=dict)
-    reactor = models.JSONField(default=dict)
-    engine = models.JSONField(default=dict)
-    modules = models.ManyToManyField(ShipModule, blank=True)
-    mounts = models.ManyToManyField(ShipMount, blank=True)
-    crew = models.JSONField(default=dict)
+
+    class Meta:
+        unique_together = ("shipyard", "type")
 
     def __str__(self):
-        return self.name
+        return self.spec.name
 
 
 class ShipyardTransaction(models.Model):
@@ -1531,6 +2133,9 @@ class ShipyardTransaction(models.Model):
 
     class Meta:
         ordering = ("timestamp",)
+        constraints = [
+            models.UniqueConstraint(fields=["shipyard", "ship_type", "agent_symbol", "timestamp"], name="unique_shipyard_transaction"),
+        ]
 
     def __str__(self):
         return f"{self.shipyard} {self.ship_type} for {self.price}"
@@ -1544,3 +2149,44 @@ class Construction(models.Model):
     def update(self, data):
         # TODO
         pass
+
+
+class CrawlJob(models.Model):
+    """A checkpoint of a resumable crawl of API resources (see `galaxy.crawler`)."""
+    KIND_CHOICES = (
+        ("MARKET", "markets"),
+        ("SHIPYARD", "shipyards"),
+        ("SYSTEM", "systems"),
+    )
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+    kind = models.CharField(max_length=32, choices=KIND_CHOICES)
+    scope = models.CharField(max_length=32, blank=True, default="", help_text="System symbol, or blank for the whole galaxy")
+    pending = ArrayField(base_field=models.CharField(max_length=64), default=list, blank=True)
+    completed = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    finished = models.DateTimeField(null=True, blank=True)
+    # System crawls only: the number of pages of the system list recorded, out of the total systems.
+    page = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ("-created",)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} crawl ({self.scope or 'galaxy'}, {self.completed} completed, {len(self.pending)} pending)"
+
+
+class Epoch(models.Model):
+    """A period of the game between server resets (see `galaxy.reset`)."""
+    created = models.DateTimeField(auto_now_add=True)
+    reset_date = models.DateField(unique=True)
+    next_reset = models.DateTimeField(null=True, blank=True)
+    bootstrapped = models.DateTimeField(null=True, blank=True)
+    archive_schema = models.CharField(max_length=32, null=True, blank=True, help_text="Schema containing this epoch's archived data")
+
+    class Meta:
+        ordering = ("-reset_date",)
+
+    def __str__(self):
+        return f"Epoch {self.reset_date}"
@@ -0,0 +1,141 @@
+"""Market price impact model, and order slicing.
+
+Each trade moves the market price of a trade good: purchases raise it and sales lower it. The
+impact is expressed as the fractional price movement per `trade_volume` units traded, and is fitted
+from the recorded transaction history: the ratio of the unit prices of consecutive transactions of
+the same type on a market (within `FIT_WINDOW` of each other) gives one sample. Estimates are made
+per market trade good where there are enough samples, falling back to estimates by transaction type
+and the market's supply and activity at the time (from `MarketTradeGoodHistory`), then by type.
+
+`execute_order` uses the model to split a purchase or sale into tranches of at most the market's
+trade volume, stopping once the predicted marginal price crosses a limit.
+"""
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+import logging
+from statistics import median
+
+from django.core.cache import cache
+
+from .models import MarketTradeGood, MarketTradeGoodHistory, Transaction
+
+LOGGER = logging.getLogger("spacetraders")
+# Fractional price movement per trade_volume units traded, where no estimate is available.
+DEFAULT_IMPACT = 0.05
+MAX_IMPACT = 0.5
+# Transactions considered when fitting the model: the age of the oldest, and the maximum interval
+# between consecutive transactions.
+FIT_DAYS = 7
+FIT_WINDOW = timedelta(minutes=15)
+MIN_SAMPLES = 5
+# Lifetime (seconds) of the cached model.
+MODEL_TTL = 60 * 60
+
+
+def predict_price(price: float, units: float, trade_volume: int, impact: float, purchase: bool):
+    """Returns the unit price after `units` are traded at the passed-in unit price."""
+    factor = 1 + impact if purchase else 1 - impact
+    return price * factor ** (units / max(1, trade_volume))
+
+
+class PriceImpactModel:
+    """Price impact estimates, keyed by (market id, trade good id, transaction type), by
+    (type, supply, activity), by (type, supply) and by (type,).
+    """
+
+    def __init__(self, estimates: dict):
+        self.estimates = estimates
+
+    def estimate(self, market_id: int, trade_good_id: int, purchase: bool, supply: str = None, activity: str = None):
+        type = "PURCHASE" if purchase else "SELL"
+        for key in [(market_id, trade_good_id, type), (type, supply, activity), (type, supply), (type,)]:
+            if key in self.estimates:
+                return self.estimates[key]
+        return DEFAULT_IMPACT
+
+    def estimate_for(self, market_trade_good, purchase: bool):
+        """Returns the price impact estimate for the passed-in MarketTradeGood."""
+        mtg = market_trade_good
+        return self.estimate(mtg.market_id, mtg.trade_good_id, purchase, mtg.supply, mtg.activity)
+
+
+def fit_price_impact(days: int = FIT_DAYS):
+    """Fit a PriceImpactModel from the transactions of the past `days`."""
+    since = datetime.now(timezone.utc) - timedelta(days=days)
+    volumes = {(market_id, trade_good_id): volume for market_id, trade_good_id, volume in MarketTradeGood.objects.values_list(
+        "market_id", "trade_good_id", "trade_volume"
+    )}
+    # Market conditions over time, for each market trade good: {(market id, trade good id): ([observed], [(supply, activity)])}
+    conditions = defaultdict(lambda: ([], []))
+    for market_id, trade_good_id, observed, supply, activity in MarketTradeGoodHistory.objects.filter(
+        observed__gte=since - timedelta(days=1)
+    ).order_by("observed").values_list("market_id", "trade_good_id", "observed", "supply", "activity"):
+        conditions[(market_id, trade_good_id)][0].append(observed)
+        conditions[(market_id, trade_good_id)][1].append((supply, activity))
+
+    samples = defaultdict(list)
+    transactions = Transaction.objects.filter(timestamp__gte=since).order_by("market_id", "trade_good_id", "type", "timestamp")
+    for (market_id, trade_good_id, type), group in groupby(
+        transactions.values_list("market_id", "trade_good_id", "type", "units", "price_per_unit", "timestamp").iterator(),
+        key=lambda t: t[0:3],
+    ):
+        volume = volumes.get((market_id, trade_good_id))
+        times, states = conditions[(market_id, trade_good_id)]
+        previous = None
+        for transaction in group:
+            units, price, timestamp = transaction[3:]
+            if volume and previous and previous[1] and timestamp - previous[2] <= FIT_WINDOW:
+                ratio = (price / previous[1]) ** (volume / max(1, previous[0]))
+                impact = min(MAX_IMPACT, max(0, ratio - 1 if type == "PURCHASE" else 1 - ratio))
+                i = bisect_right(times, previous[2])
+                supply, activity = states[i - 1] if i else (None, None)
+                for key in [(market_id, trade_good_id, type), (type, supply, activity), (type, supply), (type,)]:
+                    samples[key].append(impact)
+            previous = (units, price, timestamp)
+
+    estimates = {key: median(values) for key, values in samples.items() if len(values) >= MIN_SAMPLES}
+    LOGGER.info(f"Fitted price impact model ({len(estimates)} estimates)")
+    return PriceImpactModel(estimates)
+
+
+def get_price_impact_model():
+    """Returns the (cached) price impact model."""
+    return cache.get_or_set("price_impact_model", fit_price_impact, MODEL_TTL)
+
+
+def slice_order(execute, units: int, trade_volume: int, price: float, impact: float, purchase: bool, limit: float = None):
+    """Execute an order for `units` in tranches of at most `trade_volume` units, by calling
+    `execute(units)` for each tranche; it should return the recorded Transaction, or False on error.
+    If `limit` is passed, stop once the predicted price of the next tranche is above it (purchases)
+    or below it (sales). Returns the list of transactions.
+    """
+    transactions = []
+    trade_volume = max(1, trade_volume)
+    while units > 0:
+        if limit is not None and (price > limit if purchase else price < limit):
+            LOGGER.info(f"Predicted price {round(price)} crossed limit {limit}, with {units} units remaining")
+            break
+        tranche = min(units, trade_volume)
+        transaction = execute(tranche)
+        if not transaction:
+            break
+        transactions.append(transaction)
+        units -= tranche
+        price = predict_price(transaction.price_per_unit, tranche, trade_volume, impact, purchase)
+    return transactions
+
+
+def execute_order(execute, units: int, market_trade_good=None, purchase: bool = True, limit: float = None):
+    """Execute an order on the market of the passed-in MarketTradeGood, in tranches (see
+    `slice_order`). If market conditions are unknown, execute the order in one call.
+    """
+    if not market_trade_good:
+        transaction = execute(units)
+        return [transaction] if transaction else []
+
+    mtg = market_trade_good
+    impact = get_price_impact_model().estimate_for(mtg, purchase)
+    price = mtg.purchase_price if purchase else mtg.sell_price
+    return slice_order(execute, units, mtg.trade_volume, price, impact, purchase, limit)
@@ -0,0 +1,181 @@
+"""A network of probes observing the markets of a system.
+
+Market trade good prices are only visible while a ship is present at the market. `plan_probe_routes`
+covers every market in a system with the agent's PROBE ships: the markets are ordered into a short
+closed tour (nearest neighbour, improved by 2-opt), and the tour is cut at its longest legs into one
+route per probe, minimising the total travel between markets. Probes are then assigned to routes
+(Hungarian algorithm) minimising their travel to reach them.
+
+Probes not needed to cover the markets idle, with an empty route. The routes are planned again
+whenever they no longer cover exactly the system's markets (a probe joins or leaves, or a market is
+charted). A probe whose route is a single market parks there; otherwise it travels to the stalest
+market on its route. Each probe observes its market once the market's observation is older than
+`settings.PROBE_STALE_AFTER` seconds: `Market.update` records the prices, and the history of any
+changed market conditions (`MarketTradeGoodHistory`).
+"""
+from datetime import datetime, timedelta, timezone
+import logging
+from math import dist
+
+from django.conf import settings
+from django.db.models import Max
+
+from .models import Market, Ship, Waypoint, navigate_time
+from .trade import hungarian
+
+LOGGER = logging.getLogger("spacetraders")
+# Seconds to wait before retrying a probe step which could not be carried out.
+PROBE_RETRY = 60 * 5
+
+
+def tour_length(tour: list, matrix: list):
+    return sum(matrix[tour[i - 1]][tour[i]] for i in range(len(tour)))
+
+
+def nearest_neighbour_tour(matrix: list, start: int = 0):
+    """Returns a closed tour (list of indices) of the points of the distance matrix, always moving
+    to the nearest unvisited point.
+    """
+    tour = [start]
+    unvisited = set(range(len(matrix))) - {start}
+    while unvisited:
+        current = tour[-1]
+        nearest = min(unvisited, key=lambda j: matrix[current][j])
+        tour.append(nearest)
+        unvisited.remove(nearest)
+    return tour
+
+
+def two_opt(tour: list, matrix: list):
+    """Improve a closed tour by reversing segments of it, while any reversal shortens it."""
+    tour = list(tour)
+    n = len(tour)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, n - 1):
+            for j in range(i + 1, n):
+                a, b = tour[i - 1], tour[i]
+                c, d = tour[j], tour[(j + 1) % n]
+                if matrix[a][c] + matrix[b][d] < matrix[a][b] + matrix[c][d] - 1e-9:
+                    tour[i:j + 1] = reversed(tour[i:j + 1])
+                    improved = True
+    return tour
+
+
+def split_tour(tour: list, matrix: list, k: int):
+    """Split a closed tour into `k` paths by removing its `k` longest legs. Returns a list of paths
+    (lists of indices).
+    """
+    n = len(tour)
+    if k >= n:
+        return [[i] for i in tour]
+    # Leg i joins tour[i] to tour[i + 1].
+    cuts = sorted(sorted(range(n), key=lambda i: matrix[tour[i]][tour[(i + 1) % n]], reverse=True)[0:k])
+    paths = []
+    for start, end in zip(cuts, cuts[1:] + [cuts[0] + n]):
+        paths.append([tour[i % n] for i in range(start + 1, end + 1)])
+    return paths
+
+
+def get_markets(system_id: int):
+    return list(Waypoint.objects.filter(system_id=system_id).with_trait("MARKETPLACE").order_by("symbol"))
+
+
+def plan_probe_routes(agent, system_id: int):
+    """Assign a route (a list of market waypoint symbols) to each of the agent's PROBE ships in the
+    nominated system, covering every market in the system. Probes not needed are assigned an empty
+    route, so that they idle rather than replanning. Returns a dict of {ship pk: route}.
+    """
+    probes = list(Ship.objects.filter(agent=agent, behaviour="PROBE", nav__system_id=system_id).select_related("nav__waypoint"))
+    markets = get_markets(system_id)
+    if not probes or not markets:
+        return {}
+
+    matrix = [[dist(a.coords, b.coords) for b in markets] for a in markets]
+    tour = two_opt(nearest_neighbour_tour(matrix), matrix)
+    paths = split_tour(tour, matrix, len(probes))
+    LOGGER.info(f"Planned {len(paths)} probe routes over {len(markets)} markets (tour length {round(tour_length(tour, matrix))})")
+
+    def travel(probe, path):
+        # Time for the probe to reach the nearer end of the path.
+        distance = min(dist(probe.nav.waypoint.coords, markets[i].coords) for i in (path[0], path[-1]))
+        return navigate_time(distance, "CRUISE", probe.engine["speed"]) or 0
+
+    # Rows: routes, columns: probes (there are at least as many probes as routes).
+    cost = [[travel(probe, path) for probe in probes] for path in paths]
+    routes = {}
+    for path, column in zip(paths, hungarian(cost)):
+        probe = probes[column]
+        routes[probe.pk] = [markets[i].symbol for i in path]
+    for probe in probes:
+        probe.probe_route = routes.get(probe.pk, [])
+        Ship.objects.filter(pk=probe.pk).update(probe_route=probe.probe_route)
+    return routes
+
+
+def needs_replan(agent, system_id: int):
+    """Returns True if the routes of the agent's PROBE ships in the nominated system no longer
+    exactly cover its markets: a probe has no route yet, a probe has left (been lost or retasked),
+    or a market has been charted or removed.
+    """
+    routes = Ship.objects.filter(agent=agent, behaviour="PROBE", nav__system_id=system_id).values_list("probe_route", flat=True)
+    if any(route is None for route in routes):
+        return True
+    covered = {symbol for route in routes for symbol in route}
+    return covered != {market.symbol for market in get_markets(system_id)}
+
+
+def get_observed(symbols: list):
+    """Returns a dict of {waypoint symbol: time of the latest observation of its market's trade goods, or None}."""
+    return dict(
+        Waypoint.objects.filter(symbol__in=symbols).annotate(observed=Max("market__markettradegood__modified")).values_list("symbol", "observed")
+    )
+
+
+def observe_market(ship, client):
+    """Fetch the market at the ship's waypoint, bypassing the API response cache, and record it."""
+    waypoint = ship.nav.waypoint
+    client.invalidate("get_market", waypoint.symbol)
+    data = client.get_market(waypoint.symbol)
+    market, created = Market.objects.get_or_create(waypoint=waypoint)
+    market.update(data)
+    LOGGER.info(f"{ship} observed market {waypoint.symbol}")
+
+
+def probe_step(ship, client):
+    """Carry out the next step of a probe: observe its market if stale, or navigate to the stalest
+    market on its route. Returns the datetime at which to run the following step.
+    """
+    now = datetime.now(timezone.utc)
+    retry = now + timedelta(seconds=PROBE_RETRY)
+    stale_after = timedelta(seconds=settings.PROBE_STALE_AFTER)
+    if ship.probe_route is None or needs_replan(ship.agent, ship.nav.system_id):
+        ship.probe_route = plan_probe_routes(ship.agent, ship.nav.system_id).get(ship.pk, [])
+    if not ship.probe_route:
+        # Not needed to cover the system's markets (or there are none): idle.
+        LOGGER.info(f"{ship} has no markets to observe")
+        return retry
+
+    waypoint = ship.nav.waypoint
+    observed = get_observed(ship.probe_route)
+    if waypoint.symbol in observed and (not observed[waypoint.symbol] or now - observed[waypoint.symbol] >= stale_after):
+        observe_market(ship, client)
+        observed[waypoint.symbol] = now
+
+    # Markets which have never been observed are the stalest.
+    oldest = datetime.min.replace(tzinfo=timezone.utc)
+    symbol = min(ship.probe_route, key=lambda symbol: observed.get(symbol) or oldest)
+    due = (observed.get(symbol) or oldest) + stale_after
+    if symbol == waypoint.symbol:
+        # Parked: poll the market again once its observation is stale.
+        return due
+    destination = Waypoint.objects.get(symbol=symbol)
+    travel = timedelta(seconds=navigate_time(dist(waypoint.coords, destination.coords), "CRUISE", ship.engine["speed"]) or 0)
+    if due - travel > now:
+        # Leave so as to arrive as the market becomes stale.
+        return due - travel
+    LOGGER.info(f"{ship} navigating to observe market {symbol}")
+    if not ship.navigate(client, symbol):
+        return retry
+    return ship.nav.get_arrival()
@@ -0,0 +1,255 @@
+"""Detection of, and recovery from, the periodic server reset.
+
+The watcher (`check_for_reset`) polls the server status for the date of the last reset. When that
+changes, the fleet is quiesced (behaviours cleared and queued jobs cancelled), the previous epoch's
+game data is copied into an archive schema and cleared, and the bootstrap pipeline is queued: each
+agent is registered afresh and its factions, fleet, contracts, home markets and shipyards are
+populated, after which a crawl of the rest of the galaxy continues in the background.
+"""
+from datetime import date, datetime, timedelta, timezone
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django_rq.queues import get_queue
+from rq.job import Job
+
+from spacetraders import Client, get_client
+
+from .crawler import crawl, crawl_systems
+from .fleet import schedule_fleet_sync, sync_fleet
+from .models import (
+    Agent,
+    Chart,
+    Construction,
+    Contract,
+    ContractDeliverGood,
+    CrawlJob,
+    Epoch,
+    Extraction,
+    Faction,
+    Market,
+    MarketTradeGood,
+    MarketTradeGoodHistory,
+    Ship,
+    ShipCargoItem,
+    ShipNav,
+    Shipyard,
+    ShipyardShip,
+    ShipyardTransaction,
+    Survey,
+    System,
+    Transaction,
+    Waypoint,
+)
+from .spatial import invalidate_index
+from .tiles import clear_tiles
+
+LOGGER = logging.getLogger("spacetraders")
+# Minimum seconds between checks of the server status (e.g. while a scheduled reset is overdue).
+MIN_CHECK_INTERVAL = 60
+RESET_WATCH_KEY = "reset_watch"
+# Prefixes of the cache keys holding game data of the current epoch (API responses, spatial index
+# versions, the fitted price impact model and mining site locks), which are cleared by a reset.
+RESET_CACHE_PREFIXES = ["api:", "spatial_index:", "price_impact_model", "swarm_site:"]
+
+# Game data regenerated by each server reset, in deletion order (referencing tables first).
+# Static catalogues (trade goods, traits, ship modules & mounts, ship specs) are kept.
+RESET_MODELS = [
+    ShipCargoItem,
+    Ship.modules.through,
+    Ship.mounts.through,
+    Ship,
+    ShipNav,
+    ContractDeliverGood,
+    Contract,
+    Transaction,
+    MarketTradeGoodHistory,
+    MarketTradeGood.trade_matches.through,
+    MarketTradeGood,
+    Market.imports.through,
+    Market.exports.through,
+    Market.exchange.through,
+    Market,
+    ShipyardTransaction,
+    ShipyardShip,
+    Shipyard,
+    Construction,
+    Chart,
+    CrawlJob,
+    Extraction,
+    Survey,
+    Waypoint.traits.through,
+    Waypoint.modifiers.through,
+    Waypoint,
+    System.factions.through,
+    Faction.traits.through,
+    Faction,
+    System,
+]
+
+
+def check_for_reset(client=None, interval: int = None, chain: str = None):
+    """Compare the server's last reset date with the current epoch, and begin recovery if the
+    server has been reset. Then queue the next check after `interval` seconds (default
+    `settings.RESET_CHECK_INTERVAL`), or just after the next scheduled reset if that is sooner.
+    There is a single recurring chain of checks, identified by `chain` and held by a lock in the
+    cache: starting a chain (with no `chain`) while another is running checks once, without queuing.
+    """
+    client = client or get_client()
+    interval = interval or settings.RESET_CHECK_INTERVAL
+    timeout = interval * 2 + 60
+    if not chain:
+        chain = uuid.uuid4().hex
+        if not cache.add(RESET_WATCH_KEY, chain, timeout):
+            LOGGER.info("Reset watcher is already scheduled")
+            chain = None
+    elif cache.get(RESET_WATCH_KEY) not in (None, chain):
+        return  # Superseded by another chain.
+    if chain:
+        cache.set(RESET_WATCH_KEY, chain, timeout)
+
+    now = datetime.now(timezone.utc)
+    next_check = now + timedelta(seconds=interval)
+    try:
+        status = client.get_server_status()
+        reset_date = date.fromisoformat(status["resetDate"])
+        next_reset = datetime.fromisoformat(status["serverResets"]["next"])
+        epoch = Epoch.objects.first()
+
+        if not epoch:
+            # First check: record the current epoch.
+            Epoch.objects.create(reset_date=reset_date, next_reset=next_reset, bootstrapped=datetime.now(timezone.utc))
+        elif epoch.reset_date < reset_date:
+            LOGGER.warning(f"Server reset detected (previous reset {epoch.reset_date}, current reset {reset_date})")
+            reset(reset_date, next_reset)
+        elif epoch.next_reset != next_reset:
+            epoch.next_reset = next_reset
+            epoch.save()
+
+        # The next reset may be overdue (resets can run late): don't check more often than the minimum interval.
+        next_check = max(min(next_check, next_reset + timedelta(seconds=30)), now + timedelta(seconds=MIN_CHECK_INTERVAL))
+    finally:
+        if chain:
+            get_queue("default").enqueue_at(next_check, check_for_reset, None, interval, chain)
+
+
+def is_behaviour_job(job):
+    """Returns True if the job carries out a ship action or behaviour (a Ship method), or a mining site step."""
+    try:
+        return isinstance(job.instance, Ship) or job.func_name == "galaxy.swarm.site_step"
+    except Exception:
+        LOGGER.warning(f"Unable to load job {job.id}")
+        return False
+
+
+def quiesce_fleet():
+    """Stop all ship behaviours (clearing assigned trade and probe routes) and cancel every queued
+    and scheduled ship job. Other jobs (e.g. fleet sync and the reset watcher) are left queued.
+    """
+    Ship.objects.update(behaviour=None, trade_route=None, probe_route=None)
+    queue = get_queue("default")
+    job_ids = queue.get_job_ids() + queue.scheduled_job_registry.get_job_ids()
+    cancelled = 0
+    for job in Job.fetch_many(job_ids, connection=queue.connection):
+        if job and is_behaviour_job(job):
+            job.delete()
+            cancelled += 1
+    LOGGER.info(f"Fleet quiesced ({cancelled} jobs cancelled)")
+
+
+def clear_cache(prefixes: list = RESET_CACHE_PREFIXES):
+    """Delete this application's cache keys having the nominated prefixes."""
+    client = cache._cache.get_client(write=True)
+    for prefix in prefixes:
+        keys = list(client.scan_iter(match=cache.make_key(f"{prefix}*")))
+        if keys:
+            client.delete(*keys)
+
+
+def archive_epoch(epoch):
+    """Copy the game data of the nominated epoch into an archive schema, then delete it."""
+    schema = f"epoch_{epoch.reset_date:%Y%m%d}"
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+        for model in RESET_MODELS:
+            table = model._meta.db_table
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS {schema}.{table} AS TABLE {table}")
+        Agent.objects.update(headquarters=None, starting_faction=None)
+        for model in RESET_MODELS:
+            cursor.execute(f"DELETE FROM {model._meta.db_table}")
+    epoch.archive_schema = schema
+    epoch.save()
+    LOGGER.info(f"Archived {epoch} to schema {schema}")
+
+
+def reset(reset_date: date, next_reset: datetime):
+    """Recover from a server reset: quiesce the fleet, archive the previous epoch and queue the bootstrap."""
+    # Record each agent's starting faction before factions are cleared, to register again with it.
+    factions = dict(Agent.objects.filter(starting_faction__isnull=False).values_list("pk", "starting_faction__symbol"))
+
+    quiesce_fleet()
+    archive_epoch(Epoch.objects.first())
+    # Clear cached API responses, map tiles and spatial indexes of the previous epoch.
+    clear_cache()
+    clear_tiles()
+    invalidate_index()
+
+    epoch = Epoch.objects.create(reset_date=reset_date, next_reset=next_reset)
+    get_queue("default").enqueue(bootstrap, epoch.pk, factions, job_timeout=60 * 60)
+
+
+def bootstrap_agent(agent, faction: str = None):
+    """Register an agent afresh after a reset, and populate its fleet and home system. Returns the client."""
+    account_client = Client(settings.ACCOUNT_TOKEN)
+    data = account_client.register_agent(agent.symbol, agent.email, faction=faction or "COSMIC", write_file=False)
+    agent.account_id = data["agent"]["accountId"]
+    agent.bearer_token = data["token"]
+    agent.save()
+
+    from .utils import populate_contracts, populate_factions, set_agent
+
+    client = agent.get_client()
+    populate_factions(client)
+    # Sync the fleet first: this populates the home system, and so the agent's headquarters waypoint.
+    sync_fleet(agent, client)
+    set_agent(client)
+    populate_contracts(client)
+    # Markets and shipyards of the home system, so that ships can begin trading.
+    for system_symbol in set(agent.ships.values_list("nav__system__symbol", flat=True)):
+        crawl(client, "MARKET", system_symbol)
+        crawl(client, "SHIPYARD", system_symbol)
+    return client
+
+
+def bootstrap(epoch_id: int, factions: dict = None):
+    """Bootstrap the database after a server reset, and restart fleet sync and ship behaviours."""
+    if not settings.ACCOUNT_TOKEN:
+        LOGGER.error("ACCOUNT_TOKEN is not set; agents must be registered manually after the server reset")
+        return
+
+    factions = factions or {}
+    queue = get_queue("default")
+    client = None
+    for agent in Agent.objects.filter(bearer_token__isnull=False):
+        client = bootstrap_agent(agent, factions.get(agent.pk))
+        # The fleet has just been synced; resume the regular sync after the usual interval.
+        queue.enqueue_in(timedelta(seconds=settings.FLEET_SYNC_INTERVAL), schedule_fleet_sync, agent.pk)
+        for ship in agent.ships.all():
+            behaviour = settings.RESET_BEHAVIOURS.get(ship.registration["role"])
+            if behaviour in Ship.BEHAVIOUR_METHODS:
+                ship.behaviour = behaviour
+                ship.save()
+                queue.enqueue(getattr(ship, Ship.BEHAVIOUR_METHODS[behaviour]), client)
+        LOGGER.info(f"Bootstrapped {agent}")
+
+    epoch = Epoch.objects.get(pk=epoch_id)
+    epoch.bootstrapped = datetime.now(timezone.utc)
+    epoch.save()
+    LOGGER.info(f"Bootstrapped {epoch}")
+
+    # Crawl the rest of the galaxy in the background.
+    if client:
+        queue.enqueue(crawl_systems, client, job_timeout=-1)
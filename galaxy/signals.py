@@ -0,0 +1,81 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .events import publish_event
+from .models import Agent, Ship, ShipNav, System, Waypoint
+from .spatial import invalidate_index
+from .tiles import invalidate_tiles
+
+
+@receiver(post_save, sender=Agent)
+def agent_saved(sender, instance, **kwargs):
+    fields = {"credits": instance.credits}
+    transaction.on_commit(lambda: publish_event(instance.pk, **fields))
+
+
+def ship_event_fields(ship):
+    """Returns the displayed fields of a ship, for a fleet event."""
+    return {
+        "fuel": f"{ship.fuel.get('current')} / {ship.fuel.get('capacity')}",
+        "cargo": f"{ship.cargo_units} / {ship.cargo_capacity}",
+        "cooldown": ship.cooldown_display() or "none",
+    }
+
+
+@receiver(post_save, sender=Ship)
+def ship_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= {"modified", "synced"}:  # Refreshed with no changes.
+        return
+    fields = ship_event_fields(instance)
+    transaction.on_commit(lambda: publish_event(instance.agent_id, instance.symbol, **fields))
+
+
+@receiver(post_save, sender=ShipNav)
+def shipnav_saved(sender, instance, **kwargs):
+    ship = Ship.objects.filter(nav=instance).values("symbol", "agent_id").first()
+    if not ship:  # New ShipNav instance, saved prior to the ship.
+        return
+    fields = {"nav": str(instance)}
+    transaction.on_commit(lambda: publish_event(ship["agent_id"], ship["symbol"], **fields))
+
+
+@receiver(post_save, sender=System)
+@receiver(post_delete, sender=System)
+def system_changed(sender, instance, signal, **kwargs):
+    # Systems are saved on every refresh: only invalidate the map and index when a system is
+    # created, deleted or moved.
+    loaded = instance.get_loaded_location()
+    if not instance.location_changed() and signal is post_save:
+        return
+    if loaded and loaded[1:] != instance.coords:
+        invalidate_tiles(*loaded[1:])
+    invalidate_tiles(instance.x, instance.y)
+    invalidate_index()
+
+
+@receiver(post_save, sender=Waypoint)
+@receiver(post_delete, sender=Waypoint)
+def waypoint_changed(sender, instance, signal, **kwargs):
+    # Waypoints are saved on every refresh: only invalidate the system's index when a waypoint is
+    # created, deleted, moved or changes type.
+    if not instance.location_changed() and signal is post_save:
+        return
+    invalidate_index(instance.system_id)
+
+
+@receiver(m2m_changed, sender=Waypoint.traits.through)
+def waypoint_traits_changed(sender, instance, action, reverse, pk_set=None, **kwargs):
+    # Adding traits which a waypoint already has still sends the signal, with an empty pk_set.
+    if action in ["post_add", "post_remove"] and not pk_set:
+        return
+    if action not in ["post_add", "post_remove", "post_clear"]:
+        return
+
+    if reverse:  # Changed from the WaypointTrait side.
+        waypoints = Waypoint.objects.filter(pk__in=pk_set) if pk_set else Waypoint.objects.filter(trait_symbols__contains=[instance.symbol])
+    else:
+        waypoints = [instance]
+    for waypoint in waypoints:
+        waypoint.update_trait_symbols()
+        invalidate_index(waypoint.system_id)
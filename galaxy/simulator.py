@@ -0,0 +1,417 @@
+"""Offline, deterministic discrete-event simulation of ship behaviours, for backtesting strategies.
+
+A `Simulation` loads a snapshot of one system from the database (its waypoints, market trade goods,
+open contracts and the agent's ships there) into memory, and then runs a strategy for each ship
+against a simulated clock. Pending ship turns are kept in a heap ordered by simulated time, so a day
+of game time runs in a fraction of a second without touching the API or the database.
+
+The model:
+- Travel time and fuel use the same formulae as `ShipNav.get_navigate_time` and `get_fuel_cost`.
+- Each `trade_volume` units traded moves the price by the impact estimated by the price impact
+  model (`galaxy.pricing`), and prices recover towards their snapshot value with a half-life of
+  `PRICE_RECOVERY`.
+- Extraction places the ship in cooldown for `EXTRACT_COOLDOWN` seconds (see `galaxy.extraction`).
+- Contract deliveries are paid on fulfilment.
+
+Results are reported as credits earned per hour, per ship.
+"""
+from heapq import heappop, heappush
+import logging
+from math import ceil, dist
+import random
+
+from .extraction import EXTRACT_COOLDOWN, EXTRACT_UNITS, EXTRACTION_YIELDS
+from .models import Contract, MarketTradeGood, Ship, Waypoint, fuel_cost, navigate_time
+from .pricing import DEFAULT_IMPACT, get_price_impact_model, predict_price
+
+LOGGER = logging.getLogger("spacetraders")
+# Half-life (seconds) of the recovery of a market price towards its snapshot value.
+PRICE_RECOVERY = 30 * 60
+# Seconds between consecutive actions of a ship, and between turns of an idle ship.
+ACTION_DELAY = 10
+IDLE_DELAY = 5 * 60
+# Ship fuel units per market unit of FUEL.
+FUEL_UNITS = 100
+# Default strategy for each ship behaviour.
+BEHAVIOUR_STRATEGIES = {
+    "TRADE": "trade",
+    "MINE": "mine",
+}
+
+
+class SimGood:
+    """A trade good listed by a simulated market."""
+
+    def __init__(self, symbol: str, type: str, trade_volume: int, purchase_price: int, sell_price: int, impacts: tuple = None):
+        self.symbol = symbol
+        self.type = type
+        self.trade_volume = max(1, trade_volume)
+        self.base_prices = (purchase_price, sell_price)
+        self.purchase_price = purchase_price
+        self.sell_price = sell_price
+        # Price impact of (purchases, sales).
+        self.impacts = impacts or (DEFAULT_IMPACT, DEFAULT_IMPACT)
+        self.updated = 0
+
+    def recover(self, now: float):
+        """Move prices towards their snapshot values, for the time elapsed since the last trade."""
+        decay = 0.5 ** ((now - self.updated) / PRICE_RECOVERY)
+        self.purchase_price = self.base_prices[0] + (self.purchase_price - self.base_prices[0]) * decay
+        self.sell_price = self.base_prices[1] + (self.sell_price - self.base_prices[1]) * decay
+        self.updated = now
+
+    def trade(self, now: float, units: int, purchase: bool):
+        """Trade the nominated units in lots of trade_volume, moving the price after each lot in
+        proportion to its size.
+        Returns the total price.
+        """
+        self.recover(now)
+        total = 0
+        while units > 0:
+            lot = min(units, self.trade_volume)
+            total += lot * round(self.purchase_price if purchase else self.sell_price)
+            # Purchases deplete supply, raising prices; sales do the reverse.
+            factor = predict_price(1, lot, self.trade_volume, self.impacts[0 if purchase else 1], purchase)
+            self.purchase_price *= factor
+            self.sell_price *= factor
+            units -= lot
+        return total
+
+
+class SimWaypoint:
+    def __init__(self, symbol: str, x: int, y: int, traits):
+        self.symbol = symbol
+        self.coords = (x, y)
+        self.traits = frozenset(traits)
+        self.goods = {}
+
+    def __str__(self):
+        return self.symbol
+
+    @property
+    def deposits(self):
+        return [trait for trait in EXTRACTION_YIELDS if trait in self.traits]
+
+
+class SimContract:
+    def __init__(self, contract_id: str, payment: int):
+        self.contract_id = contract_id
+        self.payment = payment
+        # {trade good symbol: [destination waypoint symbol, units required, units fulfilled]}
+        self.deliveries = {}
+        self.fulfilled = False
+
+    def remaining(self):
+        """Returns a list of (trade good symbol, destination symbol, units) yet to be delivered."""
+        return [(symbol, dest, required - fulfilled) for symbol, (dest, required, fulfilled) in self.deliveries.items() if fulfilled < required]
+
+
+class SimShip:
+    def __init__(self, symbol: str, waypoint, speed: int, fuel: int, fuel_capacity: int, cargo_capacity: int, strategy: str):
+        self.symbol = symbol
+        self.waypoint = waypoint
+        self.speed = speed
+        self.fuel = fuel
+        self.fuel_capacity = fuel_capacity
+        self.cargo = {}
+        self.cargo_capacity = cargo_capacity
+        self.strategy = strategy
+        self.busy_until = 0
+        self.credits = 0
+        self.trips = 0
+        self.units_traded = 0
+
+    def __str__(self):
+        return self.symbol
+
+    @property
+    def cargo_units(self):
+        return sum(self.cargo.values())
+
+    def get_available_capacity(self):
+        return self.cargo_capacity - self.cargo_units
+
+
+class Simulation:
+    """A simulation of the ships in one system, each running a strategy from `STRATEGIES`."""
+
+    def __init__(self, seed: int = 0):
+        self.rng = random.Random(seed)
+        self.now = 0
+        self.waypoints = {}
+        self.ships = []
+        self.contracts = []
+        self.events = []
+        self.sequence = 0
+
+    @classmethod
+    def from_database(cls, system_symbol: str, agent=None, strategy: str = None, seed: int = 0):
+        """Load a simulation of the nominated system from the database. Ships run `strategy`, or
+        the strategy matching their behaviour (trading, if they have none).
+        """
+        sim = cls(seed)
+        for symbol, x, y, traits in Waypoint.objects.filter(system__symbol=system_symbol).order_by("symbol").values_list(
+            "symbol", "x", "y", "trait_symbols"
+        ):
+            sim.waypoints[symbol] = SimWaypoint(symbol, x, y, traits)
+
+        model = get_price_impact_model()
+        goods = MarketTradeGood.objects.filter(market__waypoint__system__symbol=system_symbol).select_related("market__waypoint", "trade_good")
+        for mtg in goods.order_by("pk"):
+            impacts = (model.estimate_for(mtg, purchase=True), model.estimate_for(mtg, purchase=False))
+            sim.waypoints[mtg.market.waypoint.symbol].goods[mtg.trade_good.symbol] = SimGood(
+                mtg.trade_good.symbol, mtg.type, mtg.trade_volume, mtg.purchase_price, mtg.sell_price, impacts
+            )
+
+        ships = Ship.objects.filter(nav__system__symbol=system_symbol).select_related("nav__waypoint").prefetch_related("cargo__type")
+        contracts = Contract.objects.filter(accepted=True, fulfilled=False).prefetch_related("deliver_goods__destination")
+        if agent:
+            ships = ships.filter(agent=agent)
+            contracts = contracts.filter(agent=agent)
+        for ship in ships.order_by("symbol"):
+            if ship.nav.waypoint.symbol not in sim.waypoints:
+                LOGGER.warning(f"Skipping {ship}: waypoint {ship.nav.waypoint.symbol} is not a recorded waypoint of {system_symbol}")
+                continue
+            sim_ship = SimShip(
+                ship.symbol,
+                sim.waypoints[ship.nav.waypoint.symbol],
+                ship.engine["speed"],
+                ship.fuel["current"],
+                ship.fuel["capacity"],
+                ship.cargo_capacity,
+                strategy or BEHAVIOUR_STRATEGIES.get(ship.behaviour, "trade"),
+            )
+            sim_ship.cargo = {item.type.symbol: item.units for item in ship.cargo.all()}
+            sim.ships.append(sim_ship)
+
+        for contract in contracts.order_by("deadline_to_accept"):
+            sim_contract = SimContract(contract.contract_id, contract.terms_payment.get("onFulfilled", 0))
+            for good in contract.deliver_goods.all():
+                sim_contract.deliveries[good.symbol] = [good.destination.symbol, good.units_required, good.units_fulfilled]
+            # Only contracts deliverable within the system can be simulated.
+            if all(dest in sim.waypoints for dest, required, fulfilled in sim_contract.deliveries.values()):
+                sim.contracts.append(sim_contract)
+
+        return sim
+
+    def schedule(self, time: float, ship):
+        # The sequence number breaks ties in time, keeping the order of events deterministic.
+        self.sequence += 1
+        heappush(self.events, (time, self.sequence, ship))
+
+    def run(self, hours: float):
+        """Run the simulation for the nominated number of hours of game time. Returns the results."""
+        end = hours * 60 * 60
+        for ship in self.ships:
+            self.schedule(self.now, ship)
+        while self.events and self.events[0][0] <= end:
+            self.now, sequence, ship = heappop(self.events)
+            acted = STRATEGIES[ship.strategy](self, ship)
+            self.schedule(max(ship.busy_until, self.now + (ACTION_DELAY if acted else IDLE_DELAY)), ship)
+        self.now = end
+        self.events = []
+        return self.results(hours)
+
+    def results(self, hours: float):
+        """Returns a list of dicts of the results for each ship, over the nominated hours."""
+        return [
+            {
+                "ship": ship.symbol,
+                "strategy": ship.strategy,
+                "credits": ship.credits,
+                "credits_per_hour": round(ship.credits / hours) if hours else 0,
+                "trips": ship.trips,
+                "units_traded": ship.units_traded,
+            }
+            for ship in self.ships
+        ]
+
+    # Ship actions.
+
+    def navigate(self, ship, destination):
+        """Navigate the ship to the destination waypoint, drifting if it has insufficient fuel to cruise."""
+        distance = dist(ship.waypoint.coords, destination.coords)
+        mode = "CRUISE"
+        if ship.fuel_capacity and fuel_cost(distance, mode) >= ship.fuel:
+            mode = "DRIFT"
+        if ship.fuel_capacity:
+            ship.fuel -= min(ship.fuel, fuel_cost(distance, mode))
+        ship.busy_until = self.now + navigate_time(max(1, distance), mode, ship.speed)
+        ship.waypoint = destination
+        ship.trips += 1
+        return True
+
+    def refuel(self, ship):
+        """Refuel the ship to capacity, if its waypoint sells fuel."""
+        fuel = ship.waypoint.goods.get("FUEL")
+        if not fuel or ship.fuel >= ship.fuel_capacity:
+            return False
+        units = ceil((ship.fuel_capacity - ship.fuel) / FUEL_UNITS)
+        ship.credits -= fuel.trade(self.now, units, purchase=True)
+        ship.fuel = ship.fuel_capacity
+        return True
+
+    def purchase(self, ship, symbol: str, units: int = None):
+        """Purchase the trade good at the ship's waypoint (by default, filling its cargo hold)."""
+        good = ship.waypoint.goods.get(symbol)
+        units = min(units or ship.get_available_capacity(), ship.get_available_capacity())
+        if not good or units <= 0:
+            return False
+        ship.credits -= good.trade(self.now, units, purchase=True)
+        ship.cargo[symbol] = ship.cargo.get(symbol, 0) + units
+        ship.units_traded += units
+        return True
+
+    def sell(self, ship, symbol: str):
+        """Sell all units of the trade good held by the ship, if its waypoint market lists it."""
+        good = ship.waypoint.goods.get(symbol)
+        if not good or not ship.cargo.get(symbol):
+            return False
+        units = ship.cargo.pop(symbol)
+        ship.credits += good.trade(self.now, units, purchase=False)
+        ship.units_traded += units
+        return True
+
+    def extract(self, ship):
+        """Extract resources at the ship's waypoint, placing it in cooldown."""
+        deposits = ship.waypoint.deposits
+        if not deposits or not ship.get_available_capacity():
+            return False
+        symbol = self.rng.choice(EXTRACTION_YIELDS[self.rng.choice(deposits)])
+        units = min(self.rng.randint(*EXTRACT_UNITS), ship.get_available_capacity())
+        ship.cargo[symbol] = ship.cargo.get(symbol, 0) + units
+        ship.busy_until = self.now + EXTRACT_COOLDOWN
+        return True
+
+    def deliver(self, ship, contract):
+        """Deliver the ship's cargo to a contract at its waypoint, and fulfil the contract if complete."""
+        delivered = False
+        for symbol, destination, units in contract.remaining():
+            if destination == ship.waypoint.symbol and ship.cargo.get(symbol):
+                units = min(units, ship.cargo[symbol])
+                ship.cargo[symbol] -= units
+                if not ship.cargo[symbol]:
+                    del ship.cargo[symbol]
+                contract.deliveries[symbol][2] += units
+                delivered = True
+        if delivered and not contract.remaining():
+            contract.fulfilled = True
+            ship.credits += contract.payment
+        return delivered
+
+    # Queries.
+
+    def markets(self):
+        return [waypoint for waypoint in self.waypoints.values() if waypoint.goods]
+
+    def nearest(self, origin, waypoints):
+        """Returns the passed-in waypoints sorted by distance from the origin waypoint."""
+        return sorted(waypoints, key=lambda waypoint: dist(origin.coords, waypoint.coords))
+
+    def best_export(self, waypoint):
+        """Returns the (trade good symbol, destination waypoint) of the export from the passed-in
+        market having the best ratio of profit per unit to distance, or None.
+        """
+        best, best_ratio = None, 0
+        for symbol, good in waypoint.goods.items():
+            if good.type != "EXPORT":
+                continue
+            good.recover(self.now)
+            for market in self.markets():
+                other = market.goods.get(symbol)
+                if market is waypoint or not other or other.type != "IMPORT":
+                    continue
+                other.recover(self.now)
+                ratio = (other.sell_price - good.purchase_price) / max(1, dist(waypoint.coords, market.coords))
+                if ratio > best_ratio:
+                    best, best_ratio = (symbol, market), ratio
+        return best
+
+
+def strategy_trade(sim, ship):
+    """Greedy per-ship trading: sell any cargo here; otherwise buy the export having the best profit
+    per distance and navigate to its import market; otherwise navigate to one of the ten nearest
+    export markets at random. This is not the deployed behaviour, which assigns routes fleet-wide
+    (`galaxy.trade.assign_trade_routes`), so it is a baseline rather than a backtest of it.
+    """
+    sim.refuel(ship)
+    if ship.cargo:
+        for symbol in list(ship.cargo):
+            sim.sell(ship, symbol)
+        if ship.cargo:
+            # Carry unsellable cargo to the nearest market which lists it.
+            symbol = next(iter(ship.cargo))
+            markets = [market for market in sim.markets() if symbol in market.goods and market is not ship.waypoint]
+            if not markets:
+                del ship.cargo[symbol]  # Jettison.
+                return True
+            return sim.navigate(ship, sim.nearest(ship.waypoint, markets)[0])
+        return True
+
+    best = sim.best_export(ship.waypoint)
+    if best:
+        symbol, destination = best
+        sim.purchase(ship, symbol)
+        return sim.navigate(ship, destination)
+
+    exporters = [market for market in sim.markets() if market is not ship.waypoint and any(g.type == "EXPORT" for g in market.goods.values())]
+    if not exporters:
+        return False
+    return sim.navigate(ship, sim.rng.choice(sim.nearest(ship.waypoint, exporters)[0:10]))
+
+
+def strategy_mine(sim, ship):
+    """Extract at the nearest deposit until the cargo hold is full, then sell the cargo at the
+    nearest markets which list it. Unlike the deployed miner-hauler swarms (`galaxy.swarm`), each
+    ship mines and sells alone, without surveys or haulers.
+    """
+    if ship.get_available_capacity() and ship.waypoint.deposits:
+        return sim.extract(ship)
+
+    if ship.cargo:
+        sim.refuel(ship)
+        for symbol in list(ship.cargo):
+            sim.sell(ship, symbol)
+        for symbol in list(ship.cargo):
+            markets = [market for market in sim.markets() if symbol in market.goods and market is not ship.waypoint]
+            if markets:
+                return sim.navigate(ship, sim.nearest(ship.waypoint, markets)[0])
+            del ship.cargo[symbol]  # Jettison.
+
+    deposits = [waypoint for waypoint in sim.waypoints.values() if waypoint.deposits]
+    if not deposits:
+        return False
+    return sim.navigate(ship, sim.nearest(ship.waypoint, deposits)[0])
+
+
+def strategy_contract(sim, ship):
+    """Buy the goods required by the first open contract at the cheapest market, and deliver them.
+    Trade when no contract is open.
+    """
+    contract = next((contract for contract in sim.contracts if not contract.fulfilled), None)
+    if not contract:
+        return strategy_trade(sim, ship)
+
+    sim.refuel(ship)
+    symbol, destination, units = contract.remaining()[0]
+    if ship.cargo.get(symbol):
+        if ship.waypoint.symbol == destination:
+            return sim.deliver(ship, contract)
+        return sim.navigate(ship, sim.waypoints[destination])
+
+    markets = [market for market in sim.markets() if symbol in market.goods]
+    if not markets:
+        return False
+    for market in markets:
+        market.goods[symbol].recover(sim.now)
+    cheapest = min(markets, key=lambda market: market.goods[symbol].purchase_price)
+    if ship.waypoint is cheapest:
+        return sim.purchase(ship, symbol, units)
+    return sim.navigate(ship, cheapest)
+
+
+STRATEGIES = {
+    "trade": strategy_trade,
+    "mine": strategy_mine,
+    "contract": strategy_contract,
+}
@@ -0,0 +1,194 @@
+"""Compact, column-oriented snapshots of the galaxy (systems, waypoints, markets and shipyards).
+
+A snapshot file holds a sequence of table row groups. Each column of a row group is stored as a
+separately compressed block (a JSON array of values), followed by a compressed JSON header
+describing the tables and the location of each block, and finally the offset of the header:
+
+    MAGIC | column blocks ... | header | header offset (8 bytes, little-endian)
+
+Snapshots are read through a memory map, one row group at a time, and loaded with COPY, so that
+memory use is bounded by the row group size rather than the size of the snapshot.
+"""
+from datetime import datetime, timezone
+from itertools import islice
+import json
+import logging
+import mmap
+import struct
+import zlib
+
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, models, transaction
+from psycopg.types.json import Jsonb
+
+from .models import (
+    Faction,
+    FactionTrait,
+    Market,
+    MarketTradeGood,
+    ShipModule,
+    ShipMount,
+    ShipSpec,
+    Shipyard,
+    ShipyardShip,
+    System,
+    TradeGood,
+    Waypoint,
+    WaypointModifier,
+    WaypointTrait,
+)
+from .spatial import invalidate_all_indexes
+from .tiles import clear_tiles
+
+LOGGER = logging.getLogger("spacetraders")
+MAGIC = b"SPACETRADERS-GALAXY-1\n"
+FOOTER = struct.Struct("<Q")
+# Maximum number of rows held in memory at once, when writing or reading a table.
+ROW_GROUP_SIZE = 50000
+
+# Models included in a snapshot, with the through models of their many-to-many relations.
+SNAPSHOT_MODELS = [
+    FactionTrait,
+    Faction,
+    Faction.traits.through,
+    System,
+    System.factions.through,
+    WaypointTrait,
+    WaypointModifier,
+    Waypoint,
+    Waypoint.traits.through,
+    Waypoint.modifiers.through,
+    TradeGood,
+    TradeGood.inputs.through,
+    Market,
+    Market.imports.through,
+    Market.exports.through,
+    Market.exchange.through,
+    MarketTradeGood,
+    MarketTradeGood.trade_matches.through,
+    ShipModule,
+    ShipMount,
+    ShipSpec,
+    ShipSpec.modules.through,
+    ShipSpec.mounts.through,
+    Shipyard,
+    ShipyardShip,
+]
+
+
+class SnapshotWriter:
+    """Write tables to a snapshot file, one row group at a time."""
+
+    def __init__(self, path: str, level: int = 9):
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+        self.level = level
+        self.tables = []
+
+    def write_block(self, values: list):
+        data = zlib.compress(json.dumps(values, cls=DjangoJSONEncoder, separators=(",", ":")).encode(), self.level)
+        offset = self.file.tell()
+        self.file.write(data)
+        return [offset, len(data)]
+
+    def write_table(self, table: str, columns: list, rows, json_columns: list = None):
+        """Write an iterable of row tuples as a table of the snapshot. Returns the number of rows."""
+        entry = {"table": table, "columns": columns, "json_columns": json_columns or [], "rows": 0, "groups": []}
+        rows = iter(rows)
+        while group := list(islice(rows, ROW_GROUP_SIZE)):
+            entry["groups"].append({"rows": len(group), "blocks": [self.write_block(list(values)) for values in zip(*group)]})
+            entry["rows"] += len(group)
+        self.tables.append(entry)
+        return entry["rows"]
+
+    def close(self):
+        header = zlib.compress(json.dumps({"created": datetime.now(timezone.utc).isoformat(), "tables": self.tables}).encode())
+        offset = self.file.tell()
+        self.file.write(header)
+        self.file.write(FOOTER.pack(offset))
+        self.file.close()
+
+
+class SnapshotReader:
+    """Read the tables of a memory-mapped snapshot file, one row group at a time."""
+
+    def __init__(self, path: str):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[0:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a galaxy snapshot")
+        (offset,) = FOOTER.unpack(self.map[-FOOTER.size:])
+        header = json.loads(zlib.decompress(self.map[offset:-FOOTER.size]))
+        self.created = header["created"]
+        self.tables = {entry["table"]: entry for entry in header["tables"]}
+
+    def read_block(self, offset: int, length: int):
+        return json.loads(zlib.decompress(self.map[offset:offset + length]))
+
+    def read_table(self, table: str):
+        """Generator of lists of row tuples (one list per row group) for the nominated table."""
+        for group in self.tables[table]["groups"]:
+            columns = [self.read_block(offset, length) for offset, length in group["blocks"]]
+            yield list(zip(*columns))
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+def dump_galaxy(path: str):
+    """Write a snapshot of the galaxy to the nominated file path. Returns a dict of {table: rows}."""
+    writer = SnapshotWriter(path)
+    counts = {}
+    try:
+        for model in SNAPSHOT_MODELS:
+            fields = model._meta.concrete_fields
+            rows = model.objects.order_by("pk").values_list(*[f.attname for f in fields]).iterator(chunk_size=ROW_GROUP_SIZE)
+            table = model._meta.db_table
+            json_columns = [f.column for f in fields if isinstance(f, models.JSONField)]
+            counts[table] = writer.write_table(table, [f.column for f in fields], rows, json_columns)
+            LOGGER.info(f"Dumped {counts[table]} rows of {table}")
+    finally:
+        writer.close()
+    return counts
+
+
+def load_galaxy(path: str):
+    """Load a galaxy snapshot from the nominated file path into empty tables. Returns a dict of {table: rows}."""
+    reader = SnapshotReader(path)
+    counts = {}
+    try:
+        for model in SNAPSHOT_MODELS:
+            if model.objects.exists():
+                raise ValueError(f"Table {model._meta.db_table} is not empty")
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            for model in SNAPSHOT_MODELS:
+                table = model._meta.db_table
+                if table not in reader.tables:
+                    continue
+                entry = reader.tables[table]
+                json_columns = [entry["columns"].index(column) for column in entry["json_columns"]]
+                columns = ", ".join(connection.ops.quote_name(column) for column in entry["columns"])
+                with cursor.copy(f"COPY {connection.ops.quote_name(table)} ({columns}) FROM STDIN") as copy:
+                    for rows in reader.read_table(table):
+                        for row in rows:
+                            if json_columns:
+                                row = list(row)
+                                for i in json_columns:
+                                    row[i] = Jsonb(row[i]) if row[i] is not None else None
+                            copy.write_row(row)
+                counts[table] = entry["rows"]
+                LOGGER.info(f"Loaded {counts[table]} rows of {table}")
+
+            # Rows were copied with their primary keys: advance each table's sequence past them.
+            for sql in connection.ops.sequence_reset_sql(no_style(), SNAPSHOT_MODELS):
+                cursor.execute(sql)
+    finally:
+        reader.close()
+
+    # COPY sends no signals: refresh the galaxy map tiles and every spatial index.
+    clear_tiles()
+    invalidate_all_indexes()
+    return counts
@@ -0,0 +1,170 @@
+"""In-memory spatial indexes over system and waypoint coordinates.
+
+Each worker process lazily builds a uniform grid index of the systems in the galaxy, and one per
+system of its waypoints (waypoint coordinates are relative to their system). Indexes are versioned
+in the shared cache: model signals bump the version when coordinates or traits change, and each
+process rebuilds a stale index on its next query. A waypoint's trait changes only invalidate its
+system's waypoint index; the traits held by the systems index (the union of the traits of each
+system's waypoints) are refreshed whenever the systems index is rebuilt.
+"""
+from collections import defaultdict, namedtuple
+from math import dist, sqrt
+import uuid
+
+from django.core.cache import cache
+
+from .models import System, Waypoint
+
+SpatialPoint = namedtuple("SpatialPoint", ["pk", "symbol", "type", "x", "y", "traits"])
+
+_indexes = {}
+
+
+class GridIndex:
+    """A uniform grid over a set of points, supporting radius and k-nearest neighbour queries."""
+
+    def __init__(self, points, cell_size: float = None):
+        self.points = list(points)
+        if not cell_size:
+            # Size cells so that each holds a couple of points on average.
+            xs = [p.x for p in self.points] or [0]
+            ys = [p.y for p in self.points] or [0]
+            area = max(1, (max(xs) - min(xs)) * (max(ys) - min(ys)))
+            cell_size = max(1, sqrt(2 * area / max(1, len(self.points))))
+        self.cell_size = cell_size
+        self.cells = defaultdict(list)
+        for p in self.points:
+            self.cells[self.cell(p.x, p.y)].append(p)
+        if self.cells:
+            self.cell_bounds = (min(c[0] for c in self.cells), min(c[1] for c in self.cells), max(c[0] for c in self.cells), max(c[1] for c in self.cells))
+        self.subsets = {}
+
+    def subset(self, trait: str = None, type: str = None):
+        """Returns a (memoised) index of the points having the nominated trait and/or type, so that
+        filtered queries on sparse traits need not scan non-matching points.
+        """
+        if not trait and not type:
+            return self
+        if (trait, type) not in self.subsets:
+            points = [p for p in self.points if (not trait or trait in p.traits) and (not type or p.type == type)]
+            self.subsets[(trait, type)] = GridIndex(points)
+        return self.subsets[(trait, type)]
+
+    def cell(self, x, y):
+        return (int(x // self.cell_size), int(y // self.cell_size))
+
+    def within(self, x, y, radius: float, predicate=None):
+        """Returns a list of (distance, point) within `radius` of (x, y), nearest first."""
+        cx0, cy0 = self.cell(x - radius, y - radius)
+        cx1, cy1 = self.cell(x + radius, y + radius)
+        results = []
+        for i in range(cx0, cx1 + 1):
+            for j in range(cy0, cy1 + 1):
+                for p in self.cells.get((i, j), ()):
+                    d = dist((x, y), (p.x, p.y))
+                    if d <= radius and (predicate is None or predicate(p)):
+                        results.append((d, p))
+        return sorted(results, key=lambda r: r[0])
+
+    def nearest(self, x, y, k: int = None, predicate=None):
+        """Returns a list of the `k` nearest (distance, point) to (x, y), nearest first.
+        If `k` is None, return all matching points.
+        """
+        if k is None:
+            results = [(dist((x, y), (p.x, p.y)), p) for p in self.points if predicate is None or predicate(p)]
+            return sorted(results, key=lambda r: r[0])
+
+        if not self.cells:
+            return []
+        cx, cy = self.cell(x, y)
+        min_i, min_j, max_i, max_j = self.cell_bounds
+        max_ring = max(cx - min_i, max_i - cx, cy - min_j, max_j - cy)
+        results = []
+        ring = 0
+        # Search outwards in square rings of cells. Any point outside ring r is at least
+        # r * cell_size distant, so stop once the k-th result is nearer than that.
+        while ring <= max_ring:
+            for i in range(cx - ring, cx + ring + 1):
+                for j in range(cy - ring, cy + ring + 1):
+                    if max(abs(i - cx), abs(j - cy)) != ring:
+                        continue
+                    for p in self.cells.get((i, j), ()):
+                        if predicate is None or predicate(p):
+                            results.append((dist((x, y), (p.x, p.y)), p))
+            if len(results) >= k:
+                results.sort(key=lambda r: r[0])
+                if results[k - 1][0] <= ring * self.cell_size:
+                    break
+            ring += 1
+        results.sort(key=lambda r: r[0])
+        return results[0:k]
+
+
+def index_version_key(system_id: int = None):
+    if system_id:
+        return f"spatial_index:waypoints:{system_id}"
+    return "spatial_index:systems"
+
+
+def invalidate_index(system_id: int = None):
+    """Mark the waypoint index for a system (or the galaxy system index, if `system_id` is None)
+    as stale, for every process.
+    """
+    cache.set(index_version_key(system_id), uuid.uuid4().hex, None)
+
+
+def invalidate_all_indexes():
+    """Mark the galaxy system index and every system's waypoint index as stale, for every process."""
+    keys = [index_version_key(pk) for pk in System.objects.values_list("pk", flat=True).iterator()]
+    cache.delete_many(keys + [index_version_key()])
+
+
+def _get_index(key: str, build):
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.add(key, version, None)
+        version = cache.get(key)
+    entry = _indexes.get(key)
+    if not entry or entry[0] != version:
+        entry = (version, GridIndex(build()))
+        _indexes[key] = entry
+    return entry[1]
+
+
+def _build_waypoints(system_id: int):
+    waypoints = Waypoint.objects.filter(system_id=system_id).values_list("pk", "symbol", "type", "x", "y", "trait_symbols")
+    return [SpatialPoint(pk, symbol, type, x, y, frozenset(traits)) for pk, symbol, type, x, y, traits in waypoints]
+
+
+def _build_systems():
+    # The traits of a system are the set of traits of all its waypoints.
+    traits = defaultdict(set)
+    for system_id, symbols in Waypoint.objects.exclude(trait_symbols=[]).values_list("system_id", "trait_symbols"):
+        traits[system_id].update(symbols)
+    systems = System.objects.values_list("pk", "symbol", "type", "x", "y")
+    return [SpatialPoint(pk, symbol, type, x, y, frozenset(traits[pk])) for pk, symbol, type, x, y in systems]
+
+
+def _query(index, coords: tuple, k: int = None, radius: float = None, trait: str = None, type: str = None, pks=None):
+    index = index.subset(trait, type)
+    predicate = None if pks is None else lambda p: p.pk in pks
+    if radius is not None:
+        return index.within(coords[0], coords[1], radius, predicate)[0:k]
+    return index.nearest(coords[0], coords[1], k, predicate)
+
+
+def nearest_waypoints(system_id: int, coords: tuple, k: int = None, radius: float = None, trait: str = None, type: str = None, pks=None):
+    """Returns a list of (distance, SpatialPoint) for waypoints in a system nearest to the passed-in
+    coordinates, optionally limited to `k` results or a `radius`, and filtered by trait, type or pk.
+    """
+    index = _get_index(index_version_key(system_id), lambda: _build_waypoints(system_id))
+    return _query(index, coords, k, radius, trait, type, pks)
+
+
+def nearest_systems(coords: tuple, k: int = None, radius: float = None, trait: str = None, type: str = None, pks=None):
+    """Returns a list of (distance, SpatialPoint) for systems nearest to the passed-in galaxy coordinates,
+    optionally limited to `k` results or a `radius`, and filtered by a waypoint trait, system type or pk.
+    """
+    index = _get_index(index_version_key(), _build_systems)
+    return _query(index, coords, k, radius, trait, type, pks)
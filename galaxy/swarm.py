@@ -0,0 +1,342 @@
+"""Orchestration of mining swarms: miners extracting at an asteroid, and haulers carrying their cargo
+to market.
+
+Miners (ships with the MINE behaviour) at an asteroid waypoint (a "site") don't each queue their
+own extractions. Instead one job per site, `site_step`, drives every miner at the site on a single
+schedule: at each step, each miner whose cooldown has expired extracts (using the best unexpired
+survey), then transfers its cargo to the haulers (ships with the HAUL behaviour) waiting at the
+site. Miners' cooldowns expiring within `settings.MINING_BATCH_WINDOW` seconds of the earliest are
+grouped into one batch, and the next step is queued for when the whole batch is out of cooldown:
+the batch's extraction requests are made concurrently (on a thread pool sharing the agent's rate
+limited client), and their results are written in one set of bulk writes. Miners are never left
+idle with a full cargo hold, while a hauler has room.
+
+Haulers wait in orbit at a site until their cargo hold is nearly full, then batch-sell it at the
+import market expected to pay the most credits per second of travel, and return to the site having
+the fewest haulers per miner.
+"""
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import logging
+from math import dist
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django_rq import get_queue
+from requests.exceptions import RequestException
+
+from .contracts import ship_navigate
+from .events import publish_event
+from .fleet import sync_cargo
+from .models import Extraction, MarketTradeGood, Ship, Survey, Waypoint, navigate_time
+from .pricing import get_price_impact_model, predict_price
+from .signals import ship_event_fields
+
+LOGGER = logging.getLogger("spacetraders")
+# Waypoint types at which ships can mine.
+SITE_TYPES = ["ASTEROID", "ASTEROID_FIELD", "ENGINEERED_ASTEROID"]
+# Seconds between steps of a site having no miner in cooldown, and between checks by a waiting hauler.
+SITE_IDLE = 60
+HAULER_WAIT = 60
+# Fraction of a hauler's cargo capacity at which it leaves to sell.
+HAULER_FULL = 0.9
+# Seconds spent docking, selling and refuelling at a market.
+MARKET_OVERHEAD = 60
+# Lifetime (seconds) of the lock marking a site's step job as queued.
+SITE_LOCK_TTL = 60 * 10
+
+
+def site_lock_key(waypoint_id: int):
+    return f"swarm_site:{waypoint_id}"
+
+
+def is_site(waypoint):
+    return waypoint.type in SITE_TYPES
+
+
+def get_miners(waypoint_id: int):
+    return Ship.objects.filter(behaviour="MINE", nav__waypoint_id=waypoint_id).exclude(nav__status="IN_TRANSIT").select_related("nav__waypoint")
+
+
+def get_haulers(waypoint_id: int):
+    return Ship.objects.filter(behaviour="HAUL", nav__waypoint_id=waypoint_id).exclude(nav__status="IN_TRANSIT")
+
+
+def start_site(waypoint, client):
+    """Queue the step job of the site at the passed-in waypoint, unless it is already queued."""
+    if cache.add(site_lock_key(waypoint.pk), 1, SITE_LOCK_TTL):
+        LOGGER.info(f"Starting mining site {waypoint.symbol}")
+        get_queue("default").enqueue(site_step, waypoint.pk, client)
+
+
+def transfer_to_haulers(miner, haulers: list, client):
+    """Transfer the miner's cargo to the passed-in haulers, filling each in turn. Returns the
+    number of units transferred.
+    """
+    transferred = 0
+    for item in miner.cargo.select_related("type"):
+        units = item.units
+        for hauler in haulers:
+            # A transfer requires both ships to be in orbit.
+            if not hauler.is_in_orbit:
+                hauler.orbit(client)
+            amount = min(units, hauler.get_available_capacity())
+            if amount <= 0:
+                continue
+            if miner.transfer_cargo(client, hauler, item.type.symbol, amount):
+                units -= amount
+                transferred += amount
+            if not units:
+                break
+    return transferred
+
+
+def request_extraction(miner, client, survey_data: dict = None):
+    """Make the miner's extraction request, targeting the passed-in survey data (if any), falling
+    back to an extraction without the survey if the survey is unusable (exhausted or expired).
+    Makes no database queries, so that it can be called from a worker thread. Returns a tuple of
+    (response data or None, whether the survey was used, whether the survey was unusable).
+    """
+    rejected = False
+    if survey_data:
+        try:
+            data = client.extract_resources_with_survey(miner.symbol, survey_data)
+        except RequestException as e:
+            LOGGER.error(f"{miner} unable to extract with survey {survey_data['signature']}: {e}")
+            return None, False, False
+        if "error" not in data:
+            return data, True, False
+        LOGGER.warning(f"{miner} unable to extract with survey {survey_data['signature']}: {data['error']['message']}")
+        if data["error"].get("code") not in Survey.UNUSABLE_ERROR_CODES:
+            # E.g. the miner is in cooldown: the survey is still good, and so is no fallback.
+            return None, False, False
+        rejected = True
+    try:
+        data = client.extract_resources(miner.symbol)
+    except RequestException as e:
+        LOGGER.error(f"{miner} unable to extract: {e}")
+        return None, False, rejected
+    if "error" in data:
+        LOGGER.error(f"{miner} unable to extract: {data['error']['message']}")
+        return None, False, rejected
+    return data, False, rejected
+
+
+def extract_batch(miners: list, waypoint, client):
+    """Extract with each of the passed-in miners at the waypoint, making the requests concurrently,
+    then record the cooldowns, cargo and extractions of the batch in one set of bulk writes.
+    Returns the list of miners which extracted.
+    """
+    # Miners must be in orbit to extract.
+    for miner in miners:
+        if not miner.is_in_orbit:
+            miner.orbit(client)
+    survey = Survey.objects.best_for(waypoint)
+    survey_data = survey.as_data() if survey else None
+    with ThreadPoolExecutor(max_workers=settings.MINING_WORKERS) as executor:
+        results = list(executor.map(lambda miner: request_extraction(miner, client, survey_data), miners))
+
+    if survey and any(rejected for data, surveyed, rejected in results):
+        # The survey has expired or is exhausted.
+        survey.delete()
+    now = datetime.now(timezone.utc)
+    extracted, extractions = [], []
+    for miner, (data, surveyed, rejected) in zip(miners, results):
+        if not data:
+            continue
+        miner.cooldown = data["cooldown"]
+        miner.cargo_capacity = data["cargo"]["capacity"]
+        miner.cargo_units = data["cargo"]["units"]
+        miner.modified = now
+        extract_yield = data["extraction"]["yield"]
+        extractions.append(Extraction(
+            timestamp=now,
+            ship_symbol=miner.symbol,
+            waypoint=waypoint,
+            survey_signature=survey_data["signature"] if surveyed else None,
+            trade_symbol=extract_yield["symbol"],
+            units=extract_yield["units"],
+        ))
+        extracted.append((miner, data))
+        LOGGER.info(f"{miner} extract yielded {extract_yield['units']} {extract_yield['symbol']}{' (surveyed)' if surveyed else ''}")
+
+    if extracted:
+        with transaction.atomic():
+            Ship.objects.bulk_update([miner for miner, data in extracted], ["cooldown", "cargo_capacity", "cargo_units", "modified"])
+            sync_cargo([(miner, data["cargo"]) for miner, data in extracted])
+            Extraction.objects.bulk_create(extractions)
+        # Bulk writes don't send post_save signals; publish events for the miners.
+        for miner, data in extracted:
+            publish_event(miner.agent_id, miner.symbol, **ship_event_fields(miner))
+    return [miner for miner, data in extracted]
+
+
+def next_batch(miners: list, now: datetime):
+    """Returns the time at which to run the next batch of extractions: when every miner (having
+    cargo capacity) whose cooldown expires within `settings.MINING_BATCH_WINDOW` seconds of the
+    earliest expiry is out of cooldown.
+    """
+    cooldowns = [miner.get_cooldown() for miner in miners if miner.get_available_capacity()]
+    cooldowns = sorted(cooldown for cooldown in cooldowns if cooldown and cooldown > now)
+    if not cooldowns:
+        return now + timedelta(seconds=SITE_IDLE)
+    window = cooldowns[0] + timedelta(seconds=settings.MINING_BATCH_WINDOW)
+    return max(cooldown for cooldown in cooldowns if cooldown <= window)
+
+
+def site_step(waypoint_id: int, client):
+    """Carry out one step of the mining site at the nominated waypoint: extract with the batch of
+    miners which are out of cooldown, transfer miners' cargo to waiting haulers, and queue the next
+    step for the next batch of miners' cooldown expiries.
+    """
+    miners = list(get_miners(waypoint_id))
+    if not miners:
+        LOGGER.info(f"No miners at site {waypoint_id}, stopping")
+        cache.delete(site_lock_key(waypoint_id))
+        return
+
+    now = datetime.now(timezone.utc)
+    # If the step fails (e.g. an API error), the next step is still queued: nothing else restarts a site without haulers.
+    next_step = now + timedelta(seconds=SITE_IDLE)
+    try:
+        waypoint = miners[0].nav.waypoint
+        haulers = sorted(get_haulers(waypoint_id), key=lambda ship: ship.get_available_capacity(), reverse=True)
+        ready = [miner for miner in miners if miner.get_available_capacity() and not miner.is_in_cooldown]
+        extracted = extract_batch(ready, waypoint, client) if ready else []
+        if haulers:
+            for miner in miners:
+                if miner.cargo_units:
+                    transfer_to_haulers(miner, haulers, client)
+
+        # Miners with a full hold wait for a hauler; the others extract again once out of cooldown.
+        next_step = next_batch(miners, now)
+        LOGGER.info(f"Site {waypoint.symbol}: {len(extracted)}/{len(miners)} miners extracted, {len(haulers)} haulers waiting, next step {next_step}")
+    finally:
+        cache.set(site_lock_key(waypoint_id), 1, SITE_LOCK_TTL)
+        get_queue("default").enqueue_at(next_step + timedelta(seconds=1), site_step, waypoint_id, client)
+
+
+def best_market(ship):
+    """Returns (waypoint symbol, expected credits per second) of the market in the ship's system
+    expected to pay the most for its cargo, net of the price impact of the sale and per second of
+    travel there, or None if no market buys any of its cargo.
+    """
+    cargo = {item.type_id: item.units for item in ship.cargo.all()}
+    if not cargo:
+        return None
+    origin = ship.nav.waypoint
+    speed = ship.engine["speed"]
+    model = get_price_impact_model()
+    revenue = defaultdict(float)
+    coords = {}
+    for mtg in MarketTradeGood.objects.filter(
+        market__waypoint__system_id=origin.system_id, trade_good_id__in=cargo, type__in=["IMPORT", "EXCHANGE"]
+    ).select_related("market__waypoint"):
+        units = cargo[mtg.trade_good_id]
+        price = predict_price(mtg.sell_price, units / 2, mtg.trade_volume, model.estimate_for(mtg, purchase=False), purchase=False)
+        waypoint = mtg.market.waypoint
+        revenue[waypoint.symbol] += units * price
+        coords[waypoint.symbol] = waypoint.coords
+
+    rates = [
+        (total / ((navigate_time(dist(origin.coords, coords[symbol]), "CRUISE", speed) or 0) + MARKET_OVERHEAD), symbol)
+        for symbol, total in revenue.items()
+    ]
+    if not rates:
+        return None
+    rate, symbol = max(rates)
+    return symbol, rate
+
+
+def best_site(ship):
+    """Returns the site Waypoint in the ship's system with the most miners per hauler assigned to
+    it (including haulers travelling there), or None if no site has any miners.
+    """
+    system_id = ship.nav.waypoint.system_id
+    miners = defaultdict(int)
+    for waypoint_id in Ship.objects.filter(
+        behaviour="MINE", nav__waypoint__system_id=system_id, nav__waypoint__type__in=SITE_TYPES
+    ).exclude(nav__status="IN_TRANSIT").values_list("nav__waypoint_id", flat=True):
+        miners[waypoint_id] += 1
+    if not miners:
+        return None
+    haulers = defaultdict(int)
+    for waypoint_id in Ship.objects.filter(behaviour="HAUL", nav__waypoint_id__in=miners).exclude(pk=ship.pk).values_list("nav__waypoint_id", flat=True):
+        haulers[waypoint_id] += 1
+    origin = ship.nav.waypoint
+    waypoints = Waypoint.objects.in_bulk(list(miners))
+    return max(
+        waypoints.values(),
+        key=lambda waypoint: (miners[waypoint.pk] / (haulers[waypoint.pk] + 1), -dist(origin.coords, waypoint.coords)),
+    )
+
+
+def hauler_step(ship, client):
+    """Carry out the next step of a hauler. Returns the datetime at which to run the following step."""
+    now = datetime.now(timezone.utc)
+    retry = now + timedelta(seconds=HAULER_WAIT)
+    waypoint = ship.nav.waypoint
+
+    if is_site(waypoint) and get_miners(waypoint.pk).exists() and ship.cargo_units < HAULER_FULL * ship.cargo_capacity:
+        # Wait in orbit to receive cargo from the site's miners.
+        if not ship.is_in_orbit:
+            ship.orbit(client)
+        start_site(waypoint, client)
+        return retry
+
+    if ship.cargo_units:
+        market = best_market(ship)
+        if not market:
+            # No known market buys the remaining cargo: discard it, to make room.
+            LOGGER.warning(f"{ship} has no market to sell its cargo in {waypoint.system.symbol}, jettisoning")
+            for item in ship.cargo.all():
+                item.jettison(client)
+            return now
+        symbol, rate = market
+        if symbol != waypoint.symbol:
+            LOGGER.info(f"{ship} hauling {ship.cargo_units} units to {symbol} (expected {round(rate)} credits/second)")
+            return ship_navigate(ship, client, symbol, retry)
+        ship.dock(client)
+        ship.refuel(client)
+        sold = False
+        for item in ship.cargo.select_related("type").filter(type__in=MarketTradeGood.objects.filter(
+            market__waypoint=waypoint, type__in=["IMPORT", "EXCHANGE"]
+        ).values("trade_good")):
+            sold = item.sell(client) or sold
+        ship.nav.waypoint.refresh(client)
+        # Don't spin on cargo the market refused: check again later.
+        return now if sold else retry
+
+    site = best_site(ship)
+    if not site:
+        return retry
+    if site.pk != waypoint.pk:
+        LOGGER.info(f"{ship} returning to mining site {site.symbol}")
+        return ship_navigate(ship, client, site.symbol, retry)
+    # At the site, with no miners there yet.
+    return retry
+
+
+def miner_step(ship, client):
+    """Carry out the next step of a miner: join the site at its waypoint (after which the site's
+    step job drives its extractions), or navigate to the nearest site. Returns the datetime at
+    which to run the following step, or None once the miner has joined a site.
+    """
+    now = datetime.now(timezone.utc)
+    waypoint = ship.nav.waypoint
+    if is_site(waypoint):
+        if not ship.is_in_orbit:
+            ship.orbit(client)
+        start_site(waypoint, client)
+        return None
+
+    sites = [(distance, site) for site_type in SITE_TYPES for distance, site in ship.find_destination(type=site_type)]
+    if not sites:
+        LOGGER.warning(f"{ship} has no mining site in {waypoint.system.symbol}")
+        return now + timedelta(seconds=SITE_IDLE)
+    distance, site = min(sites, key=lambda site: site[0])
+    LOGGER.info(f"{ship} navigating to mining site {site.symbol}")
+    return ship_navigate(ship, client, site.symbol, now + timedelta(seconds=SITE_IDLE))
+
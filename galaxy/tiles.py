@@ -0,0 +1,138 @@
+"""Rendering of the galaxy map as a pyramid of SVG tiles.
+
+At zoom level `z` the galaxy is divided into 2^z x 2^z square tiles of `TILE_SIZE` pixels. Systems
+falling within the same cell of a tile are drawn as a single cluster, so tiles at low zoom levels
+stay small regardless of the number of systems. Rendered tiles are cached on disk under
+`settings.GALAXY_TILE_ROOT` and are deleted when a system within them changes, to be re-rendered
+on the next request.
+"""
+from math import ceil, log2
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max, Min
+
+from .models import System
+
+TILE_SIZE = 256
+# Systems within the same square cell (in pixels) of a tile are drawn as one cluster.
+CLUSTER_CELL = 24
+# Zoom level from which system symbols are labelled.
+LABEL_ZOOM = 7
+SYSTEM_COLOURS = {
+    "NEUTRON_STAR": "lightblue",
+    "RED_STAR": "red",
+    "ORANGE_STAR": "orange",
+    "BLUE_STAR": "blue",
+    "YOUNG_STAR": "yellow",
+    "WHITE_DWARF": "white",
+    "BLACK_HOLE": "purple",
+    "HYPERGIANT": "gold",
+    "NEBULA": "pink",
+    "UNSTABLE": "green",
+}
+
+
+def get_extent():
+    """Returns the half-width of the square map area containing every system, rounded up to
+    the nearest thousand units.
+    """
+    extent = cache.get("galaxy_map_extent")
+    if extent is None:
+        bounds = System.objects.aggregate(Min("x"), Max("x"), Min("y"), Max("y"))
+        extent = max([abs(v) for v in bounds.values() if v is not None] + [1])
+        extent = int(ceil((extent + 1) / 1000) * 1000)
+        cache.set("galaxy_map_extent", extent, 60 * 60)
+    return extent
+
+
+def tile_bounds(z: int, x: int, y: int, extent: int):
+    """Returns the galaxy coordinates (x0, y0, x1, y1) covered by a tile."""
+    size = 2 * extent / 2**z
+    x0 = -extent + x * size
+    y0 = -extent + y * size
+    return (x0, y0, x0 + size, y0 + size)
+
+
+def tile_path(z: int, x: int, y: int, extent: int):
+    return os.path.join(settings.GALAXY_TILE_ROOT, str(extent), str(z), str(x), f"{y}.svg")
+
+
+def render_tile(z: int, x: int, y: int, extent: int):
+    """Render a single map tile as an SVG document."""
+    x0, y0, x1, y1 = tile_bounds(z, x, y, extent)
+    scale = TILE_SIZE / (x1 - x0)
+    systems = System.objects.filter(x__gte=x0, x__lt=x1, y__gte=y0, y__lt=y1).values_list("symbol", "type", "x", "y")
+
+    cells = {}
+    for symbol, type, sx, sy in systems.iterator():
+        px, py = (sx - x0) * scale, (sy - y0) * scale
+        cells.setdefault((int(px // CLUSTER_CELL), int(py // CLUSTER_CELL)), []).append((symbol, type, px, py))
+
+    elements = []
+    for members in cells.values():
+        if len(members) == 1:
+            symbol, type, px, py = members[0]
+            colour = SYSTEM_COLOURS.get(type, "grey")
+            elements.append(f'<circle cx="{px:.1f}" cy="{py:.1f}" r="3" fill="{colour}"><title>{symbol}</title></circle>')
+            if z >= LABEL_ZOOM:
+                elements.append(f'<text x="{px + 5:.1f}" y="{py + 3:.1f}" font-size="9" fill="lightgrey">{symbol}</text>')
+        else:
+            # Draw the cluster at the centroid of its members, sized by the member count.
+            cx = sum(m[2] for m in members) / len(members)
+            cy = sum(m[3] for m in members) / len(members)
+            radius = min(CLUSTER_CELL / 2, 3 + 1.5 * log2(len(members)))
+            elements.append(f'<circle cx="{cx:.1f}" cy="{cy:.1f}" r="{radius:.1f}" fill="steelblue" fill-opacity="0.7"></circle>')
+            elements.append(
+                f'<text x="{cx:.1f}" y="{cy + 3:.1f}" font-size="8" fill="white" text-anchor="middle">{len(members)}</text>'
+            )
+
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{TILE_SIZE}" height="{TILE_SIZE}" viewBox="0 0 {TILE_SIZE} {TILE_SIZE}">'
+        + "".join(elements)
+        + "</svg>"
+    )
+
+
+def get_tile(z: int, x: int, y: int):
+    """Returns the filesystem path of a map tile, rendering it first if it is not cached on disk.
+    Returns None for tile coordinates outside of the map.
+    """
+    if not 0 <= z <= settings.GALAXY_MAP_MAX_ZOOM or not 0 <= x < 2**z or not 0 <= y < 2**z:
+        return None
+
+    extent = get_extent()
+    path = tile_path(z, x, y, extent)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first, so that concurrent requests never read a partial tile.
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(render_tile(z, x, y, extent))
+        os.replace(tmp, path)
+    return path
+
+
+def invalidate_tiles(sx: int, sy: int):
+    """Delete the cached tile containing the passed-in coordinates, at every zoom level."""
+    extent = get_extent()
+    if abs(sx) >= extent or abs(sy) >= extent:
+        # The map area needs to grow; tiles will be rendered afresh for the new extent.
+        cache.delete("galaxy_map_extent")
+        return
+    for z in range(settings.GALAXY_MAP_MAX_ZOOM + 1):
+        size = 2 * extent / 2**z
+        x, y = int((sx + extent) // size), int((sy + extent) // size)
+        try:
+            os.remove(tile_path(z, x, y, extent))
+        except FileNotFoundError:
+            pass
+
+
+def clear_tiles():
+    """Delete every cached tile, and the cached map extent."""
+    cache.delete("galaxy_map_extent")
+    shutil.rmtree(settings.GALAXY_TILE_ROOT, ignore_errors=True)
@@ -0,0 +1,204 @@
+"""Fleet-wide assignment of trade routes to ships.
+
+Rather than each trading ship independently choosing the best export from its current market (so
+that several ships pile onto one route and crash its spread), `assign_trade_routes` assigns a route
+to every idle TRADE ship of an agent at once. Each route (an export market and an import market of
+the same trade good in one system) is offered as a number of slots, the value of each successive
+slot being reduced by the price impact of the ships ahead of it on the route. The assignment of
+ships to slots which maximises the fleet's credits per hour is then solved as a rectangular
+assignment problem (Hungarian algorithm).
+"""
+from collections import defaultdict
+from datetime import datetime, timezone
+import logging
+from math import dist
+
+from django.db import transaction
+
+from .models import MarketTradeGood, Ship, navigate_time
+from .pricing import get_price_impact_model, predict_price
+
+LOGGER = logging.getLogger("spacetraders")
+# Maximum number of routes (best first) and slots per route considered in each system.
+MAX_ROUTES = 50
+MAX_SLOTS = 5
+# Seconds spent docking, trading and refuelling at each end of a route.
+ROUTE_OVERHEAD = 30
+
+
+def hungarian(cost: list):
+    """Solve the assignment problem for the passed-in cost matrix (a list of n rows of m >= n
+    costs), minimising the total cost. Returns a list of the column assigned to each row.
+    """
+    n = len(cost)
+    m = len(cost[0]) if n else 0
+    inf = float("inf")
+    # Row and column potentials, the row assigned to each column, and the augmenting path.
+    u, v, p, way = [0] * (n + 1), [0] * (m + 1), [0] * (m + 1), [0] * (m + 1)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = [inf] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0, delta, j1 = p[j0], inf, 0
+            for j in range(1, m + 1):
+                if not used[j]:
+                    cur = cost[i0 - 1][j - 1] - u[i0] - v[j]
+                    if cur < minv[j]:
+                        minv[j], way[j] = cur, j0
+                    if minv[j] < delta:
+                        delta, j1 = minv[j], j
+            for j in range(m + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    assignment = [None] * n
+    for j in range(1, m + 1):
+        if p[j]:
+            assignment[p[j] - 1] = j - 1
+    return assignment
+
+
+def impact_price(price: float, traded: int, units: int, trade_volume: int, impact: float, purchase: bool):
+    """Returns the mean unit price of trading `units`, after `traded` units have already been
+    traded on the market by other ships.
+    """
+    return predict_price(price, traded + units / 2, trade_volume, impact, purchase)
+
+
+def get_routes(system_id: int):
+    """Returns a list of candidate trade routes in the nominated system, as dicts including the
+    export and import market trade goods, most profitable per unit first.
+    """
+    goods = defaultdict(lambda: {"EXPORT": [], "IMPORT": []})
+    model = get_price_impact_model()
+    market_trade_goods = MarketTradeGood.objects.filter(market__waypoint__system_id=system_id, type__in=["EXPORT", "IMPORT"])
+    for mtg in market_trade_goods.values(
+        "market_id", "trade_good_id", "trade_good__symbol", "type", "trade_volume", "supply", "activity", "purchase_price", "sell_price",
+        "market__waypoint__symbol", "market__waypoint__x", "market__waypoint__y",
+    ):
+        # Ships buy exports and sell imports.
+        mtg["impact"] = model.estimate(mtg["market_id"], mtg["trade_good_id"], mtg["type"] == "EXPORT", mtg["supply"], mtg["activity"])
+        goods[mtg["trade_good__symbol"]][mtg["type"]].append(mtg)
+
+    routes = []
+    for symbol, markets in goods.items():
+        for export in markets["EXPORT"]:
+            for imp in markets["IMPORT"]:
+                spread = imp["sell_price"] - export["purchase_price"]
+                if spread > 0:
+                    routes.append({
+                        "trade_good": symbol,
+                        "origin": export["market__waypoint__symbol"],
+                        "destination": imp["market__waypoint__symbol"],
+                        "export": export,
+                        "import": imp,
+                        "spread": spread,
+                    })
+    routes.sort(key=lambda route: route["spread"], reverse=True)
+    return routes[0:MAX_ROUTES]
+
+
+def route_key(route: dict):
+    return (route["trade_good"], route["origin"], route["destination"])
+
+
+def slot_value(ship, route: dict, slot: int):
+    """Returns the expected (units, profit, credits per hour) of the ship taking the nominated slot
+    (zero-based) of a route: `slot` other ships are assumed to trade the route ahead of it.
+    """
+    export, imp = route["export"], route["import"]
+    # Purchases and sales are sliced into tranches, so a ship can fill its cargo hold.
+    units = ship.cargo_capacity
+    if not units:
+        return (0, 0, 0)
+    traded = slot * units
+    buy = impact_price(export["purchase_price"], traded, units, export["trade_volume"], export["impact"], purchase=True)
+    sell = impact_price(imp["sell_price"], traded, units, imp["trade_volume"], imp["impact"], purchase=False)
+    profit = units * (sell - buy)
+
+    speed = ship.engine["speed"]
+    waypoint = ship.nav.waypoint
+    origin = (export["market__waypoint__x"], export["market__waypoint__y"])
+    destination = (imp["market__waypoint__x"], imp["market__waypoint__y"])
+    duration = 2 * ROUTE_OVERHEAD + (navigate_time(dist(waypoint.coords, origin), "CRUISE", speed) or 0)
+    duration += navigate_time(max(1, dist(origin, destination)), "CRUISE", speed)
+    return (units, profit, profit / duration * 60 * 60)
+
+
+def assign_trade_routes(agent):
+    """Assign a trade route to each idle TRADE ship of the agent (having no route and an empty
+    cargo hold), maximising the total credits per hour of the fleet. Routes already assigned to
+    other ships count against the value of the remaining slots on those routes.
+    Returns a dict of {ship pk: route} for the ships assigned a route.
+    """
+    by_system = defaultdict(list)
+    occupied = defaultdict(int)
+    for ship in Ship.objects.filter(agent=agent, behaviour="TRADE").select_related("nav__waypoint"):
+        if ship.trade_route:
+            occupied[route_key(ship.trade_route)] += 1
+        elif not ship.cargo_units:
+            by_system[ship.nav.waypoint.system_id].append(ship)
+
+    # Price the routes and solve the assignment without holding any locks: this may fit the price impact model.
+    proposed = []
+    for system_id, idle in by_system.items():
+        # Columns: the slots of each route, then one "no route" column per ship.
+        slots = []
+        for route in get_routes(system_id):
+            start = occupied[route_key(route)]
+            slots.extend((route, slot) for slot in range(start, start + min(len(idle), MAX_SLOTS)))
+        values = [[slot_value(ship, route, slot) for route, slot in slots] for ship in idle]
+        cost = [[-max(0, value[2]) for value in row] + [0] * len(idle) for row in values]
+
+        for ship, row, column in zip(idle, values, hungarian(cost)):
+            if column >= len(slots) or row[column][2] <= 0:
+                continue
+            route, slot = slots[column]
+            proposed.append((ship, route, slot, row[column]))
+
+    # Lock the agent's trading ships only to check and record the assignments, so that concurrent
+    # behaviour jobs can't assign the same slots.
+    assigned = {}
+    with transaction.atomic():
+        current = {}
+        occupied = defaultdict(int)
+        ships = Ship.objects.filter(agent=agent, behaviour="TRADE").select_for_update()
+        for pk, trade_route, cargo_units in ships.values_list("pk", "trade_route", "cargo_units"):
+            current[pk] = (trade_route, cargo_units)
+            if trade_route:
+                occupied[route_key(trade_route)] += 1
+
+        for ship, route, slot, (units, profit, rate) in sorted(proposed, key=lambda proposal: proposal[2]):
+            key = route_key(route)
+            if ship.pk not in current or current[ship.pk][0] or current[ship.pk][1] or occupied[key] > slot:
+                # The ship is no longer idle, or other ships have since taken the slot: replan next time.
+                continue
+            occupied[key] += 1
+            ship.trade_route = {
+                "trade_good": route["trade_good"],
+                "origin": route["origin"],
+                "destination": route["destination"],
+                "units": units,
+                "purchase_price": route["export"]["purchase_price"],
+                "expected_profit": round(profit),
+                "credits_per_hour": round(rate),
+                "assigned": datetime.now(timezone.utc).isoformat(),
+            }
+            Ship.objects.filter(pk=ship.pk).update(trade_route=ship.trade_route)
+            assigned[ship.pk] = ship.trade_route
+            LOGGER.info(f"{ship} assigned route {route['trade_good']} {route['origin']} -> {route['destination']} ({round(rate)} credits/hour)")
+
+    return assigned
@@ -6,6 +6,10 @@ urlpatterns = [
     path("agent/register/", views.AgentRegister.as_view(), name="agent_register"),
     path("agent/login/", views.AgentLogin.as_view(), name="agent_login"),
     path("agent/<str:symbol>/", views.AgentDetail.as_view(), name="agent_detail"),
+    path("map/", views.GalaxyMap.as_view(), name="galaxy_map"),
+    path("map/<int:z>/<int:x>/<int:y>.svg", views.GalaxyMapTile.as_view(), name="galaxy_map_tile"),
+    path("fleet/events/", views.FleetEvents.as_view(), name="fleet_events"),
+    path("ship/command/<str:job_id>/", views.ShipCommandStatus.as_view(), name="ship_command_status"),
     path("ship/<str:symbol>/", views.ShipDetail.as_view(), name="ship_detail"),
     path("ship/<str:symbol>/purchase-cargo/", views.ShipPurchaseCargo.as_view(), name="ship_purchase_cargo"),
     path("ship/<str:symbol>/navigate/", views.ShipNavigate.as_view(), name="ship_navigate"),
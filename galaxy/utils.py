@@ -1,16 +1,15 @@
 from ratelimit import limits, sleep_and_retry
 
+from galaxy.crawler import crawl
+from galaxy.fleet import sync_fleet
 from galaxy.models import (
     Agent,
     Contract,
-    ContractDeliverGood,
     Faction,
     FactionTrait,
-    Market,
     MarketTradeGood,
     Ship,
     ShipNav,
-    Shipyard,
     System,
     Waypoint,
     WaypointModifier,
@@ -100,6 +99,11 @@ def populate_system(client, system_symbol):
 
     print(f"Downloading waypoints for {system}")
     waypoints = client.list_waypoints(system.symbol)
+    save_waypoints(system, waypoints)
+
+
+def save_waypoints(system, waypoints):
+    """Create or update a system's waypoints from the passed-in list of waypoint data."""
     # Sort waypoints by symbol.
     waypoints = sorted(waypoints, key=lambda x: x["symbol"])
 
@@ -180,6 +184,7 @@ def set_agent(client):
     agent.starting_faction = starting_faction
     agent.credits = data["credits"]
     agent.ship_count = data["shipCount"]
+    agent.bearer_token = client.token
     if not agent.headquarters and Waypoint.objects.filter(symbol=data["headquarters"]).exists():
         agent.headquarters = Waypoint.objects.get(symbol=data["headquarters"])
 
@@ -190,18 +195,9 @@ def set_agent(client):
 @sleep_and_retry
 @limits(calls=30, period=60)
 def populate_ships(client):
-    ships = client.list_ships()
     agent_data = client.get_agent()
     agent = Agent.objects.get(account_id=agent_data["accountId"])
-
-    for data in ships:
-        if not Ship.objects.filter(symbol=data["symbol"]).exists():
-            ship = populate_ship(client, agent, data)
-            print(f"Created {ship}")
-        else:
-            ship = Ship.objects.get(symbol=data["symbol"])
-            ship.update(data)
-            print(f"Refreshed data for {ship}")
+    print(sync_fleet(agent, client))
 
 
 def populate_ship(client, agent, data):
@@ -247,65 +243,22 @@ def populate_contracts(client):
     agent = Agent.objects.get(account_id=agent_data["accountId"])
 
     for data in contracts:
-        if not Contract.objects.filter(contract_id=data["id"]).exists():
-            faction = Faction.objects.get(symbol=data["factionSymbol"])
-            contract = Contract.objects.create(
-                agent=agent,
-                contract_id=data["id"],
-                faction=faction,
-                type=data["type"],
-                terms_deadline=data["terms"]["deadline"],
-                terms_payment=data["terms"]["payment"],
-                accepted=data["accepted"],
-                fulfilled=data["fulfilled"],
-                expiration=data["expiration"],
-                deadline_to_accept=data["deadlineToAccept"],
-            )
-            for good in data["terms"]["deliver"]:
-                destination = Waypoint.objects.get(symbol=good["destinationSymbol"])
-                ContractDeliverGood.objects.create(
-                    contract=contract,
-                    symbol=good["tradeSymbol"],
-                    destination=destination,
-                    units_required=good["unitsRequired"],
-                    units_fulfilled=good["unitsFulfilled"],
-                )
-            print(f"{contract} created")
-        else:
-            contract = Contract.objects.get(contract_id=data["id"])
-            contract.accepted = data["accepted"]
-            contract.fulfilled = data["fulfilled"]
-            contract.save()
-            for good in data["deliver"]["deliver"]:
-                deliver_good = ContractDeliverGood.objects.get(contract=contract, symbol=good["tradeSymbol"])
-                deliver_good.units_fulfilled = good["unitsFulfilled"]
-                deliver_good.save()
-            print(f"{contract} updated")
-
+        contract, created = Contract.from_data(agent, data)
+        if not contract:
+            continue
+        print(f"{contract} {'created' if created else 'updated'}")
 
-@sleep_and_retry
-@limits(calls=30, period=60)
-def populate_markets(client):
-    """Populate markets"""
-    market_waypoints = Waypoint.objects.filter(traits__in=WaypointTrait.objects.filter(symbol="MARKETPLACE"))
 
-    for wp in market_waypoints:
-        data = client.get_market(wp.symbol)
-        market, created = Market.objects.get_or_create(waypoint=wp)
-        market.update(data)
-        print(f"Updated market {market}")
+def populate_markets(client, system_symbol: str = None):
+    """Populate markets (in the nominated system, or the whole galaxy)."""
+    job = crawl(client, "MARKET", system_symbol)
+    print(f"Updated markets: {job}")
 
 
-@sleep_and_retry
-@limits(calls=30, period=60)
-def populate_shipyards(client):
-    shipyard_waypoints = Waypoint.objects.filter(traits__in=WaypointTrait.objects.filter(symbol="SHIPYARD"))
-
-    for wp in shipyard_waypoints:
-        data = client.get_shipyard(wp.symbol)
-        shipyard, created = Shipyard.objects.get_or_create(waypoint=wp)
-        shipyard.update(data)
-        print(f"Updated shipyard {shipyard}")
+def populate_shipyards(client, system_symbol: str = None):
+    """Populate shipyards (in the nominated system, or the whole galaxy)."""
+    job = crawl(client, "SHIPYARD", system_symbol)
+    print(f"Updated shipyards: {job}")
 
 
 def get_trade_pairs(system_symbol: str):
@@ -1,13 +1,27 @@
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 from django.contrib import messages
 from django.contrib.auth import get_user_model, login
 from django.contrib.auth.decorators import login_required
-from django.http import Http404, HttpResponseRedirect, HttpResponse
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseForbidden,
+    HttpResponseRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.urls import reverse
 from django.utils.decorators import method_decorator
 from django.utils.translation import gettext as _
 from django.views.generic import TemplateView, DetailView, View
+from django_rq.queues import get_queue
+from rq.job import JobStatus
 
 from spacetraders import Client
+from .events import event_stream
+from .tiles import TILE_SIZE, get_tile
 from .models import (
     Faction,
     Agent,
@@ -79,6 +93,7 @@ class AgentLogin(View):
         agent.starting_faction = starting_faction
         agent.credits = data["credits"]
         agent.ship_count = data["shipCount"]
+        agent.bearer_token = token
         agent.save()
 
         User = get_user_model()
@@ -119,23 +134,62 @@ class SystemDetail(DetailView):
         system = self.get_object()
         context["page_title"] = f"System: {system}"
         context["system_symbol"] = system.symbol
-        waypoints = Waypoint.objects.filter(system=system)
-        star = waypoints.filter(type="GAS_GIANT").first()
+        # Evaluate the system waypoints once, and derive the map bounds and centre from that list.
+        waypoints = list(Waypoint.objects.filter(system=system).select_related("orbits"))
+        star = next((wp for wp in waypoints if wp.type == "GAS_GIANT"), None)
 
-        context["centrex"] = star.x
-        context["centrey"] = star.y
+        context["centrex"] = star.x if star else 0
+        context["centrey"] = star.y if star else 0
         context["waypoints"] = waypoints
-        context["minx"] = min([wp.x for wp in waypoints]) - 5
-        context["miny"] = min([wp.y for wp in waypoints]) - 5
-        context["width"] = max([wp.x for wp in waypoints]) + abs(context["minx"]) + 5
-        context["height"] = max([wp.y for wp in waypoints]) + abs(context["miny"]) + 5
-        context["ships"] = Ship.objects.filter(nav__waypoint__system=system)
-        context["markets"] = Market.objects.filter(waypoint__system=system)
+        # The map SVG fragment is cached, keyed on the most recent waypoint modification.
+        context["waypoints_modified"] = max([wp.modified for wp in waypoints]).timestamp() if waypoints else 0
+        if waypoints:
+            context["minx"] = min([wp.x for wp in waypoints]) - 5
+            context["miny"] = min([wp.y for wp in waypoints]) - 5
+            context["width"] = max([wp.x for wp in waypoints]) + abs(context["minx"]) + 5
+            context["height"] = max([wp.y for wp in waypoints]) + abs(context["miny"]) + 5
+        context["ships"] = Ship.objects.filter(nav__waypoint__system=system).select_related("nav", "nav__waypoint")
+        context["markets"] = Market.objects.filter(waypoint__system=system).select_related("waypoint").prefetch_related(
+            "exports", "imports", "exchange"
+        )
         context["asteroid_waypoints"] = ["ASTEROID", "ASTEROID_BASE", "ASTEROID_FIELD", "ENGINEERED_ASTEROID"]
 
         return context
 
 
+@method_decorator(login_required, name="dispatch")
+class GalaxyMap(TemplateView):
+    template_name = "galaxy/galaxy_map.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["page_title"] = "Galaxy map"
+        context["tile_size"] = TILE_SIZE
+        context["max_zoom"] = settings.GALAXY_MAP_MAX_ZOOM
+        return context
+
+
+@method_decorator(login_required, name="dispatch")
+class GalaxyMapTile(View):
+    """GET-only view returning a single SVG galaxy map tile."""
+    http_method_names = ["get"]
+
+    def get(self, request, *args, **kwargs):
+        # A tile may be deleted by a concurrent invalidation after it is rendered: render it again.
+        for attempt in range(2):
+            path = get_tile(self.kwargs.get("z"), self.kwargs.get("x"), self.kwargs.get("y"))
+            if not path:
+                raise Http404(_("Invalid map tile"))
+            try:
+                file = open(path, "rb")
+            except FileNotFoundError:
+                continue
+            response = FileResponse(file, content_type="image/svg+xml")
+            response["Cache-Control"] = "private, max-age=300"
+            return response
+        raise Http404(_("Map tile unavailable"))
+
+
 @method_decorator(login_required, name="dispatch")
 class WaypointDetail(DetailView):
     model = Waypoint
@@ -165,21 +219,44 @@ class ShipDetail(DetailView):
         return context
 
 
+def enqueue_ship_command(request, ship, description, failure, func, *args):
+    """Queue a ship command to be carried out by a worker, and record it in the user session so that
+    the page can poll for the result. `failure` is the message to display if the command fails.
+    """
+    queue = get_queue("default")
+    job = queue.enqueue(func, *args)
+    commands = request.session.get("ship_commands", [])
+    commands.append({
+        "job_id": job.id,
+        "ship": ship.symbol,
+        "description": description,
+        "failure": failure,
+    })
+    request.session["ship_commands"] = commands
+    messages.info(request, f"{description} (queued)")
+    return job
+
+
 @method_decorator(login_required, name="dispatch")
 class ShipPurchaseCargo(View):
     """POST-only view to allow a ship to purchase cargo."""
     http_method_names = ["post"]
 
     def post(self, request, *args, **kargs):
-        client = Client()
         ship = Ship.objects.get(symbol=self.kwargs.get("symbol"))
+        client = ship.agent.get_client()
         trade_good = request.POST.get("symbol")
         units = int(request.POST.get("units"))
-        msg = ship.purchase_cargo(client, trade_good, units)
-        if not msg:
-            messages.warning(request, f"Purchase of {units} units of {trade_good} unsuccessful")
-        else:
-            messages.success(request, msg)
+        enqueue_ship_command(
+            request,
+            ship,
+            f"{ship} purchasing {units} units of {trade_good}",
+            f"Purchase of {units} units of {trade_good} unsuccessful",
+            ship.purchase_cargo,
+            client,
+            trade_good,
+            units,
+        )
         return HttpResponseRedirect(request.POST.get("next"))
 
 
@@ -189,15 +266,18 @@ class ShipNavigate(View):
     http_method_names = ["post"]
 
     def post(self, request, *args, **kargs):
-        client = Client()
         ship = Ship.objects.get(symbol=self.kwargs.get("symbol"))
+        client = ship.agent.get_client()
         waypoint = request.POST.get("waypoint")
-
-        msg = ship.navigate(client, waypoint)
-        if not msg:
-            messages.warning(request, f"{ship} navigation to {waypoint} unsuccessful")
-        else:
-            messages.success(request, msg)
+        enqueue_ship_command(
+            request,
+            ship,
+            f"{ship} navigating to {waypoint}",
+            f"{ship} navigation to {waypoint} unsuccessful",
+            ship.navigate,
+            client,
+            waypoint,
+        )
         return HttpResponseRedirect(request.POST.get("next"))
 
 
@@ -207,14 +287,52 @@ class ShipFlightMode(View):
     http_method_names = ["post"]
 
     def post(self, request, *args, **kargs):
-        client = Client()
         ship = Ship.objects.get(symbol=self.kwargs.get("symbol"))
+        client = ship.agent.get_client()
         mode = request.POST.get("mode")
-        msg = ship.flight_mode(client, mode)
-        messages.success(request, msg)
+        enqueue_ship_command(
+            request,
+            ship,
+            f"{ship} setting flight mode to {mode}",
+            f"{ship} flight mode change to {mode} unsuccessful",
+            ship.flight_mode,
+            client,
+            mode,
+        )
         return HttpResponseRedirect(request.POST.get("next"))
 
 
+@method_decorator(login_required, name="dispatch")
+class ShipCommandStatus(View):
+    """GET-only view returning the status of a queued ship command as JSON.
+    Completed commands are removed from the user session.
+    """
+    http_method_names = ["get"]
+
+    def get(self, request, *args, **kwargs):
+        job_id = self.kwargs.get("job_id")
+        commands = request.session.get("ship_commands", [])
+        command = next((c for c in commands if c["job_id"] == job_id), None)
+        if not command:
+            raise Http404(_("No queued command found matching the query"))
+
+        job = get_queue("default").fetch_job(job_id)
+        status = job.get_status() if job else "expired"
+        result = {"status": status, "ship": command["ship"], "description": command["description"], "message": None}
+
+        if status == JobStatus.FINISHED:
+            result["message"] = job.return_value() or command["failure"]
+            result["success"] = bool(job.return_value())
+        elif status in [JobStatus.FAILED, JobStatus.STOPPED, JobStatus.CANCELED, "expired"]:
+            result["message"] = command["failure"]
+            result["success"] = False
+        else:
+            return JsonResponse(result)
+
+        request.session["ship_commands"] = [c for c in commands if c["job_id"] != job_id]
+        return JsonResponse(result)
+
+
 @method_decorator(login_required, name="dispatch")
 class MarketDetail(DetailView):
     model = Market
@@ -246,3 +364,27 @@ class MarketDetail(DetailView):
         context["exchange_goods"] = MarketTradeGood.objects.filter(market=market, type="EXCHANGE")
         context["ships"] = Ship.objects.filter(nav__waypoint=market.waypoint)
         return context
+
+
+class FleetEvents(View):
+    """Stream live changes to the user's agent and ships as Server-Sent Events.
+    This view must be served through the ASGI application (`spacetraders.asgi`): under WSGI the
+    endless stream would be buffered, so it responds 204 (which tells EventSource not to reconnect).
+    """
+    http_method_names = ["get"]
+
+    async def get(self, request, *args, **kwargs):
+        if not settings.FLEET_EVENTS_ENABLED or not isinstance(request, ASGIRequest):
+            return HttpResponse(status=204)
+        user = await request.auser()
+        if not user.is_authenticated:
+            return HttpResponseForbidden()
+        try:
+            agent = await Agent.objects.aget(user=user)
+        except Agent.DoesNotExist:
+            raise Http404(_("No Agent found matching the query"))
+
+        response = StreamingHttpResponse(event_stream(agent.pk), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
@@ -1,4 +1,4 @@
-from .client import Client
+from .client import Client, get_client
 
 
-__all__ = ("Client",)
+__all__ = ("Client", "get_client")
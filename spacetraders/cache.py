@@ -0,0 +1,121 @@
+"""Read-through response caching for `Client` GET endpoints.
+
+Responses are stored in the Django cache (Redis), so they are shared between the web workers and
+the RQ workers. Each endpoint has its own lifetime, defined in `settings.API_CACHE_TTL`; endpoints not
+listed there are never cached. Concurrent identical requests are coalesced (single-flight): within a
+process via a per-key lock, and across processes via a short-lived lock key in the cache, so that
+only one request goes over the wire while the others wait on its result.
+"""
+from functools import wraps
+import hashlib
+import inspect
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Endpoints returning identical data for every agent. All other endpoints are cached per bearer token.
+SHARED_ENDPOINTS = ("get_faction", "get_system", "get_waypoint", "get_jump_gate", "get_construction_site")
+# Arguments derived from the others (a waypoint's system symbol is inferred from the waypoint
+# symbol), which are excluded from cache keys.
+DERIVED_ARGS = ("system_symbol",)
+# Maximum number of seconds that an in-flight request holds the fetch lock for a cache key.
+LOCK_TIMEOUT = 30
+POLL_INTERVAL = 0.05
+# Cache keys are hashed onto a fixed pool of in-process locks.
+LOCK_POOL_SIZE = 64
+
+_local_locks = [threading.RLock() for i in range(LOCK_POOL_SIZE)]
+
+
+def cache_key(client, endpoint: str, *args, **kwargs):
+    """Return the cache key for the response of `endpoint` called with the passed-in arguments.
+    Arguments are normalised against the endpoint's signature, so that positional and keyword
+    arguments (and omitted defaults) give the same key.
+    """
+    parts = ["api", endpoint]
+    if endpoint not in SHARED_ENDPOINTS:
+        token = client.headers.get("Authorization", "")
+        parts.append(hashlib.sha1(token.encode()).hexdigest()[0:16])
+    bound = inspect.signature(getattr(type(client), endpoint)).bind(client, *args, **kwargs)
+    bound.apply_defaults()
+    parts += [str(value) for name, value in list(bound.arguments.items())[1:] if name not in DERIVED_ARGS]
+    return ":".join(parts)
+
+
+def _local_lock(key: str):
+    return _local_locks[hash(key) % LOCK_POOL_SIZE]
+
+
+def _fetch(key: str, ttl: int, fetch):
+    """Fetch a response while holding the cross-process lock for `key`, or wait for another
+    process holding the lock to cache its response.
+    """
+    lock_key = f"{key}:lock"
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    locked = cache.add(lock_key, 1, LOCK_TIMEOUT)
+
+    while not locked:
+        time.sleep(POLL_INTERVAL)
+        data = cache.get(key)
+        if data is not None:
+            return data
+        if time.monotonic() > deadline:
+            break  # The lock holder has most likely died; fetch the response ourselves.
+        locked = cache.add(lock_key, 1, LOCK_TIMEOUT)
+
+    try:
+        data = fetch()
+        cache.set(key, data, ttl)
+        return data
+    finally:
+        if locked:
+            cache.delete(lock_key)
+
+
+def cached(func):
+    """Decorator for a `Client` GET method, caching its response under the method name."""
+    endpoint = func.__name__
+
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        ttl = settings.API_CACHE_TTL.get(endpoint)
+        if not ttl or not self.use_cache:
+            return func(self, *args, **kwargs)
+
+        key = cache_key(self, endpoint, *args, **kwargs)
+        data = cache.get(key)
+        if data is not None:
+            return data
+
+        with _local_lock(key):
+            # Another thread might have completed the request while we waited on the lock.
+            data = cache.get(key)
+            if data is not None:
+                return data
+            return _fetch(key, ttl, lambda: func(self, *args, **kwargs))
+
+    return wrapper
+
+
+def invalidates(*endpoints, agent: bool = False):
+    """Decorator for a `Client` method which changes game state. After the call, evict any cached
+    responses of the nominated endpoints for the same symbol (a ship symbol or contract ID).
+    If `agent` is True, also evict the cached agent details (i.e. the method changes credits).
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(self, symbol, *args, **kwargs):
+            try:
+                return func(self, symbol, *args, **kwargs)
+            finally:
+                for endpoint in endpoints:
+                    self.invalidate(endpoint, symbol)
+                if agent:
+                    self.invalidate("get_agent")
+
+        return wrapper
+
+    return decorator
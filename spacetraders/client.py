@@ -1,26 +1,56 @@
+import threading
+
 from django.conf import settings
-from ratelimit import limits, sleep_and_retry
+from django.core.cache import cache
 from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from .utils import infer_system_symbol
+from .cache import cache_key, cached, invalidates
+from .utils import RateLimiter, infer_system_symbol
 
 
 class Client(Session):
     """A Spacetraders HTTP client having methods named after each of the
-    API endpoints. Derives the authentication token from the `ACCOUNT_TOKEN`
-    environment variable.
+    API endpoints. Authenticates using the passed-in bearer token, else derives
+    the token from the `AGENT_TOKEN` or `ACCOUNT_TOKEN` environment variables.
+
+    Each client keeps a pool of persistent connections and throttles its own
+    requests to the API rate limit. Use `get_client` to obtain the shared
+    client for a token, rather than instantiating a new client per request.
+
+    Responses from GET endpoints are cached per `settings.API_CACHE_TTL`; set `use_cache` to False
+    on an instance to bypass the cache.
     """
 
-    def __init__(self, *args, **kwargs):
+    use_cache = True
+
+    def __init__(self, token: str = None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.headers["Accept"] = "application/json"
         self.headers["Content-Type"] = "application/json"
 
-        if settings.ACCOUNT_TOKEN:
-            self.headers["Authorization"] = f"Bearer {settings.ACCOUNT_TOKEN}"
-        # Override auth with the agent token, if present.
-        if settings.AGENT_TOKEN:
-            self.headers["Authorization"] = f"Bearer {settings.AGENT_TOKEN}"
+        self.token = token or settings.AGENT_TOKEN or settings.ACCOUNT_TOKEN
+        if self.token:
+            self.headers["Authorization"] = f"Bearer {self.token}"
+
+        self.limiter = RateLimiter(settings.API_RATE_LIMIT, settings.API_RATE_BURST)
+        # Back off and retry requests rejected by the server rate limiter. Once retries are exhausted,
+        # return the final 429 response (rather than raising), so that callers handle it as an error payload.
+        retry = Retry(total=3, status_forcelist=[429], allowed_methods=None, backoff_factor=1, raise_on_status=False)
+        self.mount("https://", HTTPAdapter(pool_maxsize=settings.API_POOL_SIZE, max_retries=retry))
+
+    def __reduce__(self):
+        # Clients are pickled into queued RQ jobs; unpickle them as the worker's pooled client for the same token.
+        return (get_client, (self.token,))
+
+    def request(self, *args, **kwargs):
+        self.limiter.wait()
+        return super().request(*args, **kwargs)
+
+    def invalidate(self, endpoint: str, *args, **kwargs):
+        """Evict the cached response of a GET endpoint called with the passed-in arguments."""
+        cache.delete(cache_key(self, endpoint, *args, **kwargs))
 
     def get_server_status(self):
         """Get server status."""
@@ -42,7 +72,8 @@ class Client(Session):
         resp.raise_for_status()
         data = resp.json()["data"]
 
-        self.headers["Authorization"] = f"Bearer {data['token']}"
+        self.token = data["token"]
+        self.headers["Authorization"] = f"Bearer {self.token}"
         if write_file:
             token = open("AGENT_TOKEN", "w")
             token.write(data["token"])
@@ -54,8 +85,6 @@ class Client(Session):
     # ----------------------------------------------------------------
     # Agents endpoints
     # ----------------------------------------------------------------
-    @sleep_and_retry
-    @limits(calls=30, period=60)
     def list_agents(self):
         """List all agent details."""
         params = {
@@ -75,6 +104,7 @@ class Client(Session):
 
         return agents
 
+    @cached
     def get_agent(self):
         """Get the player agent's details from the game server."""
         resp = self.get(f"{settings.API_URL}/my/agent")
@@ -84,8 +114,6 @@ class Client(Session):
     # ----------------------------------------------------------------
     # Contracts endpoints
     # ----------------------------------------------------------------
-    @sleep_and_retry
-    @limits(calls=30, period=60)
     def list_contracts(self):
         """List all player contracts."""
         params = {
@@ -105,18 +133,25 @@ class Client(Session):
 
         return contracts
 
+    @cached
     def get_contract(self, contract_id: str):
         """Get a single contract's details."""
         resp = self.get(f"{settings.API_URL}/my/contracts/{contract_id}")
         resp.raise_for_status()
         return resp.json()["data"]
 
+    @invalidates("get_contract", agent=True)
     def accept_contract(self, contract_id: str):
         """Accept a single contract."""
         resp = self.post(f"{settings.API_URL}/my/contracts/{contract_id}/accept")
-        resp.raise_for_status()
-        return resp.json()["data"]
+        try:
+            resp.raise_for_status()
+            return resp.json()["data"]
+        except:
+            # If accepting fails (e.g. the offer has expired), return the error payload.
+            return resp.json()
 
+    @invalidates("get_contract")
     def deliver_cargo_to_contract(self, contract_id: str, ship_symbol: str, trade_symbol: str, units: int):
         """Deliver cargo to a contract."""
         data = {
@@ -125,6 +160,7 @@ class Client(Session):
             "units": units,
         }
         resp = self.post(f"{settings.API_URL}/my/contracts/{contract_id}/deliver", json=data)
+        self.invalidate("get_ship", ship_symbol)
         try:
             resp.raise_for_status()
             return resp.json()["data"]
@@ -132,9 +168,10 @@ class Client(Session):
             # If the transaction fails, return the error payload.
             return resp.json()
 
+    @invalidates("get_contract", agent=True)
     def fulfill_contract(self, contract_id: str):
         """Fulfill a contract."""
-        resp = self.post(f"{settings.API_URL}/my/contracts/{contract_id}/accept")
+        resp = self.post(f"{settings.API_URL}/my/contracts/{contract_id}/fulfill")
         try:
             resp.raise_for_status()
             return resp.json()["data"]
@@ -145,8 +182,6 @@ class Client(Session):
     # ----------------------------------------------------------------
     # Factions endpoints
     # ----------------------------------------------------------------
-    @sleep_and_retry
-    @limits(calls=30, period=60)
     def list_factions(self):
         """List all faction details."""
         params = {
@@ -166,6 +201,7 @@ class Client(Session):
 
         return factions
 
+    @cached
     def get_faction(self, symbol: str):
         """Fetch a single factions's details."""
         resp = self.get(f"{settings.API_URL}/factions/{symbol}")
@@ -175,8 +211,6 @@ class Client(Session):
     # ----------------------------------------------------------------
     # Fleet endpoints
     # ----------------------------------------------------------------
-    @sleep_and_retry
-    @limits(calls=30, period=60)
     def list_ships(self):
         """List all of the ships under the player's ownership."""
         params = {
@@ -190,9 +224,11 @@ class Client(Session):
             resp = self.get(f"{settings.API_URL}/my/ships", params=params)
             resp.raise_for_status()
             data = resp.json()["data"]
-            if data:
-                ships += data
-                params["page"] += 1
+            ships += data
+            params["page"] += 1
+            # A short page is the last page; don't request another (empty) one.
+            if len(data) < params["limit"]:
+                break
 
         return ships
 
@@ -204,6 +240,7 @@ class Client(Session):
         }
 
         resp = self.post(f"{settings.API_URL}/my/ships", json=data)
+        self.invalidate("get_agent")
         try:
             resp.raise_for_status()
             return resp.json()["data"]
@@ -211,51 +248,78 @@ class Client(Session):
             # If the transaction fails, return the error payload.
             return resp.json()
 
+    @cached
     def get_ship(self, symbol: str):
         """Get the details of a single ship under the player's ownership."""
         resp = self.get(f"{settings.API_URL}/my/ships/{symbol}")
         resp.raise_for_status()
         return resp.json()["data"]
 
+    @invalidates("get_ship")
     def orbit_ship(self, symbol: str):
         """Attempt to move a ship into orbit."""
         resp = self.post(f"{settings.API_URL}/my/ships/{symbol}/orbit")
         resp.raise_for_status()
         return resp.json()["data"]
 
+    @cached
     def get_ship_cooldown(self, symbol: str):
         """Get the details of a ship's reactor cooldown."""
         resp = self.get(f"{settings.API_URL}/my/ships/{symbol}/cooldown")
         resp.raise_for_status()
         return resp.json()["data"]
 
+    @invalidates("get_ship")
     def dock_ship(self, symbol: str):
         """Attempt to dock a ship at the current location."""
         resp = self.post(f"{settings.API_URL}/my/ships/{symbol}/dock")
         resp.raise_for_status()
         return resp.json()["data"]
 
+    @invalidates("get_ship", "get_ship_cooldown")
     def extract_resources(self, symbol: str):
         """Extract resources from a waypoint into a ship."""
         resp = self.post(f"{settings.API_URL}/my/ships/{symbol}/extract")
-        resp.raise_for_status()
-        return resp.json()["data"]
+        try:
+            resp.raise_for_status()
+            return resp.json()["data"]
+        except:
+            # If the extraction fails (e.g. the ship is in cooldown), return the error payload.
+            return resp.json()
 
+    @invalidates("get_ship", "get_ship_cooldown")
     def siphon_resources(self, symbol: str):
         """Siphon gas resources from a waypoint."""
         resp = self.post(f"{settings.API_URL}/my/ships/{symbol}/siphon")
         resp.raise_for_status()
         return resp.json()["data"]
 
+    @invalidates("get_ship", "get_ship_cooldown")
+    def create_survey(self, symbol: str):
+        """Survey the ship's current waypoint for resource deposits."""
+        resp = self.post(f"{settings.API_URL}/my/ships/{symbol}/survey")
+        try:
+            resp.raise_for_status()
+            return resp.json()["data"]
+        except:
+            # If the survey fails, return the error payload.
+            return resp.json()
+
+    @invalidates("get_ship", "get_ship_cooldown")
     def extract_resources_with_survey(self, symbol: str, survey: dict):
-        """Extract resources from a waypoint into a ship."""
+        """Extract resources from a waypoint into a ship, targeting a survey."""
         data = {
             "survey": survey,
         }
         resp = self.post(f"{settings.API_URL}/my/ships/{symbol}/extract/survey", json=data)
-        resp.raise_for_status()
-        return resp.json()["data"]
+        try:
+            resp.raise_for_status()
+            return resp.json()["data"]
+        except:
+            # If the extraction fails (e.g. the survey has expired or is exhausted), return the error payload.
+            return resp.json()
 
+    @invalidates("get_ship")
     def jettison_cargo(self, symbol: str, cargo_symbol: str, units: int):
         """Jettison the given cargo type from a ship."""
         data = {
@@ -266,6 +330,24 @@ class Client(Session):
         resp.raise_for_status()
         return resp.json()["data"]
 
+    @invalidates("get_ship")
+    def transfer_cargo(self, symbol: str, trade_symbol: str, units: int, ship_symbol: str):
+        """Transfer cargo from a ship to another ship at the same waypoint."""
+        data = {
+            "tradeSymbol": trade_symbol,
+            "units": units,
+            "shipSymbol": ship_symbol,
+        }
+        resp = self.post(f"{settings.API_URL}/my/ships/{symbol}/transfer", json=data)
+        self.invalidate("get_ship", ship_symbol)
+        try:
+            resp.raise_for_status()
+            return resp.json()["data"]
+        except:
+            # If the transfer fails, return the error payload.
+            return resp.json()
+
+    @invalidates("get_ship")
     def ship_flight_mode(self, symbol: str, flight_mode: str):
         """Set the flight mode for this ship."""
         if flight_mode not in ["DRIFT", "STEALTH", "CRUISE", "BURN"]:
@@ -278,6 +360,7 @@ class Client(Session):
         resp.raise_for_status()
         return resp.json()["data"]
 
+    @invalidates("get_ship")
     def navigate_ship(self, symbol: str, waypoint: str):
         """Attempt to navigate ship to the nominated waypoint."""
         data = {
@@ -291,6 +374,7 @@ class Client(Session):
             # If the destination is out of range, return the error payload.
             return resp.json()
 
+    @invalidates("get_ship", agent=True)
     def refuel_ship(self, symbol: str, units: int = None, from_cargo: bool = False):
         """Refuel this ship from the local market. If not specifed, refuel to the maximum
         fuel capacity.
@@ -307,6 +391,7 @@ class Client(Session):
             # If the transaction fails, return the error payload.
             return resp.json()
 
+    @invalidates("get_ship", agent=True)
     def sell_cargo(self, symbol: str, trade_good: str, units: int):
         """Sell cargo for a given ship to a marketplace."""
         data = {
@@ -317,11 +402,15 @@ class Client(Session):
         resp = self.post(f"{settings.API_URL}/my/ships/{symbol}/sell", json=data)
         try:
             resp.raise_for_status()
-            return resp.json()["data"]
+            data = resp.json()["data"]
+            # Trading moves the market's prices and supply, so evict any cached market response.
+            self.invalidate("get_market", data["transaction"]["waypointSymbol"])
+            return data
         except:
             # If the transaction fails, return the error payload.
             return resp.json()
 
+    @invalidates("get_ship", agent=True)
     def purchase_cargo(self, symbol: str, trade_good: str, units: int):
         """Purchase cargo for a given ship from a marketplace."""
         data = {
@@ -332,7 +421,10 @@ class Client(Session):
         resp = self.post(f"{settings.API_URL}/my/ships/{symbol}/purchase", json=data)
         try:
             resp.raise_for_status()
-            return resp.json()["data"]
+            data = resp.json()["data"]
+            # Trading moves the market's prices and supply, so evict any cached market response.
+            self.invalidate("get_market", data["transaction"]["waypointSymbol"])
+            return data
         except:
             # If the transaction fails, return the error payload.
             return resp.json()
@@ -349,35 +441,37 @@ class Client(Session):
     # ----------------------------------------------------------------
     # Systems endpoints
     # ----------------------------------------------------------------
-    @sleep_and_retry
-    @limits(calls=30, period=60)
     def list_systems(self):
         """List all system details"""
-        params = {
-            "limit": 20,
-            "page": 1,
-        }
+        page = 1
         systems = []
         data = True
 
         while data:
-            resp = self.get(f"{settings.API_URL}/systems", params=params)
-            resp.raise_for_status()
-            data = resp.json()["data"]
+            data = self.list_systems_page(page)["data"]
             if data:
                 systems += data
-                params["page"] += 1
+                page += 1
 
         return systems
 
+    def list_systems_page(self, page: int, limit: int = 20):
+        """Get a single page of system details. Returns the full response (data and meta)."""
+        params = {
+            "limit": limit,
+            "page": page,
+        }
+        resp = self.get(f"{settings.API_URL}/systems", params=params)
+        resp.raise_for_status()
+        return resp.json()
+
+    @cached
     def get_system(self, symbol: str):
         """Get the details for a single system."""
         resp = self.get(f"{settings.API_URL}/systems/{symbol}")
         resp.raise_for_status()
         return resp.json()["data"]
 
-    @sleep_and_retry
-    @limits(calls=30, period=60)
     def list_waypoints(self, symbol: str, type: str = None, trait: str = None):
         """List all waypoints for the given system."""
         params = {
@@ -401,6 +495,7 @@ class Client(Session):
 
         return waypoints
 
+    @cached
     def get_waypoint(self, symbol: str, system_symbol: str = None):
         """Get a waypoint by symbol."""
         if not system_symbol:  # Infer the system symbol from the waypoint symbol.
@@ -409,6 +504,7 @@ class Client(Session):
         resp.raise_for_status()
         return resp.json()["data"]
 
+    @cached
     def get_market(self, symbol: str, system_symbol: str = None):
         """Get a market for a waypoint."""
         if not system_symbol:  # Infer the system symbol from the waypoint symbol.
@@ -417,6 +513,7 @@ class Client(Session):
         resp.raise_for_status()
         return resp.json()["data"]
 
+    @cached
     def get_shipyard(self, symbol: str, system_symbol: str = None):
         """Get a shipyard for a waypoint."""
         if not system_symbol:  # Infer the system symbol from the waypoint symbol.
@@ -425,6 +522,7 @@ class Client(Session):
         resp.raise_for_status()
         return resp.json()["data"]
 
+    @cached
     def get_jump_gate(self, symbol: str, system_symbol: str = None):
         """Get a jump gate for a waypoint."""
         if not system_symbol:  # Infer the system symbol from the waypoint symbol.
@@ -433,6 +531,7 @@ class Client(Session):
         resp.raise_for_status()
         return resp.json()["data"]
 
+    @cached
     def get_construction_site(self, symbol: str, system_symbol: str = None):
         """Get a construction site for a waypoint."""
         if not system_symbol:  # Infer the system symbol from the waypoint symbol.
@@ -442,3 +541,18 @@ class Client(Session):
         return resp.json()["data"]
 
     # TODO: supply_construction_site
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(token: str = None):
+    """Return the process-wide client for the passed-in bearer token (one per agent),
+    creating it on first use. If no token is passed, use the token from settings.
+    """
+    token = token or settings.AGENT_TOKEN or settings.ACCOUNT_TOKEN
+    with _clients_lock:
+        if token not in _clients:
+            _clients[token] = Client(token=token)
+        return _clients[token]
@@ -5,6 +5,7 @@ def template_context(request):
     """Extra context variables for every template."""
     context = {
         "LANGUAGE_CODE": settings.LANGUAGE_CODE,
+        "FLEET_EVENTS_ENABLED": settings.FLEET_EVENTS_ENABLED,
     }
     context.update(settings.STATIC_CONTEXT_VARS)
     return context
@@ -25,6 +25,10 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 API_URL = "https://api.spacetraders.io/v2"
 ACCOUNT_TOKEN = os.environ.get("ACCOUNT_TOKEN", None)
 AGENT_TOKEN = os.environ.get("AGENT_TOKEN", None)
+# Per-agent client request rate limit (requests per second, and maximum burst) and connection pool size.
+API_RATE_LIMIT = float(os.environ.get("API_RATE_LIMIT", 2))
+API_RATE_BURST = int(os.environ.get("API_RATE_BURST", 10))
+API_POOL_SIZE = int(os.environ.get("API_POOL_SIZE", 10))
 STATIC_CONTEXT_VARS = {}
 
 INSTALLED_APPS = [
@@ -182,3 +186,80 @@ RQ_QUEUES = {
         "DEFAULT_RESULT_TTL": 60,
     },
 }
+
+
+# Caching (shared between web and RQ worker processes)
+# NOTE: the cache should use a Redis database of its own, as it is cleared on server reset.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ.get("CACHE_URL", "redis://localhost:6379/1"),
+    },
+}
+# Lifetime (seconds) of cached API client responses, per GET endpoint. Endpoints not listed are not cached.
+# Static game data is kept for a long time; market and ship data for a few seconds only.
+API_CACHE_TTL = {
+    "get_faction": 60 * 60 * 24,
+    "get_system": 60 * 60 * 24,
+    "get_waypoint": 60 * 60,
+    "get_jump_gate": 60 * 60 * 24,
+    "get_construction_site": 60 * 5,
+    "get_shipyard": 60,
+    "get_market": 15,
+    "get_contract": 30,
+    "get_agent": 10,
+    "get_ship": 5,
+    "get_ship_cooldown": 5,
+}
+
+
+# Fleet synchronisation: seconds between scheduled `list_ships` syncs of each agent's fleet, and the
+# maximum age of a ship's local data for behaviours to use it rather than calling `get_ship`.
+FLEET_SYNC_INTERVAL = int(os.environ.get("FLEET_SYNC_INTERVAL", 60))
+FLEET_SNAPSHOT_MAX_AGE = int(os.environ.get("FLEET_SNAPSHOT_MAX_AGE", 90))
+
+
+# Number of concurrent requests made by the market/shipyard crawler. By default, enough to use the
+# rate limiter's whole burst at once without exceeding the connection pool.
+CRAWL_WORKERS = int(os.environ.get("CRAWL_WORKERS", min(API_RATE_BURST, API_POOL_SIZE)))
+
+
+# Mining sites: miners whose cooldowns expire within this many seconds of each other extract in one
+# batch, making up to MINING_WORKERS concurrent requests.
+MINING_BATCH_WINDOW = int(os.environ.get("MINING_BATCH_WINDOW", 10))
+MINING_WORKERS = int(os.environ.get("MINING_WORKERS", min(API_RATE_BURST, API_POOL_SIZE)))
+
+
+# Server reset watcher: seconds between checks of the server status, and the behaviour assigned to
+# each new ship (by registration role) once the database is bootstrapped after a reset.
+RESET_CHECK_INTERVAL = int(os.environ.get("RESET_CHECK_INTERVAL", 60 * 15))
+RESET_BEHAVIOURS = {
+    "COMMAND": "TRADE",
+    "SATELLITE": "PROBE",
+}
+
+
+# Market observation: seconds after which a market's prices are stale, and re-observed by a probe.
+PROBE_STALE_AFTER = int(os.environ.get("PROBE_STALE_AFTER", 60 * 15))
+
+
+# Trading: the minimum margin (as a fraction of the destination's sell price) at which a ship
+# continues to purchase its cargo.
+TRADE_MIN_MARGIN = float(os.environ.get("TRADE_MIN_MARGIN", 0.05))
+
+
+# Contracts: the minimum expected profit for a contract to be accepted, and seconds to wait before
+# retrying a contract step which could not be carried out (e.g. no contract could be negotiated).
+CONTRACT_MIN_PROFIT = int(os.environ.get("CONTRACT_MIN_PROFIT", 0))
+CONTRACT_RETRY_INTERVAL = int(os.environ.get("CONTRACT_RETRY_INTERVAL", 60 * 10))
+
+
+# Live fleet events (Redis pub/sub). The event stream requires the application to be served
+# through ASGI, so dashboards only subscribe to it when enabled.
+EVENTS_URL = os.environ.get("EVENTS_URL", "redis://localhost:6379/0")
+FLEET_EVENTS_ENABLED = os.environ.get("FLEET_EVENTS_ENABLED", False) == "True"
+
+
+# Galaxy map tiles
+GALAXY_TILE_ROOT = os.environ.get("GALAXY_TILE_ROOT", os.path.join(BASE_DIR, "tiles"))
+GALAXY_MAP_MAX_ZOOM = 8
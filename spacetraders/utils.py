@@ -1,5 +1,7 @@
 from collections import defaultdict
 from datetime import datetime, timezone
+import threading
+import time
 
 
 def sleep_until(arrival: datetime, buffer: int = 1):
@@ -18,6 +20,31 @@ def infer_system_symbol(waypoint_symbol):
     return "-".join(waypoint_symbol.split("-")[0:-1])
 
 
+class RateLimiter:
+    """Thread-safe token bucket, allowing bursts of up to `burst` calls and
+    refilling at `rate` calls per second.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """Block until a call is permitted by the rate limit."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Reserve a token; if the bucket is in deficit, wait until it refills.
+            self.tokens -= 1
+            pause = -self.tokens / self.rate if self.tokens < 0 else 0
+        if pause:
+            time.sleep(pause)
+
+
 def get_graph(paths):
     graph = defaultdict(set)
     for start, finish in paths: